@@ -0,0 +1,424 @@
+"""
+Cache backends for fetched WODs.
+
+Every lambda container otherwise warms its own copy of the same handful of
+WODs, so a burst that scales out to N containers means N calls to the EBCF
+API. These backends let containers (or server processes) share what they
+fetched:
+
+``MemoryCache``
+    In-process, LRU bounded. Always the first tier.
+``SQLiteCache``
+    A local file; shared by processes on one host (or by invocations of one
+    container, across a code reload).
+``MemcachedCache``
+    A memcached server, spoken to over the text protocol with nothing but a
+    socket.
+
+``TieredCache`` stacks them: a miss in a faster tier checks the slower ones
+before anybody goes to the network, and a hit in a slower tier is copied up.
+
+``compress``/``decompress`` give values a one byte header and zlib anything
+over ``COMPRESS_THRESHOLD`` bytes; ``content_key`` names a value by a hash of
+its content so identical values share one entry.
+
+Backends store opaque ``bytes`` with a time to live, and never raise: a
+cache that is down is just a cache that misses.
+``configure`` builds the stack from a spec string such as
+``memory,sqlite:/tmp/ebcf-cache.sqlite3,memcached:127.0.0.1:11211``.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+ENTRY_OVERHEAD_BYTES = 120
+"""Rough per-entry cost of the dict slot, tuple and bytes headers."""
+
+COMPRESS_THRESHOLD = 256
+"""Values shorter than this are stored as is; zlib doesn't pay for itself."""
+_RAW = b'='
+_ZLIB = b'z'
+
+
+def compress(value: bytes, threshold: int = COMPRESS_THRESHOLD) -> bytes:
+    """Frame ``value`` for storage, zlib compressed if that makes it smaller."""
+    if len(value) >= threshold:
+        packed = zlib.compress(value, 6)
+        if len(packed) < len(value):
+            return _ZLIB + packed
+    return _RAW + value
+
+
+def decompress(blob: bytes) -> bytes:
+    """
+    :raises ValueError: if ``blob`` was not made by `compress`
+    """
+    header, body = blob[:1], blob[1:]
+    if header == _RAW:
+        return body
+    if header == _ZLIB:
+        try:
+            return zlib.decompress(body)
+        except zlib.error as e:
+            raise ValueError('Corrupt cache value: %s' % e)
+    raise ValueError('Unknown cache value header %r' % header)
+
+
+def content_key(prefix: str, content: bytes) -> str:
+    """Key for ``content`` that is the same wherever the same content shows up."""
+    return prefix + hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class CacheBackend(object):
+    """Interface every cache tier implements."""
+    name = 'cache'
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        """:returns: the value under ``key`` and the seconds it has left (None if unknown), or None"""
+        entry = self._get_entry(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        """Store ``value`` under ``key`` for ``ttl`` seconds."""
+        self.sets += 1
+        self._set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Forget everything this process can see in the cache."""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {'backend': self.name, 'hits': self.hits, 'misses': self.misses, 'sets': self.sets}
+
+    def _get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """
+    LRU cache bounded by the bytes its keys and values take up, so the
+    memory it may use doesn't depend on how big entries happen to be.
+    """
+    name = 'memory'
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+
+    @staticmethod
+    def _size(key: str, value: bytes) -> int:
+        return len(key) + len(value) + ENTRY_OVERHEAD_BYTES
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= self._size(key, entry[1])
+
+    def _get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            remaining = entry[0] - time.monotonic()
+            if remaining <= 0:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], remaining
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        size = self._size(key, value)
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._pop(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return dict(super().stats(), entries=len(self._entries), bytes=self.bytes,
+                    max_bytes=self.max_bytes, evictions=self.evictions)
+
+
+class SQLiteCache(CacheBackend):
+    name = 'sqlite'
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache '
+            '(key TEXT PRIMARY KEY, expires REAL NOT NULL, value BLOB NOT NULL)')
+
+    def _get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT value, expires FROM cache WHERE key = ? AND expires > ?', (key, now)).fetchone()
+        except sqlite3.Error:
+            LOG.exception('sqlite cache get failed')
+            return None
+        return (bytes(row[0]), row[1] - now) if row else None
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        try:
+            with self._lock:
+                self._conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                                   (key, time.time() + ttl, sqlite3.Binary(value)))
+        except sqlite3.Error:
+            LOG.exception('sqlite cache set failed')
+
+    def _execute(self, what: str, sql: str, params: tuple = ()) -> None:
+        try:
+            with self._lock:
+                self._conn.execute(sql, params)
+        except sqlite3.Error:
+            LOG.exception('sqlite cache %s failed', what)
+
+    def delete(self, key: str) -> None:
+        self._execute('delete', 'DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self) -> None:
+        self._execute('clear', 'DELETE FROM cache')
+
+    def purge_expired(self) -> None:
+        self._execute('purge', 'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+
+
+class MemcachedCache(CacheBackend):
+    """
+    Minimal memcached client (text protocol, one connection). Keys are
+    namespaced so ``clear`` can abandon this process's view of the cache by
+    switching namespace instead of flushing a server other things may use.
+    Each value's flags hold when it expires (unix seconds), which ``get``
+    can't otherwise tell.
+    """
+    name = 'memcached'
+    MAX_TTL = 30 * 24 * 3600
+    """memcached reads larger expiry values as unix timestamps."""
+
+    def __init__(self, host: str, port: int = 11211, timeout: float = 0.2, namespace: str = 'ebcf'):
+        super().__init__()
+        self.address = (host, port)
+        self.timeout = timeout
+        self.namespace = namespace
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._buf = b''
+        self.errors = 0
+
+    def _key(self, key: str) -> bytes:
+        full = '{}:{}:{}'.format(self.namespace, self._generation, key)
+        if len(full) > 250 or any(c.isspace() for c in full):
+            raise ValueError('Invalid memcached key: %r' % full)
+        return full.encode('ascii')
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            self._sock = socket.create_connection(self.address, timeout=self.timeout)
+            self._buf = b''
+        return self._sock
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._buf = b''
+
+    def _readline(self) -> bytes:
+        while b'\r\n' not in self._buf:
+            chunk = self._sock.recv(65536)
+            if not chunk:
+                raise ConnectionError('memcached closed the connection')
+            self._buf += chunk
+        line, _, self._buf = self._buf.partition(b'\r\n')
+        return line
+
+    def _readexact(self, n: int) -> bytes:
+        while len(self._buf) < n:
+            chunk = self._sock.recv(65536)
+            if not chunk:
+                raise ConnectionError('memcached closed the connection')
+            self._buf += chunk
+        data, self._buf = self._buf[:n], self._buf[n:]
+        return data
+
+    def _command(self, func):
+        with self._lock:
+            try:
+                self._connect()
+                return func()
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                LOG.warning('memcached %s:%d error: %s', self.address[0], self.address[1], e)
+                self._disconnect()
+                return None
+
+    def _get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        def get():
+            self._sock.sendall(b'get ' + self._key(key) + b'\r\n')
+            entry = None
+            while True:
+                line = self._readline()
+                if line == b'END':
+                    return entry
+                if not line.startswith(b'VALUE '):
+                    raise ValueError('unexpected memcached reply %r' % line)
+                _, _, flags, size = line.split()[:4]
+                value = self._readexact(int(size) + 2)[:-2]
+                expires = int(flags)
+                entry = value, (expires - time.time() if expires else None)
+        return self._command(get)
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        def set_():
+            exptime = max(1, min(int(ttl), self.MAX_TTL))
+            expires = min(int(time.time()) + exptime, 2 ** 32 - 1)
+            self._sock.sendall(b'set %s %d %d %d\r\n%s\r\n' % (
+                self._key(key), expires, exptime, len(value), value))
+            reply = self._readline()
+            if reply != b'STORED':
+                raise ValueError('unexpected memcached reply %r' % reply)
+        self._command(set_)
+
+    def delete(self, key: str) -> None:
+        def delete():
+            self._sock.sendall(b'delete ' + self._key(key) + b'\r\n')
+            self._readline()
+        self._command(delete)
+
+    def clear(self) -> None:
+        self._generation += 1
+
+    def stats(self) -> dict:
+        return dict(super().stats(), errors=self.errors)
+
+
+class TieredCache(CacheBackend):
+    """
+    Looks in each tier in order. A hit in a lower tier is copied into the
+    tiers above it for as long as it has left there (``backfill_ttl``
+    seconds if the tier can't tell); writes go to every tier.
+    """
+    name = 'tiered'
+
+    def __init__(self, tiers: Sequence[CacheBackend], backfill_ttl: float = 60):
+        super().__init__()
+        self.tiers: List[CacheBackend] = list(tiers)
+        self.backfill_ttl = backfill_ttl
+
+    def _get_entry(self, key: str) -> Optional[Tuple[bytes, Optional[float]]]:
+        for i, tier in enumerate(self.tiers):
+            entry = tier.get_entry(key)
+            if entry is not None:
+                value, remaining = entry
+                ttl = remaining if remaining is not None else self.backfill_ttl
+                if ttl > 0:
+                    for upper in self.tiers[:i]:
+                        upper.set(key, value, ttl)
+                return entry
+        return None
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        for tier in self.tiers:
+            tier.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def clear(self) -> None:
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> dict:
+        return dict(super().stats(), tiers=[tier.stats() for tier in self.tiers])
+
+
+def configure(spec: str) -> CacheBackend:
+    """
+    Build a cache from a comma separated list of tiers, fastest first:
+    ``memory[:<max bytes>]``, ``sqlite:<path>`` or
+    ``memcached:<host>[:<port>]``.
+
+    This runs at import, so a tier that is malformed or can't be opened is
+    skipped with a warning rather than raising; with no tiers left it is a
+    `MemoryCache`.
+    """
+    tiers = []
+    for item in (part.strip() for part in spec.split(',')):
+        if not item:
+            continue
+        try:
+            tiers.append(_tier(item))
+        except (ValueError, OSError, sqlite3.Error) as e:
+            LOG.warning('Skipping cache tier %r: %s', item, e)
+    if not tiers:
+        LOG.warning('No usable cache tiers in %r, caching in memory', spec)
+        return MemoryCache(DEFAULT_MAX_BYTES)
+    return tiers[0] if len(tiers) == 1 else TieredCache(tiers)
+
+
+def _tier(item: str) -> CacheBackend:
+    kind, _, arg = item.partition(':')
+    if kind == 'memory':
+        return MemoryCache(int(arg) if arg else DEFAULT_MAX_BYTES)
+    if kind == 'sqlite':
+        return SQLiteCache(arg)
+    if kind == 'memcached':
+        host, _, port = arg.partition(':')
+        return MemcachedCache(host, int(port) if port else 11211)
+    raise ValueError('unknown kind of cache')
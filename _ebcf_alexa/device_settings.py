@@ -0,0 +1,142 @@
+"""
+Per-device time zone, from the Alexa device settings API.
+
+"Today" depends on where the member is, not where the gym is. Every Alexa
+request carries ``context.System.apiEndpoint``, an ``apiAccessToken`` and the
+device id, which is enough to ask::
+
+    GET {apiEndpoint}/v2/devices/{deviceId}/settings/System.timeZone
+    Authorization: Bearer {apiAccessToken}
+
+and get back a JSON string like ``"America/New_York"``. The token only goes
+to `incoming_types.ALEXA_API_ORIGINS`; any other endpoint means no zone.
+Devices rarely move, so answers are cached per device for ``TTL_SECONDS``
+and a request for a known device costs a dict lookup. Concurrent lookups for the same device
+share one call. If the lookup fails (no permission, timeout, unknown zone)
+the device falls back to `env.TZ`, and that is remembered for
+``FAILURE_TTL_SECONDS`` so a broken endpoint doesn't slow every request down.
+"""
+from collections import OrderedDict
+from datetime import tzinfo
+import json
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.error import URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from pytz import timezone, UnknownTimeZoneError
+
+from . import env, incoming_types
+from .singleflight import SingleFlight
+
+LOG = logging.getLogger(__name__)
+
+TTL_SECONDS = env.setting('EBCF_DEVICE_TZ_TTL_HOURS', 24.0) * 60 * 60
+FAILURE_TTL_SECONDS = 10 * 60
+TIMEOUT_SECONDS = env.setting('EBCF_DEVICE_SETTINGS_TIMEOUT', 0.5)
+MAX_DEVICES = 4096
+
+
+def time_zone_url(api_endpoint: str, device_id: str) -> str:
+    return '{}/v2/devices/{}/settings/System.timeZone'.format(api_endpoint.rstrip('/'), quote(device_id, safe=''))
+
+
+def fetch_time_zone(api_endpoint: str, device_id: str, token: str) -> Optional[tzinfo]:
+    """
+    Ask the settings API for a device's time zone.
+
+    :returns: the zone, or None if it couldn't be had, or ``api_endpoint``
+        isn't Alexa's
+    """
+    if not incoming_types.is_alexa_api_endpoint(api_endpoint):
+        LOG.warning('Not asking %r for a time zone: not an Alexa API endpoint', api_endpoint)
+        return None
+    request = Request(time_zone_url(api_endpoint, device_id), headers={
+        'Authorization': 'Bearer ' + token,
+        'Accept': 'application/json',
+    })
+    try:
+        with urlopen(request, timeout=TIMEOUT_SECONDS) as response:
+            name = json.load(response)
+        return timezone(name)
+    except (URLError, OSError, ValueError, UnknownTimeZoneError, AttributeError) as e:
+        # HTTPError is a URLError; a non-string body makes pytz raise AttributeError
+        LOG.warning('No time zone for device: %s', e)
+        return None
+
+
+class TimeZones(object):
+    """Device id -> time zone, cached, with one lookup per device at a time."""
+
+    def __init__(self, ttl: float = TTL_SECONDS, failure_ttl: float = FAILURE_TTL_SECONDS,
+                 max_devices: int = MAX_DEVICES):
+        self._lock = threading.Lock()
+        self._ttl = ttl
+        self._failure_ttl = failure_ttl
+        self._max_devices = max_devices
+        self._zones: 'OrderedDict[str, Tuple[Optional[tzinfo], float]]' = OrderedDict()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._zones.clear()
+            self.hits = self.misses = self.failures = 0
+
+    def get(self, api_endpoint: str, device_id: str, token: str) -> Optional[tzinfo]:
+        """
+        :returns: the device's time zone, or None to use the default
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._zones.get(device_id)
+            if cached is not None and cached[1] > now:
+                self._zones.move_to_end(device_id)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+        zone, _ = self._flights.do(device_id, self._refresh, api_endpoint, device_id, token)
+        return zone
+
+    def _refresh(self, api_endpoint: str, device_id: str, token: str) -> Optional[tzinfo]:
+        zone = fetch_time_zone(api_endpoint, device_id, token)
+        with self._lock:
+            if zone is None:
+                self.failures += 1
+            self._zones[device_id] = (zone, time.monotonic() + (self._ttl if zone is not None else self._failure_ttl))
+            self._zones.move_to_end(device_id)
+            while len(self._zones) > self._max_devices:
+                self._zones.popitem(last=False)
+        return zone
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'devices': len(self._zones), 'hits': self.hits, 'misses': self.misses,
+                    'failures': self.failures, 'lookups': self._flights.calls}
+
+
+TIME_ZONES = TimeZones()
+
+
+def event_time_zone(event) -> Optional[tzinfo]:
+    """
+    The time zone of the device an `incoming_types.LambdaEvent` came from,
+    or None if the event doesn't say enough to look it up.
+    """
+    context = event.context
+    if context is None:
+        return None
+    try:
+        system = context.system
+        device_id = system.device.device_id
+    except KeyError:
+        return None
+    api_endpoint, token = system.api_endpoint, system.api_access_token
+    if not (api_endpoint and token and device_id):
+        return None
+    return TIME_ZONES.get(api_endpoint, device_id, token)
@@ -1,15 +1,86 @@
+import contextlib
 import datetime
+import logging
+import os
+import threading
+from typing import Callable, Iterator, Mapping, Optional, TypeVar
 from pytz import utc as UTC, timezone
 
+LOG = logging.getLogger(__name__)
+T = TypeVar('T')
+
 TZ = timezone('US/Pacific')
+"""The gym's time zone, and "local" for requests from devices whose own we don't know."""
+
+def setting(name: str, default: T, parse: Callable[[str], T] = float,
+            environ: Mapping[str, str] = os.environ) -> T:
+    """
+    ``parse`` the environment variable ``name``, or ``default`` if it is
+    unset. Most settings are read at import, so a malformed one logs a
+    warning and falls back to ``default`` rather than breaking the cold start.
+    """
+    value = environ.get(name)
+    if value is None:
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        LOG.warning('Bad %s=%r, using %r', name, value, default)
+        return default
+
+
+def positive(value: str) -> float:
+    """`setting` parser for a number that must be over 0."""
+    number = float(value)
+    if not number > 0:
+        raise ValueError('must be positive')
+    return number
+
+
+_frozen_now: Optional[datetime.datetime] = None
+_request = threading.local()
 
 
 def now() -> datetime.datetime:
+    if _frozen_now is not None:
+        return _frozen_now
     return datetime.datetime.now(tz=UTC)
 
 
+def freeze(at: Optional[datetime.datetime]) -> None:
+    """Make `now` return ``at`` (None to unfreeze), e.g. to replay recorded events."""
+    global _frozen_now
+    _frozen_now = at.astimezone(UTC) if at is not None else None
+
+
+def tz() -> datetime.tzinfo:
+    """The time zone of the request being handled on this thread; see `local_timezone`."""
+    resolve = getattr(_request, 'resolve', None)
+    if resolve is not None:
+        _request.resolve = None
+        _request.tz = resolve()
+    return getattr(_request, 'tz', None) or TZ
+
+
+@contextlib.contextmanager
+def local_timezone(zone: Optional[datetime.tzinfo] = None,
+                   resolve: Optional[Callable[[], Optional[datetime.tzinfo]]] = None) -> Iterator[None]:
+    """
+    Make `localnow` and `localdate` use ``zone`` (None for `TZ`) on this
+    thread. Or, given ``resolve``, use whatever it returns, calling it the
+    first time the zone is needed: a request that never asks what day it is
+    doesn't pay for looking the zone up.
+    """
+    previous = getattr(_request, 'tz', None), getattr(_request, 'resolve', None)
+    _request.tz, _request.resolve = zone, resolve
+    try:
+        yield
+    finally:
+        _request.tz, _request.resolve = previous
+
+
 def localnow() -> datetime.datetime:
-    return now().astimezone(TZ)
+    return now().astimezone(tz())
 
 
 def date() -> datetime.date:
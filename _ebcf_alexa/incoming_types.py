@@ -1,15 +1,69 @@
 """
 Incoming lambda request objectifying
+
+Every object in here is a thin, ``__slots__``-based view over the raw event
+dictionary that Lambda hands us. Nested sections are only turned into objects
+the first time somebody reads them, so the parts of an event the handler never
+touches (most of ``context``, unrelated ``sessionAttributes``, etc.) cost
+nothing beyond the ``json.loads`` Lambda already did for us.
 """
 import logging
 from typing import Dict, Optional, Type
-from enum import Enum, auto
+from enum import Enum
+from urllib.parse import urlsplit
 
 LOG = logging.getLogger(__name__)
 SUPPORTED_SCHEMA_VERSION = '1.0'
 
 
+ALEXA_API_ORIGINS = frozenset({
+    'https://api.amazonalexa.com',
+    'https://api.eu.amazonalexa.com',
+    'https://api.fe.amazonalexa.com',
+})
+"""The only places an event's ``apiAccessToken`` is sent. Events POSTed to
+`server` aren't authenticated, so their ``apiEndpoint`` could be anybody's."""
+
+
+class InvalidApplicationId(ValueError):
+    """Raised for an event meant for some other skill: the caller's mistake, not ours."""
+
+
+def is_alexa_api_endpoint(url: str) -> bool:
+    """Whether ``url`` is on one of `ALEXA_API_ORIGINS`."""
+    parts = urlsplit(url)
+    return '{}://{}'.format(parts.scheme, parts.netloc).lower() in ALEXA_API_ORIGINS
+
+
+class _lazy(object):
+    """
+    Descriptor that builds an attribute on first access and stores it in the
+    instance slot of the same name prefixed with an underscore. Classes using
+    it must declare that slot in their ``__slots__``.
+    """
+    __slots__ = ('func', 'slot')
+
+    def __init__(self, func):
+        self.func = func
+        self.slot = '_' + func.__name__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.func(obj)
+            setattr(obj, self.slot, value)
+            return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
+
 class _RequestApplication(object):
+    __slots__ = ('application_id',)
+
     application_id: str
     """A string representing the appliation ID for your skill."""
 
@@ -18,6 +72,8 @@ class _RequestApplication(object):
 
 
 class _RequestUser(object):
+    __slots__ = ('user_id',)
+
     user_id: str
     """
     A string that represents a unique identifier for the user who made the request. The length of this identifier
@@ -28,111 +84,105 @@ class _RequestUser(object):
         self.user_id = u['userId']
 
 
-class _SessionAttributes(object):
-    """
-    Attributes are just a map that we can put data into. We use it to carry
-    info between lambda function invocations when we need to reprompt for a
-    mis-understood intent slot.
-    """
-
-    def __init__(self, a: dict):
-        self.intents = [
-            Intent(i) for i in a.get('intents', [])
-        ]
-
-
-class _RequestSession(object):
-    """Standard request types (LaunchRequest, IntentRequest, and SessionEndedRequest) include the session object."""
-
-    new: bool
-    """
-    A boolean value indicating whether this is a new session.
-    Returns true for a new session or false for an existing session.
-    """
-
-    session_id: str
-    """A string that represents a unique identifier per a user’s active session."""
+class _RequestContextSystem(object):
+    class Device(object):
+        __slots__ = ('_raw',)
 
-    attributes: Optional[Dict[str, dict]] = None
-    """A map of key-value pairs. The attributes map is empty for requests where a
-    new session has started with the property new set to true."""
+        def __init__(self, d: dict):
+            self._raw = d
 
-    application: _RequestApplication
-    """An object containing an application ID.
-    This is used to verify that the request was intended for your service.
+        @property
+        def device_id(self) -> Optional[str]:
+            return self._raw.get('deviceId')
 
-    This information is also available in the context.System.application property."""
+        @property
+        def supported_interfaces(self) -> Dict[str, Dict]:
+            return self._raw.get('supportedInterfaces', {})
 
-    user: _RequestUser
-    """An object that describes the user making the request."""
+    __slots__ = ('_raw', '_application', '_user', '_device')
 
     def __init__(self, s: dict):
-        """
-        :param s: session as dictionary
-        """
-        self.new = s['new']
-        self.session_id = s['sessionId']
-        self.attributes = s.get('attributes')
-        self.application = _RequestApplication(s['application'])
-        self.user = _RequestUser(s['user'])
+        self._raw = s
 
+    @_lazy
+    def application(self) -> _RequestApplication:
+        return _RequestApplication(self._raw['application'])
 
-class _RequestContextSystem(object):
-    class Device(object):
-        device_id: Optional[str]
-        supported_interfaces: Dict[str, Dict]
+    @_lazy
+    def user(self) -> _RequestUser:
+        return _RequestUser(self._raw['user'])
 
-        def __init__(self, d: dict):
-            self.device_id = d.get('deviceId')
-            self.supported_interfaces = d.get('supportedInterfaces', {})
+    @_lazy
+    def device(self) -> Device:
+        return self.Device(self._raw['device'])
 
-    application: _RequestApplication
-    user: _RequestUser
-    device: Device
-    api_endpoint: Optional[dict] = None
+    @property
+    def api_endpoint(self) -> Optional[str]:
+        return self._raw.get('apiEndpoint')
 
-    def __init__(self, s: dict):
-        self.application = _RequestApplication(s['application'])
-        self.user = _RequestUser(s['user'])
-        self.device = self.Device(s['device'])
-        self.api_endpoint = s.get('apiEndpoint')
+    @property
+    def api_access_token(self) -> Optional[str]:
+        """Bearer token for calling Alexa APIs, e.g. device settings, on this request's behalf."""
+        return self._raw.get('apiAccessToken')
 
 
 class _RequestContext(object):
     class AudioPlayer(object):
-        token: Optional[str] = None
-        offset_ms: Optional[int] = None
-        activity: str
+        __slots__ = ('_raw',)
 
         def __init__(self, p: dict):
-            self.token = p.get('token')
-            self.offset_ms = p.get('offsetInMilliseconds')
-            self.activity = p.get('playerActivity')
+            self._raw = p
+
+        @property
+        def token(self) -> Optional[str]:
+            return self._raw.get('token')
 
-    system: _RequestContextSystem
-    audio_player: AudioPlayer
+        @property
+        def offset_ms(self) -> Optional[int]:
+            return self._raw.get('offsetInMilliseconds')
+
+        @property
+        def activity(self) -> Optional[str]:
+            return self._raw.get('playerActivity')
+
+    __slots__ = ('_raw', '_system', '_audio_player')
 
     def __init__(self, c: dict):
-        self.system = _RequestContextSystem(c['System'])
+        self._raw = c
+
+    @_lazy
+    def system(self) -> _RequestContextSystem:
+        return _RequestContextSystem(self._raw['System'])
 
+    @_lazy
+    def audio_player(self) -> AudioPlayer:
         # FireTV requests dont seem to have AudioPlayer
         # But Original Echo and Echo Show Do.
-        self.audio_player = self.AudioPlayer(c.get('AudioPlayer', {}))
+        return self.AudioPlayer(self._raw.get('AudioPlayer', {}))
 
 
 class _BaseAlexaRequest(object):
     """
     Base class for all Alexa Request Types
     """
+    __slots__ = ('_raw',)
+
     type = None # type: RequestTypes
-    locale: str
-    request_id: str
-    timestamp: str
 
     def __init__(self, r: dict):
-        self.locale = r['locale']
-        self.request_id = r['requestId']
-        self.timestamp = r['timestamp']
+        self._raw = r
+
+    @property
+    def locale(self) -> str:
+        return self._raw['locale']
+
+    @property
+    def request_id(self) -> str:
+        return self._raw['requestId']
+
+    @property
+    def timestamp(self) -> str:
+        return self._raw['timestamp']
 
     def __repr__(self):
         return '<{} type={}>'.format(self.__class__.__name__, self.type)
@@ -141,17 +191,17 @@ class _BaseAlexaRequest(object):
 class _AlexaLaunchRequest(_BaseAlexaRequest):
     """A LaunchRequest is an object that represents that a user made a request to an Alexa skill,
     but did not provide a specific intent."""
-    def __init__(self, r: dict):
-        super().__init__(r)
-        self.type = RequestTypes.LaunchRequest
+    __slots__ = ()
 
 
 class Slot(object):
+    __slots__ = ('name', 'has_value', 'value', 'is_valid')
+
     name: str
     has_value: bool
     value: Optional[str]
 
-    is_valid: bool = False
+    is_valid: bool
     """This is a flag that indicates if the slot is valid and should be exported
     when calling `to_dict` on the `Intent`.
     """
@@ -160,6 +210,7 @@ class Slot(object):
         self.name = s['name']
         self.has_value = 'value' in s
         self.value = s.get('value')
+        self.is_valid = False
 
     def __repr__(self):
         return '<{} {}={}>'.format(self.__class__.__name__, self.name, self.value)
@@ -179,27 +230,33 @@ class Slot(object):
 
 
 class Intent(object):
-    name: str
+    __slots__ = ('_raw', 'name', '_slots', 'last_intent')
 
-    slots: Optional[Dict[str, Slot]] = None
-    """
-    A map of key-value pairs that further describes what the user meant based on a predefined intent schema.
-    The map can be empty.
-    """
+    name: str
 
-    last_intent: Optional = None
+    last_intent: Optional['Intent']
     """
     If this isn't the first time this intent has been called this session,
     the last session will be visible here.
     """
 
     def __init__(self, i: dict):
+        self._raw = i
         self.name = i['name']
-        if 'slots' in i:
-            self.slots = {
-                k: Slot(v)
-                for k, v in i['slots'].items()
-            }
+        self.last_intent = None
+
+    @_lazy
+    def slots(self) -> Optional[Dict[str, Slot]]:
+        """
+        A map of key-value pairs that further describes what the user meant based on a predefined intent schema.
+        The map can be empty.
+        """
+        if 'slots' not in self._raw:
+            return None
+        return {
+            k: Slot(v)
+            for k, v in self._raw['slots'].items()
+        }
 
     def __repr__(self):
         return '<{} "{}">'.format(self.__class__.__name__, self.name)
@@ -252,68 +309,88 @@ class _SessionAttributes(object):
     info between lambda function invocations when we need to reprompt for a
     mis-understood intent slot.
     """
-
-    intents: Dict[str, Intent]
-    """
-    A mapping of intent names to the intent data from the last time the
-    intent was invoked in the same session. Used to know what slot values
-    have been filled already when re-prompting for incomplete or incorrect
-    slot values.
-    """
+    __slots__ = ('_raw', '_intents')
 
     def __init__(self, a: dict):
-        self.intents = {
+        self._raw = a
+
+    @_lazy
+    def intents(self) -> Dict[str, Intent]:
+        """
+        A mapping of intent names to the intent data from the last time the
+        intent was invoked in the same session. Used to know what slot values
+        have been filled already when re-prompting for incomplete or incorrect
+        slot values.
+        """
+        return {
             k: Intent(v)
-            for k, v in a.get('intents', {}).items()
+            for k, v in self._raw.get('intents', {}).items()
         }
 
+    def get_intent(self, name: str) -> Optional[Intent]:
+        """
+        Look up a single saved intent without materializing the others.
+        """
+        try:
+            return self._intents.get(name)
+        except AttributeError:
+            raw = self._raw.get('intents', {}).get(name)
+            return Intent(raw) if raw is not None else None
+
 
 class _RequestSession(object):
     """Standard request types (LaunchRequest, IntentRequest, and SessionEndedRequest) include the session object."""
 
-    new: bool
-    """
-    A boolean value indicating whether this is a new session.
-    Returns true for a new session or false for an existing session.
-    """
+    __slots__ = ('_raw', '_attributes', '_application', '_user')
+
+    def __init__(self, s: dict):
+        """
+        :param s: session as dictionary
+        """
+        self._raw = s
 
-    session_id: str
-    """A string that represents a unique identifier per a user’s active session."""
+    @property
+    def new(self) -> bool:
+        """
+        A boolean value indicating whether this is a new session.
+        Returns true for a new session or false for an existing session.
+        """
+        return self._raw['new']
 
-    attributes: _SessionAttributes
-    """A map of key-value pairs. The attributes map is empty for requests where a
-    new session has started with the property new set to true."""
+    @property
+    def session_id(self) -> str:
+        """A string that represents a unique identifier per a user’s active session."""
+        return self._raw['sessionId']
 
-    application: _RequestApplication
-    """An object containing an application ID.
-    This is used to verify that the request was intended for your service.
+    @_lazy
+    def attributes(self) -> _SessionAttributes:
+        """A map of key-value pairs. The attributes map is empty for requests where a
+        new session has started with the property new set to true."""
+        return _SessionAttributes(self._raw.get('attributes', {}))
 
-    This information is also available in the context.System.application property."""
+    @_lazy
+    def application(self) -> _RequestApplication:
+        """An object containing an application ID.
+        This is used to verify that the request was intended for your service.
 
-    user: _RequestUser
-    """An object that describes the user making the request."""
+        This information is also available in the context.System.application property."""
+        return _RequestApplication(self._raw['application'])
 
-    def __init__(self, s: dict):
-        """
-        :param s: session as dictionary
-        """
-        self.new = s['new']
-        self.session_id = s['sessionId']
-        self.attributes = _SessionAttributes(s.get('attributes', {}))
-        self.application = _RequestApplication(s['application'])
-        self.user = _RequestUser(s['user'])
+    @_lazy
+    def user(self) -> _RequestUser:
+        """An object that describes the user making the request."""
+        return _RequestUser(self._raw['user'])
 
 
 class _AlexaIntentRequest(_BaseAlexaRequest):
     """An IntentRequest is an object that represents a request made to a skill based on what the user wants to do."""
 
-    intent: Intent
-    """An object that represents what the user wants"""
+    __slots__ = ('_intent',)
 
-    def __init__(self, r: dict):
-        super().__init__(r)
-        self.type = RequestTypes.IntentRequest
-        self.intent = Intent(r['intent'])
+    @_lazy
+    def intent(self) -> Intent:
+        """An object that represents what the user wants"""
+        return Intent(self._raw['intent'])
 
     def __repr__(self):
         return '<{} type={} intent={}>'.format(self.__class__.__name__, self.type, self.intent)
@@ -335,6 +412,8 @@ class _AlexaSessionEndedRequest(_BaseAlexaRequest):
     """
 
     class SessionEndError(object):
+        __slots__ = ('type', 'msg')
+
         type: str
         """
         a string indicating the type of error that occurred (INVALID_RESPONSE, DEVICE_COMMUNICATION_ERROR,
@@ -354,27 +433,31 @@ class _AlexaSessionEndedRequest(_BaseAlexaRequest):
         def __str__(self):
             return '{}: {}'.format(self.type, self.msg)
 
-    reason: str
-    """
-    Describes why the session ended. Possible values:
-
-    - USER_INITIATED: The user explicitly ended the session.
-    - ERROR: An error occurred that caused the session to end.
-    - EXCEEDED_MAX_REPROMPTS: The user either did not respond or responded with an utterance that did not match
-      any of the intents defined in your voice interface.
-    """
-
-    error: Optional[SessionEndError] = None
-    """An error object providing more information about the error that occurred."""
+    __slots__ = ()
 
     def __init__(self, r: dict):
         super().__init__(r)
-        self.type = RequestTypes.SessionEndedRequest
-        self.reason = r['reason']
-        if 'error' in r:
-            self.error = self.SessionEndError(r['error'])
         LOG.debug('SESSION_END reason: "%s", error: %s', self.reason, self.error)
 
+    @property
+    def reason(self) -> str:
+        """
+        Describes why the session ended. Possible values:
+
+        - USER_INITIATED: The user explicitly ended the session.
+        - ERROR: An error occurred that caused the session to end.
+        - EXCEEDED_MAX_REPROMPTS: The user either did not respond or responded with an utterance that did not match
+          any of the intents defined in your voice interface.
+        """
+        return self._raw['reason']
+
+    @property
+    def error(self) -> Optional[SessionEndError]:
+        """An error object providing more information about the error that occurred."""
+        if 'error' in self._raw:
+            return self.SessionEndError(self._raw['error'])
+        return None
+
 
 class RequestTypes(Enum):
     LaunchRequest = (_AlexaLaunchRequest,)
@@ -383,6 +466,7 @@ class RequestTypes(Enum):
 
     def __init__(self, cls_type: Type[_BaseAlexaRequest]):
         self.cls_type = cls_type
+        cls_type.type = self
 
     def __repr__(self):
         return '<%s.%s>' % (self.__class__.__name__, self.name)
@@ -396,11 +480,11 @@ def _build_alexa_request(request: dict) -> _BaseAlexaRequest:
 
 def _merge_attribute_slot_values(request: _BaseAlexaRequest,
                                  attributes: _SessionAttributes):
-    if request.type == RequestTypes.IntentRequest and \
-            request.intent.name in attributes.intents:
+    if request.type == RequestTypes.IntentRequest:
         req_intent: Intent = request.intent
-        old_intent: Intent = attributes.intents[req_intent.name]
-        req_intent.merge_intent(old_intent)
+        old_intent = attributes.get_intent(req_intent.name)
+        if old_intent is not None:
+            req_intent.merge_intent(old_intent)
 
 
 class LambdaEvent(object):
@@ -409,32 +493,42 @@ class LambdaEvent(object):
     The session object is included for all standard requests, but it is not included
     for AudioPlayer, VideoApp, or PlaybackController requests."""
 
+    __slots__ = ('_raw', 'version', '_session', '_context', '_request')
+
     version: str
     """The version specifier for the request with the value defined as: 1.0"""
 
-    session: Optional[_RequestSession] = None
-    """The session object provides additional context associated with the request."""
-
-    context: Optional[_RequestContext] = None
-    """
-    The context object provides your skill with information about the current state of the Alexa
-    service and device at the time the request is sent to your service.
-    This is included on all requests. For requests sent in the context of a session
-    (LaunchRequest and IntentRequest), the context object duplicates the user and
-    application information that is also available in the session."""
-
-    request: _BaseAlexaRequest
-    """A request object that provides the details of the user’s request.
-    There are several different request types available."""
-
     def __init__(self, e: dict):
+        self._raw = e
         self.version = e['version']
         LOG.debug('Request version: %s', self.version)
         assert self.version == SUPPORTED_SCHEMA_VERSION
-        if e['session']:
-            self.session = _RequestSession(e['session'])
-        if 'context' in e:
-            self.context = _RequestContext(e['context'])
-        self.request = _build_alexa_request(e['request'])
-        if not self.session.new:
-            _merge_attribute_slot_values(self.request, self.session.attributes)
+
+    @_lazy
+    def session(self) -> Optional[_RequestSession]:
+        """The session object provides additional context associated with the request."""
+        if self._raw.get('session'):
+            return _RequestSession(self._raw['session'])
+        return None
+
+    @_lazy
+    def context(self) -> Optional[_RequestContext]:
+        """
+        The context object provides your skill with information about the current state of the Alexa
+        service and device at the time the request is sent to your service.
+        This is included on all requests. For requests sent in the context of a session
+        (LaunchRequest and IntentRequest), the context object duplicates the user and
+        application information that is also available in the session."""
+        if 'context' in self._raw:
+            return _RequestContext(self._raw['context'])
+        return None
+
+    @_lazy
+    def request(self) -> _BaseAlexaRequest:
+        """A request object that provides the details of the user’s request.
+        There are several different request types available."""
+        request = _build_alexa_request(self._raw['request'])
+        session = self.session
+        if session is not None and not session.new:
+            _merge_attribute_slot_values(request, session.attributes)
+        return request
@@ -4,19 +4,27 @@ Interaction Model
 This module basically maps out the response tree for the skill.
 """
 from datetime import timedelta, datetime, date
-from typing import Union, Optional, Dict, Tuple
+from typing import Union, Optional, Dict, List, Tuple
 from textwrap import dedent
 from enum import Enum
 import logging
 from . import wods
 from . import speechlet
 from . import env
+from . import movement_index
+from . import progressive
+from . import query_mix
+from .slot_index import SlotIndex
 from .incoming_types import RequestTypes, LambdaEvent, Intent, Slot
 
 LOG = logging.getLogger(__name__)
-LOG.setLevel(logging.DEBUG)
 
 DEFAULT_QUERY_INTENT = 'DefaultQuery'
+WEEK_QUERY_INTENT = 'WeekQuery'
+LAST_DID_QUERY_INTENT = 'LastDidQuery'
+MOVEMENT_STATS_QUERY_INTENT = 'MovementStatsQuery'
+MOVEMENT_SLOT = 'Movement'
+PERIOD_SLOT = 'Period'
 REQUEST_SLOT = 'RequestType'
 RELATIVE_SLOT = 'RelativeTo'
 
@@ -66,6 +74,14 @@ class RequestTypeSlot(Enum):
         self.synonyms = synonyms
 
 
+_RELATIVE_TO_INDEX = SlotIndex((rel.spoken_name, rel) for rel in RelativeToSlot)
+_REQUEST_TYPE_INDEX = SlotIndex(
+    (synonym, (ebcfsec, spoken_word))
+    for ebcfsec in RequestTypeSlot
+    for synonym, spoken_word in ebcfsec.synonyms.items()
+)
+
+
 TEMPLATE_NO_THING = 'There {iswas} no {thing} {relative_to} {date}.'
 TEMPLATE_FOUND = '<p>The {thing} for {relative_to}, {date}</p>{content}'
 CARD_TITLE_TEMPLATE = '{thing} for {relative_to}, {date}'
@@ -125,39 +141,101 @@ def _build_wod_query_response(wod: Optional[wods.WOD],
     )
 
 
+def _busy_response() -> speechlet.SpeechletResponse:
+    return speechlet.SpeechletResponse(
+        output_speech=speechlet.PlainText(
+            'I\'m having trouble reaching the gym\'s website right now. '
+            'Please try again in a minute.'
+        ),
+        should_end=True
+    )
+
+
+QUERY_MIX = query_mix.QueryMix()
+"""(RelativeToSlot, RequestTypeSlot) asked per hour, for `prefetch_likely_queries`.
+Hours and dates are the gym's (`env.TZ`) whatever the asking device's zone,
+so they line up with what the keep-warm pings prefetch."""
+
+
 def wod_query(relative_to: RelativeToSlot=RelativeToSlot.TODAY,
               ebcf_slot_word: Optional[str]=None,
               request_type_slot: RequestTypeSlot=RequestTypeSlot.FULL) -> speechlet.SpeechletResponse:
+    gym_now = env.now().astimezone(env.TZ)
+    QUERY_MIX.record(gym_now.hour, (relative_to, request_type_slot))
+    QUERY_MIX.observed(((gym_now + relative_to.day_offset).date(), request_type_slot))
     wod_query_date = env.localnow()
     if relative_to != RelativeToSlot.TODAY:
         wod_query_date += relative_to.day_offset
-    wod = wods.get_wod(wod_query_date.date())
+    try:
+        with progressive.Progressive() as progress:
+            wod = wods.get_wod(wod_query_date.date(), on_miss=progress.start)
+    except wods.RateLimited:
+        return _busy_response()
     return _build_wod_query_response(
         wod, wod_query_date, relative_to, ebcf_slot_word, request_type_slot
     )
 
 
+def prefetch_likely_queries() -> int:
+    """
+    Fetch and render the WOD queries `QUERY_MIX` says are most likely in the
+    next hour or so, into the WOD and SSML caches, out of the background API
+    budget. Days `wods.PUBLISH_TIMES` doesn't expect out yet are skipped.
+    Failures are logged and otherwise ignored.
+
+    :returns: how many queries were predicted
+    """
+    now = env.now().astimezone(env.TZ)
+    predicted = QUERY_MIX.predict(now.hour)
+    for relative_to, request_type_slot in predicted:
+        wod_query_date = now + relative_to.day_offset
+        if wods.PUBLISH_TIMES.seconds_until(wod_query_date.date()):
+            LOG.debug('Not prefetching %s, not expected out yet', wod_query_date.date())
+            continue
+        QUERY_MIX.expect((wod_query_date.date(), request_type_slot))
+        try:
+            wod = wods.get_wod(wod_query_date.date(), background=True)
+            # renders exactly what the query will, filling the SSML cache
+            _build_wod_query_response(wod, wod_query_date, relative_to, None, request_type_slot)
+        except wods.RateLimited:
+            LOG.info('API budget used up, not prefetching %s %s', relative_to.name, request_type_slot.name)
+        except Exception:
+            LOG.exception('Failed to prefetch %s %s', relative_to.name, request_type_slot.name)
+    return len(predicted)
+
+
+def sync_movement_index() -> None:
+    """
+    Pull the movement index's whole history (``movement_index.HISTORY_DAYS``)
+    in out of the background API budget, so questions about it don't have to.
+    Containers nobody has asked a movement question in are left alone.
+    Failures are logged and otherwise ignored.
+    """
+    if movement_index.INDEX.synced_since is None:
+        return
+    try:
+        movement_index.INDEX.sync(background=True)
+    except wods.RateLimited:
+        LOG.info('API budget used up, not syncing the movement index')
+    except Exception:
+        LOG.exception('Failed to sync the movement index')
+
+
 def _get_relative_to_slot(slot: Slot) -> RelativeToSlot:
     LOG.debug('RelativeTo: %r', slot)
     if slot.has_value and slot.value:
-        test_val = slot.value.lower()
-        for rel in RelativeToSlot:
-            if test_val.startswith(rel.spoken_name):
-                slot.is_valid = True
-                slot.value = rel.spoken_name
-                return rel
+        rel = _RELATIVE_TO_INDEX.lookup(slot.value.lower())
+        if rel is not None:
+            slot.is_valid = True
+            slot.value = rel.spoken_name
+            return rel
     return RelativeToSlot.TODAY
 
 
-def _resolve_request_type_slot(slot: Slot) -> Tuple[RequestTypeSlot, Optional[str]]:
+def _resolve_request_type_slot(slot: Slot) -> Optional[Tuple[RequestTypeSlot, str]]:
     if slot.has_value and slot.value:
-        test_val = slot.value.lower()
-        for ebcfsec in RequestTypeSlot:
-            if test_val in ebcfsec.synonyms:
-                return ebcfsec, ebcfsec.synonyms[test_val]
-            for syn in ebcfsec.synonyms:
-                if test_val.startswith(syn):
-                    return ebcfsec, ebcfsec.synonyms[syn]
+        return _REQUEST_TYPE_INDEX.lookup(slot.value.lower())
+    return None
 
 
 def _get_request_type_slot(intent: Intent) -> Tuple[RequestTypeSlot, Optional[str]]:
@@ -221,6 +299,218 @@ def query_intent(intent: Intent) -> speechlet.SpeechletResponse:
     return wod_query(relative_to, word_used, request_type_slot)
 
 
+def _week_headline(wod: wods.WOD, request_type_slot: RequestTypeSlot) -> List[str]:
+    """First line of each requested section: enough to tell the days apart."""
+    lines = []
+    if request_type_slot != RequestTypeSlot.CONDITIONING and wod.strength_lines:
+        lines.append(wod.strength_lines[0])
+    if request_type_slot != RequestTypeSlot.STRENGTH and wod.conditioning_lines:
+        lines.append(wod.conditioning_lines[0])
+    return lines
+
+
+def _week_card_content(wod: wods.WOD, request_type_slot: RequestTypeSlot) -> str:
+    if request_type_slot == RequestTypeSlot.STRENGTH:
+        return wod.strength_pprint()
+    if request_type_slot == RequestTypeSlot.CONDITIONING:
+        return wod.conditioning_pprint()
+    return wod.pprint().strip()
+
+
+def _build_week_response(days: List[date], week: Dict[date, Optional[wods.WOD]], today: date,
+                         ebcf_slot_word: Optional[str],
+                         request_type_slot: RequestTypeSlot) -> speechlet.SpeechletResponse:
+    thing = ebcf_slot_word or request_type_slot.default_spoken_word
+    posted = [(day, week[day]) for day in days if week.get(day) is not None
+              and _week_headline(week[day], request_type_slot)]
+    not_yet = [day for day in days if day > today and week.get(day) is None]
+    week_of = _get_speech_date(days[0])
+    if not posted:
+        return speechlet.SpeechletResponse(
+            output_speech=speechlet.PlainText(
+                'There is no {} posted yet for the week of {}.'.format(thing, week_of)),
+            should_end=True
+        )
+
+    # one TTS pass over every day's headline
+    headlines = [_week_headline(wod, request_type_slot) for _, wod in posted]
+    spoken = iter(wods.tts_lines([line for lines in headlines for line in lines]))
+    ssml_chunks = ['<p>This week\'s {}.</p>'.format(thing)]
+    for (day, _), lines in zip(posted, headlines):
+        ssml_chunks.append('<s>{}: {}.</s>'.format(
+            day.strftime('%A'), ', then '.join(next(spoken) for _ in lines)))
+    if not_yet:
+        ssml_chunks.append('<s>{} {} not posted yet.</s>'.format(
+            not_yet[0].strftime('%A') if len(not_yet) == 1
+            else '{} through {}'.format(not_yet[0].strftime('%A'), not_yet[-1].strftime('%A')),
+            'is' if len(not_yet) == 1 else 'are'))
+    ssml_chunks.append('<s>The details are in your Alexa app.</s>')
+
+    card_content = '\n\n'.join(
+        '{}:\n{}'.format(_get_speech_date(day), _week_card_content(wod, request_type_slot))
+        for day, wod in posted)
+    return speechlet.SpeechletResponse(
+        output_speech=speechlet.SSML(''.join(ssml_chunks)),
+        card=speechlet.SimpleCard(
+            title='{} for the week of {}'.format(_titleify(thing), week_of),
+            content=card_content
+        ),
+        should_end=True
+    )
+
+
+def week_query(intent: Intent) -> speechlet.SpeechletResponse:
+    """
+    This week's (Monday to Sunday) programming, fetched with one API call:
+    a short spoken rundown of each day, and everything on the card.
+    """
+    request_type_slot, word_used = RequestTypeSlot.FULL, None
+    if intent.slots and REQUEST_SLOT in intent.slots:
+        resolved = _resolve_request_type_slot(intent.slots[REQUEST_SLOT])
+        if resolved is not None:
+            request_type_slot, word_used = resolved
+    today = env.localdate()
+    monday = today - timedelta(days=today.weekday())
+    days = [monday + timedelta(days=i) for i in range(7)]
+    try:
+        week = wods.get_wods(days)
+    except wods.RateLimited:
+        return _busy_response()
+    return _build_week_response(days, week, today, word_used, request_type_slot)
+
+
+def _prompt_missing_movement_slot(intent: Intent) -> speechlet.SpeechletResponse:
+    return speechlet.SpeechletResponse(
+        output_speech=speechlet.PlainText(
+            'Which movement? For example, ask me when we last did front squats.'),
+        should_end=False,
+        reprompt=speechlet.PlainText('Which movement?')
+    )
+
+
+def _days_ago(day: date, today: date) -> str:
+    ago = (today - day).days
+    if ago == 0:
+        return 'today'
+    if ago == 1:
+        return 'yesterday'
+    return 'on {}, {} days ago'.format(_get_speech_date(day), ago)
+
+
+def _build_last_did_response(movement: str, days: List[date], today: date,
+                             since: date) -> speechlet.SpeechletResponse:
+    if not days:
+        return speechlet.SpeechletResponse(
+            output_speech=speechlet.PlainText(
+                'I don\'t see {} in any workout since {}.'.format(movement, _get_speech_date(since))),
+            should_end=True
+        )
+    recent = days[-5:]
+    return speechlet.SpeechletResponse(
+        output_speech=speechlet.PlainText(
+            'We last did {} {}.'.format(movement, _days_ago(days[-1], today))),
+        card=speechlet.SimpleCard(
+            title=_titleify(movement),
+            content='Last {}:\n{}'.format(
+                'time' if len(recent) == 1 else '{} times'.format(len(recent)),
+                '\n'.join(_get_speech_date(day) for day in reversed(recent)))
+        ),
+        should_end=True
+    )
+
+
+def _synced_movement_index(today: date) -> Optional[movement_index.MovementIndex]:
+    """
+    The movement index, caught up with one small range query on the first
+    ask of the day. In a fresh container that's only the last
+    ``REQUEST_SYNC_DAYS``; the rest of the history is pulled in by
+    `sync_movement_index` in the background, and answers say how far back
+    they go. WODs fetched in between are indexed as they go by.
+
+    :returns: None if the API budget is used up and nothing is indexed yet
+    """
+    index = movement_index.INDEX
+    if index.synced_through != today:
+        try:
+            index.sync(today, background=False, days=movement_index.REQUEST_SYNC_DAYS)
+        except wods.RateLimited:
+            if not len(index):
+                return None
+    return index
+
+
+def _get_movement(intent: Intent) -> Optional[str]:
+    slot = intent.slots.get(MOVEMENT_SLOT) if intent.slots else None
+    if slot is None or not slot.has_value or not slot.value \
+            or not movement_index.query_term(slot.value):
+        return None
+    return slot.value.lower()
+
+
+def last_did_query(intent: Intent) -> speechlet.SpeechletResponse:
+    """
+    "When did we last do front squats?", answered from the movement index.
+    """
+    movement = _get_movement(intent)
+    if movement is None:
+        return _prompt_missing_movement_slot(intent)
+    today = env.localdate()
+    index = _synced_movement_index(today)
+    if index is None:
+        return _busy_response()
+    return _build_last_did_response(movement, index.dates(movement, on_or_before=today), today,
+                                    index.synced_since or today)
+
+
+_PERIOD_INDEX = SlotIndex((period, period) for period in movement_index.PERIODS)
+
+
+def _get_period(intent: Intent) -> str:
+    slot = intent.slots.get(PERIOD_SLOT) if intent.slots else None
+    if slot is not None and slot.has_value and slot.value:
+        # "this quarter", "the month", "year"
+        for word in slot.value.lower().split():
+            period = _PERIOD_INDEX.lookup(word)
+            if period is not None:
+                return period
+    return 'month'
+
+
+def _build_stats_response(movement: str, period: str, count: int, since: date,
+                          clipped: bool) -> speechlet.SpeechletResponse:
+    if count:
+        speech = 'We\'ve done {} {} {} this {}'.format(
+            movement, count, 'time' if count == 1 else 'times', period)
+    else:
+        speech = 'We haven\'t done {} this {}'.format(movement, period)
+    if clipped:
+        speech += ' that I know of, going back to {}'.format(_get_speech_date(since))
+    return speechlet.SpeechletResponse(
+        output_speech=speechlet.PlainText(speech + '.'),
+        should_end=True
+    )
+
+
+def movement_stats_query(intent: Intent) -> speechlet.SpeechletResponse:
+    """
+    "How many times did we deadlift this quarter?": a prefix-sum lookup in
+    the movement index's counts.
+    """
+    movement = _get_movement(intent)
+    if movement is None:
+        return _prompt_missing_movement_slot(intent)
+    period = _get_period(intent)
+    today = env.localdate()
+    index = _synced_movement_index(today)
+    if index is None:
+        return _busy_response()
+    since = movement_index.period_start(period, today)
+    clipped = index.synced_since is not None and index.synced_since > since
+    if clipped:
+        since = index.synced_since
+    return _build_stats_response(movement, period, index.count(movement, since, today), since, clipped)
+
+
 HELP_SSML = (
     '<speak>'
     '<s>Ok, Help.</s>'
@@ -274,6 +564,9 @@ def cancel_intent(intent: Intent) -> speechlet.SpeechletResponse:
 
 _INTENTS = {
     DEFAULT_QUERY_INTENT: query_intent,
+    WEEK_QUERY_INTENT: week_query,
+    LAST_DID_QUERY_INTENT: last_did_query,
+    MOVEMENT_STATS_QUERY_INTENT: movement_stats_query,
     'AMAZON.HelpIntent': help_intent,
     'AMAZON.CancelIntent': cancel_intent,
     'AMAZON.StopIntent': cancel_intent
@@ -0,0 +1,160 @@
+"""
+Logging setup for the skill.
+
+Everything is configured from the environment so it can be changed on the
+lambda function without a deploy:
+
+``EBCF_LOG_LEVEL``
+    Level of the root logger. Defaults to ``INFO``.
+``EBCF_LOG_LEVELS``
+    Per-module overrides, e.g. ``wods=DEBUG,interaction_model=WARNING``. Names
+    are relative to the ``_ebcf_alexa`` package unless they contain a dot.
+``EBCF_LOG_PAYLOAD_SAMPLE_RATE``
+    Fraction (0-1) of requests that dump whole payloads (the incoming event,
+    with its tokens and ids redacted, and EBCF API responses) at DEBUG.
+    Defaults to 0.
+``EBCF_LOG_PAYLOAD_MAX_CHARS``
+    Payload dumps are cut off after this many characters. Defaults to 2000.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+from typing import Any, Mapping, Optional
+
+LOG = logging.getLogger(__name__)
+_PACKAGE = __name__.rpartition('.')[0]
+
+DEFAULT_LEVEL = 'INFO'
+DEFAULT_PAYLOAD_MAX_CHARS = 2000
+
+_payload_sample_rate = 0.0
+_payload_max_chars = DEFAULT_PAYLOAD_MAX_CHARS
+_local = threading.local()
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(','):
+        name, sep, level = item.partition('=')
+        if not sep:
+            continue
+        name = name.strip()
+        if '.' not in name:
+            name = '{}.{}'.format(_PACKAGE, name)
+        levels[name] = level.strip().upper()
+    return levels
+
+
+def _level(name: str, default: Optional[str]) -> Optional[str]:
+    """``name`` if it is a logging level, else ``default`` (with a warning)."""
+    name = name.strip().upper()
+    if isinstance(logging.getLevelName(name), int):
+        return name
+    LOG.warning('Unknown log level %r, using %s', name, default)
+    return default
+
+
+def configure(environ: Mapping[str, str] = os.environ) -> None:
+    """
+    Apply logging levels and payload sampling settings from ``environ``.
+    Unknown levels are ignored rather than breaking the cold start.
+    Safe to call more than once.
+    """
+    global _payload_sample_rate, _payload_max_chars
+    logging.getLogger().setLevel(_level(environ.get('EBCF_LOG_LEVEL', DEFAULT_LEVEL), DEFAULT_LEVEL))
+    for name, level in _parse_levels(environ.get('EBCF_LOG_LEVELS', '')).items():
+        level = _level(level, None)
+        if level is not None:
+            logging.getLogger(name).setLevel(level)
+    try:
+        _payload_sample_rate = float(environ.get('EBCF_LOG_PAYLOAD_SAMPLE_RATE', 0))
+    except ValueError:
+        _payload_sample_rate = 0.0
+    try:
+        _payload_max_chars = int(environ.get('EBCF_LOG_PAYLOAD_MAX_CHARS', DEFAULT_PAYLOAD_MAX_CHARS))
+    except ValueError:
+        _payload_max_chars = DEFAULT_PAYLOAD_MAX_CHARS
+
+
+def begin_request() -> bool:
+    """
+    Decide whether the payloads of the current request get dumped. The decision
+    is made once per request so an event dump and its API responses come as a
+    set.
+    """
+    sampled = _payload_sample_rate > 0 and random.random() < _payload_sample_rate
+    _local.sampled = sampled
+    return sampled
+
+
+def payload_sampled(logger: logging.Logger) -> bool:
+    """True if the current request was sampled and ``logger`` would emit DEBUG."""
+    return getattr(_local, 'sampled', False) and logger.isEnabledFor(logging.DEBUG)
+
+
+class Truncated(object):
+    """
+    Wraps an object so its ``repr`` is only computed if a log record actually
+    gets formatted, and is cut off at ``max_chars``.
+    """
+    __slots__ = ('obj', 'max_chars')
+
+    def __init__(self, obj: Any, max_chars: Optional[int] = None):
+        self.obj = obj
+        self.max_chars = max_chars
+
+    def __str__(self):
+        max_chars = self.max_chars if self.max_chars is not None else _payload_max_chars
+        text = self.obj if isinstance(self.obj, str) else repr(self.obj)
+        if len(text) > max_chars:
+            return '{}...<{} more chars>'.format(text[:max_chars], len(text) - max_chars)
+        return text
+
+
+def redact_user_id(user_id: Optional[str]) -> Optional[str]:
+    """
+    Alexa user/device ids are long and identify a person. Keep the prefix so we
+    can tell what kind of id it is, and a short stable hash so requests from the
+    same user can still be correlated.
+    """
+    if not user_id:
+        return user_id
+    prefix, _, _ = user_id.rpartition('.')
+    digest = hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:10]
+    return '{}.~{}'.format(prefix, digest) if prefix else '~' + digest
+
+
+_SECRET_KEYS = frozenset(('apiAccessToken', 'accessToken', 'consentToken'))
+_ID_KEYS = frozenset(('userId', 'deviceId', 'personId'))
+
+
+def redact_event(obj: Any) -> Any:
+    """
+    A copy of an Alexa event safe to log: bearer tokens (``apiAccessToken``,
+    account linking ``accessToken``) are blanked and user, device and person
+    ids go through `redact_user_id`, wherever they are in the event.
+    """
+    if isinstance(obj, dict):
+        redacted = {}
+        for key, value in obj.items():
+            if key in _SECRET_KEYS and value:
+                redacted[key] = '<redacted>'
+            elif key in _ID_KEYS and isinstance(value, str):
+                redacted[key] = redact_user_id(value)
+            else:
+                redacted[key] = redact_event(value)
+        return redacted
+    if isinstance(obj, list):
+        return [redact_event(value) for value in obj]
+    return obj
+
+
+def log_request_summary(logger: logging.Logger, **fields) -> None:
+    """Emit one JSON line describing a request. ``None`` fields are dropped."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(
+            {k: v for k, v in fields.items() if v is not None},
+            sort_keys=True, separators=(',', ':'), default=str))
@@ -0,0 +1,148 @@
+"""
+Per-invocation timing spans and counters.
+
+Set ``EBCF_METRICS=1`` on the lambda function to turn this on. Each invocation
+then prints one record in CloudWatch's embedded metric format (EMF) to stdout,
+which CloudWatch turns into metrics without any API calls::
+
+    {"_aws": {"Timestamp": ..., "CloudWatchMetrics": [...]},
+     "Service": "ebcf-alexa", "lambda_handler": 12.1, "call_api": 9.7,
+     "wod_cache_miss": 1, ...}
+
+Span timings are in milliseconds and accumulate if a span runs more than once
+in an invocation. When disabled, ``begin`` does not create a record and every
+``span``/``timed``/``incr`` call reduces to a thread-local lookup.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+ENABLED = os.environ.get('EBCF_METRICS', '').lower() in ('1', 'true', 'yes')
+NAMESPACE = os.environ.get('EBCF_METRICS_NAMESPACE', 'EBCFAlexa')
+SERVICE = 'ebcf-alexa'
+
+_local = threading.local()
+
+
+class _Record(object):
+    __slots__ = ('timings', 'counters')
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + seconds * 1000
+
+    def incr(self, name: str, n: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+class _NoopSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span(object):
+    __slots__ = ('record', 'name', 'start')
+
+    def __init__(self, record: _Record, name: str):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.record.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def _current() -> Optional[_Record]:
+    return getattr(_local, 'record', None)
+
+
+def begin() -> None:
+    """Start collecting for a new invocation on this thread."""
+    _local.record = _Record() if ENABLED else None
+
+
+def span(name: str):
+    """Context manager timing the enclosed block as ``name``."""
+    record = _current()
+    if record is None:
+        return _NOOP_SPAN
+    return _Span(record, name)
+
+
+def timed(name: str) -> Callable:
+    """Decorator timing every call of the function as ``name``."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record = _current()
+            if record is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record.add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def incr(name: str, n: int = 1) -> None:
+    """Bump counter ``name`` for the current invocation."""
+    record = _current()
+    if record is not None:
+        record.incr(name, n)
+
+
+def _to_emf(record: _Record, properties: dict) -> dict:
+    metrics = [{'Name': name, 'Unit': 'Milliseconds'} for name in sorted(record.timings)]
+    metrics.extend({'Name': name, 'Unit': 'Count'} for name in sorted(record.counters))
+    doc = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Service']],
+                'Metrics': metrics,
+            }],
+        },
+        'Service': SERVICE,
+    }
+    doc.update(properties)
+    doc.update((name, round(ms, 3)) for name, ms in record.timings.items())
+    doc.update(record.counters)
+    return doc
+
+
+def emit(**properties) -> Optional[dict]:
+    """
+    Finish the current invocation and print its record as one EMF line.
+    ``properties`` are added to the record as (non-metric) context.
+
+    :returns: the record that was printed, or None if metrics are disabled
+    """
+    record = _current()
+    if record is None:
+        return None
+    _local.record = None
+    doc = _to_emf(record, {k: v for k, v in properties.items() if v is not None})
+    sys.stdout.write(json.dumps(doc, separators=(',', ':'), default=str) + '\n')
+    return doc
@@ -0,0 +1,346 @@
+"""
+Inverted index of movements over WOD history, for "when did we last do X".
+
+Each line of a WOD's strength and conditioning sections is tokenized into
+normalized words: lower-cased, gym abbreviations expanded (the same
+vocabulary `wods` teaches Alexa to pronounce: OH, DB, KB, HSPU, T2B, ...),
+plurals folded, and numbers, weights and rep-scheme words dropped. Every run
+of one to ``MAX_TERM_WORDS`` consecutive words is a term, so "15 Hang Power
+Cleans 115#/95#" is indexed under "clean", "power clean", "hang power clean"
+and so on. Each term maps to the sorted list of dates it was programmed.
+
+The index fills itself: every WOD `wods` parses or pulls out of the cache is
+added as it goes by, and `MovementIndex.sync` pulls a stretch of history in
+with one range query. Lookups are a dict get and a bisect. Alongside the
+date postings, `MovementCounts` keeps prefix sums per term so "how many times
+this quarter" is a subtraction::
+
+    $ python3 -m _ebcf_alexa.movement_index deadlift "front squat" --days 730
+"""
+from array import array
+from bisect import bisect_left, bisect_right, insort
+import argparse
+from datetime import date as Date, datetime, timedelta
+import logging
+import re
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from . import env, wods
+
+LOG = logging.getLogger(__name__)
+
+MAX_TERM_WORDS = 3
+HISTORY_DAYS = 180
+"""How far back `MovementIndex.sync` looks, from the background."""
+REQUEST_SYNC_DAYS = 14
+"""How far back a user's question may make it look, in a fresh container."""
+
+ABBREVIATIONS = {
+    'oh': 'overhead',
+    'ohs': 'overhead squat',
+    'db': 'dumbbell',
+    'kb': 'kettlebell',
+    'kbs': 'kettlebell swing',
+    'hspu': 'handstand push up',
+    't2b': 'toes to bar',
+    'ttb': 'toes to bar',
+    'c2b': 'chest to bar',
+    'du': 'double under',
+    'wb': 'wall ball',
+    'bj': 'box jump',
+    'sdhp': 'sumo deadlift high pull',
+    'dl': 'deadlift',
+    'rdl': 'romanian deadlift',
+    'ghd': 'ghd',
+}
+"""Spoken/written shorthand -> words. Values are already normalized."""
+
+_JOINED = {
+    'hand stand': 'handstand',
+    'dead lift': 'deadlift',
+    'pushup': 'push up',
+    'pullup': 'pull up',
+    'situp': 'sit up',
+}
+
+NOISE_WORDS = frozenset("""
+    a an and or of on the for with then in at to each every
+    x sets set reps rep rounds round time times minute minutes min mins sec secs second seconds
+    amrap emom emotm tabata cap rest even odd max heavy light build establish complex
+    m km cal cals lb lbs kg pood rx scaled male female men women
+""".split()) - {'to'}
+"""Words that are never part of a movement. 'to' is kept for "toes to bar"."""
+
+_TOKEN_RX = re.compile(r'[a-z0-9]+')
+_PLAIN_WORD_RX = re.compile(r'[a-z]+')
+
+
+def _singular(word: str) -> str:
+    if word.endswith(('ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if word.endswith('ss') or len(word) < 3 or not word.endswith('s'):
+        return word
+    return word[:-1]
+
+
+def normalize_words(text: str) -> List[Optional[str]]:
+    """
+    :returns: normalized words of ``text``, with None wherever something
+        that isn't part of a movement (a number, a weight, "rounds") was
+    """
+    text = text.lower().replace('-', ' ')
+    for joined, replacement in _JOINED.items():
+        text = text.replace(joined, replacement)
+    words: List[Optional[str]] = []
+    for token in _TOKEN_RX.findall(text):
+        token = _singular(token) if token not in ABBREVIATIONS else token
+        expanded = ABBREVIATIONS.get(token)
+        if expanded is not None:
+            words.extend(expanded.split())
+        elif token in NOISE_WORDS or not _PLAIN_WORD_RX.fullmatch(token):
+            words.append(None)
+        else:
+            words.append(token)
+    return words
+
+
+def line_terms(line: str) -> Iterable[str]:
+    """Every run of 1 to ``MAX_TERM_WORDS`` movement words in ``line``."""
+    run: List[str] = []
+    for word in normalize_words(line) + [None]:
+        if word is None:
+            for i in range(len(run)):
+                for n in range(1, min(MAX_TERM_WORDS, len(run) - i) + 1):
+                    yield ' '.join(run[i:i + n])
+            run = []
+        else:
+            run.append(word)
+
+
+def wod_terms(wod: wods.WOD) -> FrozenSet[str]:
+    terms = set()
+    for line in wod.strength_lines + wod.conditioning_lines:
+        terms.update(line_terms(line))
+    return frozenset(terms)
+
+
+def query_term(movement: str) -> str:
+    """Normalize what the user asked about the same way WOD text is."""
+    return ' '.join(w for w in normalize_words(movement) if w is not None)
+
+
+class MovementCounts(object):
+    """
+    How many days each term was programmed in any window of days, in O(1).
+
+    Days are offsets from the earliest day seen. For each term there is one
+    array of prefix sums, ``sums[i]`` being the number of days before offset
+    ``i`` that had the term, so a window's count is one subtraction. Arrays
+    only run up to the last day that changed them; past the end the count
+    stays at the last value. Indexing the newest day touches one element per
+    term; reindexing an older day shifts the tail of that term's array.
+    An older day than any seen rebases every array and ``_first`` together,
+    so updates and counts share one lock.
+    """
+    __slots__ = ('_first', '_sums', '_lock')
+
+    TYPECODE = 'H'
+    """Two bytes a day per term: good for 179 years of daily programming."""
+
+    def __init__(self):
+        self._first: Optional[int] = None
+        self._sums: Dict[str, array] = {}
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._first = None
+            self._sums.clear()
+
+    def _offset(self, day: Date) -> int:
+        ordinal = day.toordinal()
+        if self._first is None:
+            self._first = ordinal
+        elif ordinal < self._first:
+            pad = array(self.TYPECODE, [0]) * (self._first - ordinal)
+            for term, sums in self._sums.items():
+                self._sums[term] = pad + sums
+            self._first = ordinal
+        return ordinal - self._first
+
+    def _add(self, term: str, offset: int, delta: int) -> None:
+        sums = self._sums.get(term)
+        if sums is None:
+            sums = self._sums[term] = array(self.TYPECODE, [0])
+        if len(sums) < offset + 2:
+            sums.extend(array(self.TYPECODE, [sums[-1]]) * (offset + 2 - len(sums)))
+        for i in range(offset + 1, len(sums)):
+            sums[i] += delta
+
+    def update(self, day: Date, removed: Iterable[str], added: Iterable[str]) -> None:
+        """``day`` no longer has the ``removed`` terms, and now has the ``added`` ones."""
+        with self._lock:
+            offset = self._offset(day)
+            for term in removed:
+                self._add(term, offset, -1)
+            for term in added:
+                self._add(term, offset, 1)
+
+    def count(self, term: str, start: Date, end: Date) -> int:
+        """Days from ``start`` through ``end`` that had ``term``."""
+        with self._lock:
+            sums = self._sums.get(term)
+            if sums is None or end < start:
+                return 0
+            last = len(sums) - 1
+            lo = min(max(start.toordinal() - self._first, 0), last)
+            hi = min(max(end.toordinal() - self._first + 1, 0), last)
+            return sums[hi] - sums[lo]
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(len(sums) * sums.itemsize for sums in self._sums.values())
+
+
+class MovementIndex(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, List[Date]] = {}
+        self._indexed: Dict[Date, FrozenSet[str]] = {}
+        self.counts = MovementCounts()
+        self.synced_through: Optional[Date] = None
+        self.synced_since: Optional[Date] = None
+
+    def __len__(self) -> int:
+        return len(self._indexed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._indexed.clear()
+            self.counts.clear()
+            self.synced_through = self.synced_since = None
+
+    def add(self, wod: wods.WOD) -> None:
+        """Index ``wod``, replacing whatever was indexed for its day."""
+        if wod is None or wod.date is None:
+            return
+        terms = wod_terms(wod)
+        with self._lock:
+            old = self._indexed.get(wod.date, frozenset())
+            if old == terms:
+                return
+            removed, added = old - terms, terms - old
+            for term in removed:
+                postings = self._postings[term]
+                postings.remove(wod.date)
+                if not postings:
+                    del self._postings[term]
+            for term in added:
+                postings = self._postings.setdefault(term, [])
+                if not postings or postings[-1] < wod.date:
+                    postings.append(wod.date)  # the usual case: a newer day
+                else:
+                    insort(postings, wod.date)
+            self.counts.update(wod.date, removed, added)
+            self._indexed[wod.date] = terms
+
+    def count(self, movement: str, start: Date, end: Date) -> int:
+        """How many days from ``start`` through ``end`` had ``movement``."""
+        term = query_term(movement)
+        if len(term.split()) > MAX_TERM_WORDS:
+            # no prefix sums for terms this long; count the days `dates` pieces together
+            days = self.dates(movement, end)
+            return len(days) - bisect_left(days, start)
+        with self._lock:
+            return self.counts.count(term, start, end)
+
+    def dates(self, movement: str, on_or_before: Optional[Date] = None) -> List[Date]:
+        """Every indexed day ``movement`` was programmed (up to ``on_or_before``), oldest first."""
+        term = query_term(movement)
+        words = term.split()
+        with self._lock:
+            if len(words) <= MAX_TERM_WORDS:
+                days = list(self._postings.get(term, ()))
+            else:
+                # longer than any indexed term: days having every piece of it
+                found = None
+                for i in range(len(words) - MAX_TERM_WORDS + 1):
+                    piece = set(self._postings.get(' '.join(words[i:i + MAX_TERM_WORDS]), ()))
+                    found = piece if found is None else found & piece
+                days = sorted(found)
+        if on_or_before is not None:
+            del days[bisect_right(days, on_or_before):]
+        return days
+
+    def last(self, movement: str, on_or_before: Optional[Date] = None) -> Optional[Date]:
+        """The latest day ``movement`` was programmed, not after ``on_or_before``."""
+        days = self.dates(movement, on_or_before)
+        return days[-1] if days else None
+
+    def sync(self, through: Optional[Date] = None, background: bool = True,
+             days: int = HISTORY_DAYS) -> None:
+        """
+        Pull the days up to ``through`` (default: today) that the index may
+        have missed into it with one range query: ``days`` of them the first
+        time, and after that only those since the last sync, plus any of the
+        ``days`` further back than it has synced so far. WODs arrive through
+        the `wods` listener.
+        """
+        through = through or env.localdate()
+        since = through - timedelta(days=days)
+        if self.synced_through is not None and since >= self.synced_since:
+            since = max(since, self.synced_through - timedelta(days=1))
+        start = env.UTC.localize(datetime(since.year, since.month, since.day))
+        end = env.UTC.localize(datetime(through.year, through.month, through.day)) + timedelta(days=2)
+        wods.get_wods_by_range(start, end, background)
+        if self.synced_since is None or since < self.synced_since:
+            self.synced_since = since
+        if self.synced_through is None or through > self.synced_through:
+            self.synced_through = through
+
+
+PERIODS = ('week', 'month', 'quarter', 'year')
+
+
+def period_start(period: str, today: Date) -> Date:
+    """First day of the calendar ``period`` (one of `PERIODS`) ``today`` is in."""
+    if period == 'week':
+        return today - timedelta(days=today.weekday())
+    if period == 'month':
+        return today.replace(day=1)
+    if period == 'quarter':
+        return today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1)
+    if period == 'year':
+        return today.replace(month=1, day=1)
+    raise ValueError('Unknown period: %s' % period)
+
+
+INDEX = MovementIndex()
+wods.add_wod_listener(INDEX.add)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='How often movements were programmed, from the EBCF API.')
+    parser.add_argument('movements', nargs='+', metavar='MOVEMENT', help='e.g. "front squat"')
+    parser.add_argument('--through', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(),
+                        help='count up to this day (YYYY-MM-DD); default today')
+    parser.add_argument('--days', type=int, default=366, help='days of history to pull in')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(levelname)s %(filename)s-%(funcName)s-%(lineno)d: %(message)s')
+
+    through = args.through or env.localdate()
+    INDEX.sync(through, background=False, days=args.days)
+    print('{} days indexed, {} to {}'.format(len(INDEX), INDEX.synced_since, through))
+    print('{:<24} {:>10} {}'.format('movement', 'last', ' '.join('{:>7}'.format(p) for p in PERIODS)))
+    for movement in args.movements:
+        last = INDEX.last(movement, through)
+        print('{:<24} {:>10} {}'.format(
+            movement, last.isoformat() if last else '-',
+            ' '.join('{:>7}'.format(INDEX.count(movement, period_start(p, through), through)) for p in PERIODS)))
+
+
+if __name__ == '__main__':
+    main()
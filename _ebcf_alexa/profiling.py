@@ -0,0 +1,171 @@
+"""
+Opt-in profiling of lambda invocations.
+
+Configured from the environment:
+
+``EBCF_PROFILE_SAMPLE_RATE``
+    Fraction (0-1) of invocations to profile. Defaults to 0 (off).
+``EBCF_PROFILE_MODES``
+    Comma separated list of ``cprofile`` and/or ``tracemalloc``. Defaults to
+    ``cprofile``.
+``EBCF_PROFILE_TOP_N``
+    How many functions / allocation sites to include in a summary. Defaults
+    to 20.
+``EBCF_PROFILE_DIR``
+    If set (e.g. ``/tmp``), summaries and raw ``.prof`` files are written
+    there. Otherwise the summary is logged at INFO.
+"""
+import cProfile
+import functools
+import io
+import itertools
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from typing import Callable, Mapping, Optional, Sequence
+
+LOG = logging.getLogger(__name__)
+
+CPROFILE = 'cprofile'
+TRACEMALLOC = 'tracemalloc'
+MODES = (CPROFILE, TRACEMALLOC)
+DEFAULT_TOP_N = 20
+
+_report_seq = itertools.count()
+_RUNNING = threading.Lock()
+"""Held while an invocation is profiled: cProfile and tracemalloc are per process."""
+
+
+class Settings(object):
+    __slots__ = ('sample_rate', 'modes', 'top_n', 'out_dir')
+
+    def __init__(self, sample_rate: float = 0.0, modes: Sequence[str] = (CPROFILE,),
+                 top_n: int = DEFAULT_TOP_N, out_dir: Optional[str] = None):
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise ValueError('Unknown profile mode(s): %s' % ', '.join(sorted(unknown)))
+        self.sample_rate = sample_rate
+        self.modes = tuple(modes)
+        self.top_n = top_n
+        self.out_dir = out_dir
+
+    @classmethod
+    def from_environ(cls, environ: Mapping[str, str]) -> 'Settings':
+        modes = [m.strip().lower() for m in environ.get('EBCF_PROFILE_MODES', CPROFILE).split(',') if m.strip()]
+        try:
+            return cls(
+                sample_rate=float(environ.get('EBCF_PROFILE_SAMPLE_RATE', 0)),
+                modes=modes,
+                top_n=int(environ.get('EBCF_PROFILE_TOP_N', DEFAULT_TOP_N)),
+                out_dir=environ.get('EBCF_PROFILE_DIR') or None,
+            )
+        except ValueError:
+            LOG.exception('Bad profiling settings, profiling disabled')
+            return cls()
+
+
+SETTINGS = Settings.from_environ(os.environ)
+
+
+def configure(environ: Mapping[str, str] = os.environ) -> None:
+    """Re-read the profiling settings from ``environ``."""
+    global SETTINGS
+    SETTINGS = Settings.from_environ(environ)
+
+
+def _cprofile_summary(profile: cProfile.Profile, top_n: int) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(top_n)
+    return out.getvalue()
+
+
+def _tracemalloc_summary(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, top_n: int) -> str:
+    lines = ['Top {} allocation sites:'.format(top_n)]
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    before, after = before.filter_traces(ignore), after.filter_traces(ignore)
+    for stat in after.compare_to(before, 'lineno')[:top_n]:
+        lines.append(str(stat))
+    current, peak = tracemalloc.get_traced_memory()
+    lines.append('Traced memory: current={} peak={}'.format(current, peak))
+    return '\n'.join(lines)
+
+
+def run(func: Callable, *args, settings: Optional[Settings] = None, **kwargs):
+    """
+    Call ``func`` with every profiling mode in ``settings`` turned on and
+    report the summaries, regardless of the sample rate. One invocation is
+    profiled at a time; calls made meanwhile just run. Failing to report is
+    logged, and never changes what ``func`` returns or raises.
+    """
+    if not _RUNNING.acquire(blocking=False):
+        LOG.debug('Already profiling another invocation, not this one')
+        return func(*args, **kwargs)
+    try:
+        return _run(func, args, kwargs, settings or SETTINGS)
+    finally:
+        _RUNNING.release()
+
+
+def _run(func: Callable, args: tuple, kwargs: dict, settings: Settings):
+    profile = cProfile.Profile() if CPROFILE in settings.modes else None
+    started_tracing = False
+    before = None
+    if TRACEMALLOC in settings.modes:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        before = tracemalloc.take_snapshot()
+
+    start = time.perf_counter()
+    try:
+        if profile is not None:
+            return profile.runcall(func, *args, **kwargs)
+        return func(*args, **kwargs)
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        name = getattr(func, '__name__', func)
+        try:
+            sections = ['Profiled {} in {:.3f} ms'.format(name, elapsed_ms)]
+            # snapshot first so the cProfile report's own allocations don't show up
+            if before is not None:
+                sections.append(_tracemalloc_summary(before, tracemalloc.take_snapshot(), settings.top_n))
+            if profile is not None:
+                sections.insert(1, _cprofile_summary(profile, settings.top_n))
+            _report('\n'.join(sections), profile, settings)
+        except Exception:
+            LOG.exception('Failed to report the profile of %s', name)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+
+def _report(summary: str, profile: Optional[cProfile.Profile], settings: Settings) -> None:
+    if not settings.out_dir:
+        LOG.info(summary)
+        return
+    base = os.path.join(settings.out_dir, 'ebcf-profile-{}-{}-{}'.format(
+        time.strftime('%Y%m%dT%H%M%S'), os.getpid(), next(_report_seq)))
+    with open(base + '.txt', 'w') as f:
+        f.write(summary)
+    if profile is not None:
+        profile.dump_stats(base + '.prof')
+    LOG.info('Wrote profile to %s.txt', base)
+
+
+def profiled(func: Callable) -> Callable:
+    """
+    Decorator that profiles a sampled fraction of calls according to
+    ``SETTINGS``. Unsampled calls only pay for one ``random()``.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        rate = SETTINGS.sample_rate
+        if rate > 0 and random.random() < rate:
+            return run(func, *args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,167 @@
+"""
+Progressive responses: something to say while a slow answer is on its way.
+
+On a cold cache `interaction_model.wod_query` has to go to the gym's API,
+and the user hears nothing until it answers. Alexa lets a skill speak in
+the meantime by posting a directive for the request being handled::
+
+    POST {apiEndpoint}/v1/directives
+    Authorization: Bearer {apiAccessToken}
+
+    {"header": {"requestId": "amzn1.echo-api.request..."},
+     "directive": {"type": "VoicePlayer.Speak", "speech": "<speak>Checking the board.</speak>"}}
+
+`for_request` remembers where to post for the request on this thread, and
+`Progressive` posts in a background thread while the fetch runs. The post
+is given at most ``TIMEOUT_SECONDS``, and never more than the invocation has
+left less ``DEADLINE_MARGIN_SECONDS``. Once the answer is ready the post
+gets only ``JOIN_SECONDS`` more before the answer goes out without it: a
+directive that arrives after the response is useless anyway. At most one is
+sent per request.
+
+Set ``EBCF_PROGRESSIVE_RESPONSE=false`` to turn it off.
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Iterator, Optional
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from . import env, incoming_types, metrics
+
+LOG = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('EBCF_PROGRESSIVE_RESPONSE', 'true').lower() in ('1', 'true', 'yes')
+TIMEOUT_SECONDS = env.setting('EBCF_PROGRESSIVE_TIMEOUT', 1.0)
+DEADLINE_MARGIN_SECONDS = 1.0
+"""Leave the invocation at least this long to answer after the directive."""
+JOIN_SECONDS = 0.05
+"""Once the answer is ready, wait at most this long for the directive to finish."""
+SPEECH = '<speak>Checking the board.</speak>'
+
+_request = threading.local()
+
+
+def directive_url(api_endpoint: str) -> str:
+    return api_endpoint.rstrip('/') + '/v1/directives'
+
+
+def send_speech(api_endpoint: str, token: str, request_id: str, ssml: str, timeout: float) -> bool:
+    """
+    Post a ``VoicePlayer.Speak`` directive for ``request_id``.
+
+    :returns: whether Alexa took it; False without trying if ``api_endpoint``
+        isn't Alexa's
+    """
+    if not incoming_types.is_alexa_api_endpoint(api_endpoint):
+        LOG.warning('Progressive response not sent: %r is not an Alexa API endpoint', api_endpoint)
+        return False
+    body = json.dumps({
+        'header': {'requestId': request_id},
+        'directive': {'type': 'VoicePlayer.Speak', 'speech': ssml},
+    }).encode('utf-8')
+    request = Request(directive_url(api_endpoint), data=body, method='POST', headers={
+        'Authorization': 'Bearer ' + token,
+        'Content-Type': 'application/json',
+    })
+    try:
+        with urlopen(request, timeout=timeout):
+            return True
+    except (URLError, OSError, ValueError) as e:
+        LOG.warning('Progressive response not sent: %s', e)
+        return False
+
+
+class _Target(object):
+    __slots__ = ('api_endpoint', 'token', 'request_id', 'deadline', 'sent')
+
+    def __init__(self, api_endpoint: str, token: str, request_id: str, deadline: Optional[float]):
+        self.api_endpoint = api_endpoint
+        self.token = token
+        self.request_id = request_id
+        self.deadline = deadline
+        self.sent = False
+
+
+@contextlib.contextmanager
+def for_request(event, context=None) -> Iterator[None]:
+    """
+    Let `Progressive` speak for the `incoming_types.LambdaEvent` being
+    handled on this thread, within the time the lambda ``context`` has left.
+    Events without an endpoint and token, or whose endpoint isn't one of
+    `incoming_types.ALEXA_API_ORIGINS`, can't have progressive responses.
+    """
+    target = None
+    try:
+        system = event.context.system if event.context is not None else None
+    except KeyError:
+        system = None
+    if system is not None and system.api_endpoint and system.api_access_token \
+            and incoming_types.is_alexa_api_endpoint(system.api_endpoint):
+        deadline = None
+        if context is not None:
+            deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000
+        target = _Target(system.api_endpoint, system.api_access_token, event.request.request_id, deadline)
+    previous = getattr(_request, 'target', None)
+    _request.target = target
+    try:
+        yield
+    finally:
+        _request.target = previous
+
+
+class Progressive(object):
+    """
+    Speak ``ssml`` while the ``with`` block runs, once `start` is called,
+    e.g. by `wods.get_wod` on a cache miss::
+
+        with Progressive() as progress:
+            wod = wods.get_wod(date, on_miss=progress.start)
+
+    Leaving the block waits for the directive for at most ``JOIN_SECONDS``.
+    """
+
+    def __init__(self, ssml: str = SPEECH):
+        self._ssml = ssml
+        self._thread: Optional[threading.Thread] = None
+        self._sent = [False]
+
+    def _timeout(self, target: _Target) -> float:
+        timeout = TIMEOUT_SECONDS
+        if target.deadline is not None:
+            timeout = min(timeout, target.deadline - DEADLINE_MARGIN_SECONDS - time.monotonic())
+        return timeout
+
+    def start(self) -> None:
+        target = getattr(_request, 'target', None)
+        if not ENABLED or target is None or target.sent or self._thread is not None:
+            return
+        timeout = self._timeout(target)
+        if timeout <= 0:
+            LOG.debug('No time left for a progressive response')
+            metrics.incr('progressive_skipped')
+            return
+        target.sent = True
+        sent = self._sent
+
+        def send():
+            sent[0] = send_speech(target.api_endpoint, target.token, target.request_id, self._ssml, timeout)
+
+        self._thread = threading.Thread(target=send, name='progressive-response', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'Progressive':
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is None:
+            return
+        self._thread.join(JOIN_SECONDS)
+        if self._thread.is_alive():
+            metrics.incr('progressive_late')
+        else:
+            metrics.incr('progressive_sent' if self._sent[0] else 'progressive_failed')
@@ -0,0 +1,127 @@
+"""
+What users ask for, by local hour of day, so the likely next queries can be
+fetched and rendered before anyone asks.
+
+Traffic is skewed: mornings ask for today, evenings for tomorrow, and whether
+people want strength or conditioning follows class times. `QueryMix` keeps a
+small histogram of queries per hour whose weights halve every
+``HALF_LIFE_SECONDS``, so it follows the schedule as it shifts. It also
+keeps score of its own predictions: each one is an expectation that a query
+will arrive within ``PREDICTION_TTL_SECONDS``, and a hit when it does.
+"""
+import threading
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from . import env
+
+HALF_LIFE_SECONDS = env.setting('EBCF_QUERY_MIX_HALF_LIFE_HOURS', 72.0, env.positive) * 60 * 60
+"""Three days by default: long enough to remember yesterday's evening rush."""
+
+PREDICTION_TTL_SECONDS = 60 * 60
+"""How long a prediction has to come true."""
+
+TOP_K = 3
+MIN_SHARE = 0.1
+"""Queries that make up less than this much of an hour's traffic aren't worth prefetching."""
+
+
+def _timestamp(now: Optional[float]) -> float:
+    return env.now().timestamp() if now is None else now
+
+
+class QueryMix(object):
+    def __init__(self, half_life: float = HALF_LIFE_SECONDS):
+        self._lock = threading.Lock()
+        self._half_life = half_life
+        self._weights: Dict[Tuple[int, Hashable], Tuple[float, float]] = {}
+        """(hour, query) -> (weight, when it was last brought up to date)"""
+        self._expected: Dict[Hashable, List] = {}
+        """prediction -> [when it expires, whether it came true]"""
+        self.predictions = 0
+        self.hits = 0
+        """Predictions that came true."""
+        self.predicted_queries = 0
+        """Queries that arrived while predicted, i.e. to a warm cache."""
+        self.unpredicted = 0
+        """Queries that arrived with no prediction for them."""
+
+    def clear(self) -> None:
+        with self._lock:
+            self._weights.clear()
+            self._expected.clear()
+            self.predictions = self.hits = self.predicted_queries = self.unpredicted = 0
+
+    def _decayed(self, weight: float, at: float, now: float) -> float:
+        return weight * 0.5 ** (max(now - at, 0.0) / self._half_life)
+
+    def record(self, hour: int, query: Hashable, now: Optional[float] = None) -> None:
+        """Count one ``query`` asked during local ``hour``."""
+        now = _timestamp(now)
+        with self._lock:
+            weight, at = self._weights.get((hour, query), (0.0, now))
+            self._weights[hour, query] = (self._decayed(weight, at, now) + 1.0, now)
+
+    def weights(self, hours: Iterable[int], now: Optional[float] = None) -> Dict[Hashable, float]:
+        """Decayed weight of each query over ``hours``."""
+        now = _timestamp(now)
+        hours = set(hours)
+        totals: Dict[Hashable, float] = {}
+        with self._lock:
+            for (hour, query), (weight, at) in self._weights.items():
+                if hour in hours:
+                    totals[query] = totals.get(query, 0.0) + self._decayed(weight, at, now)
+        return totals
+
+    def predict(self, hour: int, now: Optional[float] = None, hours_ahead: int = 1,
+                top: int = TOP_K, min_share: float = MIN_SHARE) -> List[Hashable]:
+        """
+        The queries most likely to be asked from ``hour`` through
+        ``hours_ahead`` hours later, most likely first.
+        """
+        totals = self.weights(((hour + i) % 24 for i in range(hours_ahead + 1)), now)
+        total = sum(totals.values())
+        ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        return [query for query, weight in ranked[:top] if weight >= total * min_share]
+
+    def expect(self, prediction: Hashable, now: Optional[float] = None,
+               ttl: float = PREDICTION_TTL_SECONDS) -> None:
+        """Predict ``prediction`` will be `observed` within ``ttl`` seconds."""
+        now = _timestamp(now)
+        with self._lock:
+            live = self._expected.get(prediction)
+            if live is None or live[0] <= now:
+                self.predictions += 1
+                self._expected[prediction] = [now + ttl, False]
+            else:
+                live[0] = now + ttl  # repeating a live prediction only extends it
+
+    def observed(self, prediction: Hashable, now: Optional[float] = None) -> bool:
+        """
+        A query came in; score it against the live predictions.
+
+        :returns: True if it had been predicted
+        """
+        now = _timestamp(now)
+        with self._lock:
+            for key in [k for k, (until, _) in self._expected.items() if until <= now]:
+                del self._expected[key]
+            live = self._expected.get(prediction)
+            if live is None:
+                self.unpredicted += 1
+                return False
+            self.predicted_queries += 1
+            if not live[1]:
+                live[1] = True
+                self.hits += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'predictions': self.predictions,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.predictions, 3) if self.predictions else 0.0,
+                'predicted_queries': self.predicted_queries,
+                'unpredicted_queries': self.unpredicted,
+                'tracked': len(self._weights),
+            }
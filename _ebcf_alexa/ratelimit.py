@@ -0,0 +1,58 @@
+"""
+Token bucket rate limiting.
+
+A bucket holds up to ``burst`` tokens and refills at ``rate`` tokens per
+second. Each call takes a token; when there is none, ``try_acquire`` says so
+immediately rather than making the caller wait, so callers can decide to
+serve something stale instead.
+"""
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket(object):
+    """
+    :param rate: tokens added per second, or None for no limit
+    :param burst: bucket size, i.e. how many calls may go back to back
+    """
+
+    def __init__(self, rate: Optional[float], burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+        self.allowed = 0
+        self.throttled = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take ``tokens`` if they are available. Never blocks."""
+        with self._lock:
+            if self.rate is None:
+                self.allowed += 1
+                return True
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                self.allowed += 1
+                return True
+            self.throttled += 1
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self.rate is not None:
+                self._refill(self._clock())
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'tokens': round(self._tokens, 3) if self.rate is not None else None,
+                'allowed': self.allowed,
+                'throttled': self.throttled,
+            }
@@ -0,0 +1,157 @@
+"""
+Scheduled refresh: have the next WOD fetched, rendered and in the cache
+before the first user asks for it.
+
+WODs go up the evening before. A CloudWatch Events rule scheduled a little
+before the usual publish time invokes the lambda with its constant input
+(which replaces the whole event) set to::
+
+    {"action": "refresh"}
+
+A scheduled event passed through with ``{"action": "refresh"}`` as its
+``detail`` (``"source": "aws.events"``) works too, and locally so does just
+``{"refresh": true}``. The handler then polls the API for
+today's and tomorrow's WOD (an unreleased WOD answers 401) every
+``POLL_SECONDS``, from when `wods.PUBLISH_TIMES` expects it could be out
+until ``WINDOW_SECONDS`` are up or the invocation is about to time out. As
+each one appears it is cached and every section is rendered into
+`wods.CACHE`, so every container sharing it skips the fetch and the render.
+Thanks to conditional requests most polls are a 304.
+
+The constant input, or else ``detail``, may also carry ``dates`` (a list of
+YYYY-MM-DD), ``window_s`` and ``poll_s``, which is handy for trying it
+against the stand-in API::
+
+    $ python3 -m bench.standin --port 4500 &
+    $ echo '{"refresh": true, "detail": {"window_s": 5}}' | \\
+        EBCF_API_URL='http://127.0.0.1:4500/api/v1/wods?' python3 ebcf_alexa.py
+"""
+from datetime import date as Date, datetime, timedelta
+import logging
+import time
+from typing import Callable, Dict, List
+
+from . import env, wods
+
+LOG = logging.getLogger(__name__)
+
+POLL_SECONDS = env.setting('EBCF_REFRESH_POLL_SECONDS', 30.0)
+MIN_POLL_SECONDS = 1.0
+"""Floor for ``poll_s``, so a zero or negative one doesn't spin on the API."""
+WINDOW_SECONDS = env.setting('EBCF_REFRESH_WINDOW_SECONDS', 10 * 60.0)
+"""Give up on a WOD that hasn't appeared after this long."""
+DEADLINE_MARGIN_SECONDS = 5.0
+"""Stop polling this long before the invocation would time out."""
+
+PUBLISHED = 'published'
+NOT_PUBLISHED = 'not published'
+NOT_EXPECTED_YET = 'not expected yet'
+RATE_LIMITED = 'rate limited'
+
+
+def is_refresh_event(event_dict: dict) -> bool:
+    if event_dict.get('refresh') or event_dict.get('action') == 'refresh':
+        return True
+    detail = event_dict.get('detail')
+    return event_dict.get('source') == 'aws.events' and isinstance(detail, dict) \
+        and detail.get('action') == 'refresh'
+
+
+def _detail(event_dict: dict) -> dict:
+    if event_dict.get('action') == 'refresh':
+        return event_dict  # constant input: the options are next to the action
+    detail = event_dict.get('detail')
+    return detail if isinstance(detail, dict) else {}
+
+
+def _option(event_dict: dict, name: str, default: float, minimum: float) -> float:
+    """``detail[name]``, or ``default`` if it is missing, not a number or under ``minimum``."""
+    value = _detail(event_dict).get(name)
+    if value is None:
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        number = None
+    if number is None or not minimum <= number < float('inf'):
+        LOG.warning('Bad refresh option %s=%r, using %s', name, value, default)
+        return default
+    return number
+
+
+def event_dates(event_dict: dict) -> List[Date]:
+    """
+    The days a refresh event is for: ``detail.dates``, else today and
+    tomorrow. Dates that aren't YYYY-MM-DD are skipped with a warning.
+    """
+    dates = _detail(event_dict).get('dates')
+    if dates:
+        parsed = []
+        for d in dates:
+            try:
+                parsed.append(datetime.strptime(d, '%Y-%m-%d').date())
+            except (TypeError, ValueError):
+                LOG.warning('Skipping bad refresh date %r', d)
+        return parsed
+    today = env.localdate()
+    return [today, today + timedelta(days=1)]
+
+
+def event_window(event_dict: dict, context) -> float:
+    """Seconds to keep polling: ``detail.window_s``, capped by the time the invocation has left."""
+    window = _option(event_dict, 'window_s', WINDOW_SECONDS, 0.0)
+    if context is not None:
+        window = min(window, context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_SECONDS)
+    return max(window, 0.0)
+
+
+def refresh(dates: List[Date], window: float = WINDOW_SECONDS, poll: float = POLL_SECONDS,
+            sleep: Callable[[float], None] = time.sleep,
+            clock: Callable[[], float] = time.monotonic) -> Dict[Date, str]:
+    """
+    Poll for the WODs of ``dates`` until each is published or ``window``
+    seconds are up. No day is polled before `wods.PUBLISH_TIMES` expects it
+    could be out. Each one found is cached and rendered into the shared
+    cache. Polls come out of the background API budget; a poll over budget
+    is retried next round. ``poll`` is at least `MIN_POLL_SECONDS`.
+
+    :returns: date -> `PUBLISHED`, `NOT_PUBLISHED`, `NOT_EXPECTED_YET` or
+        `RATE_LIMITED`
+    """
+    poll = max(poll, MIN_POLL_SECONDS)
+    start = clock()
+    deadline = start + window
+    due = {date: start + wods.PUBLISH_TIMES.seconds_until(date) for date in dates}
+    outcomes = {date: NOT_EXPECTED_YET for date in dates}
+    pending = list(dates)
+    while True:
+        now = clock()
+        for date in [d for d in pending if due[d] <= now]:
+            try:
+                wod = wods.refresh_wod(date, background=True)
+            except wods.RateLimited:
+                outcomes[date] = RATE_LIMITED
+                continue
+            if wod is None:
+                outcomes[date] = NOT_PUBLISHED
+                continue
+            wods.share_rendered(wod)
+            outcomes[date] = PUBLISHED
+            pending.remove(date)
+            LOG.info('WOD for %s is published; cached and rendered', date)
+        if not pending:
+            break
+        now = clock()
+        wait = min(poll if due[d] <= now else due[d] - now for d in pending)
+        if now + wait > deadline:
+            break
+        sleep(wait)
+    for date in pending:
+        LOG.warning('WOD for %s: %s after %.0fs', date, outcomes[date], window)
+    return outcomes
+
+
+def on_refresh_event(event_dict: dict, context) -> dict:
+    outcomes = refresh(event_dates(event_dict), event_window(event_dict, context),
+                       _option(event_dict, 'poll_s', POLL_SECONDS, MIN_POLL_SECONDS))
+    return {'refresh': {date.isoformat(): outcome for date, outcome in outcomes.items()}}
@@ -0,0 +1,175 @@
+"""
+Replay recorded Alexa events through the lambda handler.
+
+A corpus is a JSON lines file, one event per line. Each event is run
+through the handler (optionally on a thread pool) and the responses are
+written as JSON lines, ``{"index": n, "latency_ms": t, "response": {...}}``
+or ``{"index": n, "latency_ms": t, "error": "..."}``, in corpus order. A
+summary of latency and throughput goes to stderr, and if a golden file (a
+previous output) is given every response that differs from it is printed as
+a diff; latencies aren't compared. The exit status is
+non-zero if anything errored or differed, so it can gate changes::
+
+    $ python3 ebcf_alexa.py --replay corpus.jsonl --golden golden.jsonl \\
+        --now 2017-09-01T19:00:00Z --workers 4 --output out.jsonl
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import difflib
+import json
+import sys
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, TextIO
+
+
+class Result(object):
+    __slots__ = ('index', 'response', 'error', 'latency_ms')
+
+    def __init__(self, index: int, response: Optional[dict], error: Optional[str], latency_ms: float):
+        self.index = index
+        self.response = response
+        self.error = error
+        self.latency_ms = latency_ms
+
+    def dict(self) -> dict:
+        if self.error is not None:
+            return {'index': self.index, 'latency_ms': round(self.latency_ms, 3), 'error': self.error}
+        return {'index': self.index, 'latency_ms': round(self.latency_ms, 3), 'response': self.response}
+
+
+class ReplayContext(object):
+    """Stand-in for the lambda context object."""
+    __slots__ = ('aws_request_id',)
+
+    def __init__(self, index: int):
+        self.aws_request_id = 'replay-%d' % index
+
+    def get_remaining_time_in_millis(self) -> int:
+        return 8000
+
+
+def read_jsonl(f: TextIO) -> Iterator[dict]:
+    """Yield one object per non-blank line."""
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError('line %d: %s' % (lineno, e))
+
+
+def _run_one(handler: Callable[[dict, object], dict], index: int, event: dict) -> Result:
+    start = time.perf_counter()
+    try:
+        response, error = handler(event, ReplayContext(index)), None
+    except Exception as e:
+        response, error = None, '%s: %s' % (e.__class__.__name__, e)
+    return Result(index, response, error, (time.perf_counter() - start) * 1000)
+
+
+def replay(events: Iterable[dict], handler: Callable[[dict, object], dict], workers: int = 1) -> List[Result]:
+    """Run every event through ``handler``. Results are in event order."""
+    if workers <= 1:
+        return [_run_one(handler, i, event) for i, event in enumerate(events)]
+    with ThreadPoolExecutor(workers, thread_name_prefix='replay') as pool:
+        futures = [pool.submit(_run_one, handler, i, event) for i, event in enumerate(events)]
+        return [f.result() for f in futures]
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(results: List[Result], elapsed_s: float) -> dict:
+    latencies = sorted(r.latency_ms for r in results)
+    return {
+        'events': len(results),
+        'errors': sum(r.error is not None for r in results),
+        'elapsed_s': round(elapsed_s, 3),
+        'events_per_s': round(len(results) / elapsed_s, 1) if elapsed_s > 0 else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'p50': round(_percentile(latencies, 50), 3),
+            'p90': round(_percentile(latencies, 90), 3),
+            'p99': round(_percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+def _pretty(obj: dict) -> List[str]:
+    return json.dumps(obj, indent=2, sort_keys=True).splitlines()
+
+
+def _comparable(line: dict) -> dict:
+    """An output line without what changes from run to run."""
+    return {k: v for k, v in line.items() if k != 'latency_ms'}
+
+
+def diff_against_golden(results: List[Result], golden: List[dict]) -> List[str]:
+    """
+    :param golden: output lines of an earlier replay of the same corpus
+    :returns: a unified diff per result that doesn't match its golden line
+    """
+    diffs = []
+    by_index = {g.get('index'): _comparable(g) for g in golden}
+    for result in results:
+        expected = by_index.get(result.index)
+        actual = _comparable(json.loads(json.dumps(result.dict())))  # compare as it would be written
+        if expected == actual:
+            continue
+        diffs.append('\n'.join(difflib.unified_diff(
+            _pretty(expected) if expected is not None else [], _pretty(actual),
+            'golden[%d]' % result.index, 'replay[%d]' % result.index, lineterm='')))
+    extra = sorted(set(by_index) - {r.index for r in results}, key=str)
+    if extra:
+        diffs.append('golden has results for events not in the corpus: %s' % extra)
+    return diffs
+
+
+def run(corpus: TextIO, handler: Callable[[dict, object], dict], workers: int = 1,
+        output: Optional[TextIO] = None, golden: Optional[TextIO] = None,
+        report: Optional[TextIO] = None) -> int:
+    """
+    Replay ``corpus`` and report on it.
+
+    :param report: where the summary goes; stderr by default
+    :returns: exit status; 1 if any event errored or differed from ``golden``
+    """
+    report = report or sys.stderr
+    events = list(read_jsonl(corpus))
+    start = time.perf_counter()
+    results = replay(events, handler, workers)
+    elapsed = time.perf_counter() - start
+
+    if output is not None:
+        for result in results:
+            output.write(json.dumps(result.dict(), sort_keys=True) + '\n')
+    summary = summarize(results, elapsed)
+    latency = summary['latency_ms']
+    report.write('{events} events in {elapsed_s}s ({events_per_s}/s), {errors} errors\n'.format(**summary))
+    report.write('latency ms: mean {mean} p50 {p50} p90 {p90} p99 {p99} max {max}\n'.format(**latency))
+    for result in results:
+        if result.error is not None:
+            report.write('event %d failed: %s\n' % (result.index, result.error))
+
+    failed = summary['errors'] > 0
+    if golden is not None:
+        diffs = diff_against_golden(results, list(read_jsonl(golden)))
+        for diff in diffs:
+            report.write(diff + '\n')
+        report.write('%d of %d responses differ from golden\n' % (len(diffs), len(results)))
+        failed = failed or bool(diffs)
+    return 1 if failed else 0
+
+
+def parse_now(value: str) -> datetime:
+    """``--now`` values: ISO 8601, with a Z or an offset."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        raise ValueError('--now needs a timezone, e.g. 2017-09-01T19:00:00Z')
+    return parsed
@@ -0,0 +1,367 @@
+"""
+Long running HTTP server hosting the skill outside of lambda.
+
+Alexa request JSON POSTed to ``/`` is run through the lambda handler on a
+bounded pool of worker threads. Once every worker is busy and the queue is
+full, new connections are handed to a reject thread that answers 503
+instead of letting them pile up. It waits on all of them at once with a
+selector, so slow clients can't hold it up, and past ``REJECT_BACKLOG`` of
+them connections are closed unread. The accept loop itself never reads from
+a client, and a client that stalls once a worker has it is cut off after
+the invocation deadline. Caches and connection state live as long as the
+process, which is the point of running it this way.
+
+``GET /health`` answers 200 whenever the process is up, busy or not: the
+reject thread answers it too, so a saturated server doesn't look dead to a
+load balancer. ``GET /metrics`` returns server and API client counters as
+JSON.
+
+Scheduled refresh and keep-warm events spend the background API budget and
+carry no application id, so they are refused with 403 unless the server is
+started with ``--allow-control-events``.
+
+Only the standard library is used::
+
+    $ python3 -m _ebcf_alexa.server --port 8080 --workers 8 --queue 16
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import argparse
+import itertools
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+from typing import Callable, List, Optional
+
+from . import device_settings, incoming_types, interaction_model, refresh, wods
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_QUEUE = 16
+DEFAULT_DEADLINE_MS = 8000
+"""Alexa gives a skill 8 seconds to answer."""
+MAX_BODY_BYTES = 1024 * 1024
+REJECT_BACKLOG = 256
+"""Turned away connections waiting to be answered; past this they are just closed."""
+REJECT_READ_SECONDS = 0.5
+"""How long a turned away client gets to send its request line."""
+REJECT_HEAD_BYTES = 4096
+"""Read from a turned away client: enough for the request line and a small request."""
+
+_BUSY_RESPONSE = (
+    b'HTTP/1.0 503 Service Unavailable\r\n'
+    b'Content-Type: application/json\r\n'
+    b'Retry-After: 1\r\n'
+    b'Connection: close\r\n'
+    b'Content-Length: 18\r\n'
+    b'\r\n'
+    b'{"error": "busy"}\n'
+)
+_HEALTH_RESPONSE = (
+    b'HTTP/1.0 200 OK\r\n'
+    b'Content-Type: application/json\r\n'
+    b'Connection: close\r\n'
+    b'Content-Length: 16\r\n'
+    b'\r\n'
+    b'{"status":"ok"}\n'
+)
+
+
+def _is_control_event(event) -> bool:
+    """Refresh and keep-warm events, which the lambda takes from its scheduler."""
+    return isinstance(event, dict) and (refresh.is_refresh_event(event) or event.get('source') == 'aws.events'
+                                        or bool(event.get('warmup')))
+
+
+class InvocationContext(object):
+    """The bits of the lambda context object the handler uses."""
+    __slots__ = ('aws_request_id', '_deadline')
+
+    def __init__(self, request_id: str, deadline_ms: int):
+        self.aws_request_id = request_id
+        self._deadline = time.monotonic() + deadline_ms / 1000
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+class _ServerStats(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float, error: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += error
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def reject(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def dict(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'mean_ms': round(self.total_ms / self.requests, 3) if self.requests else 0.0,
+                'max_ms': round(self.max_ms, 3),
+            }
+
+
+class _SkillRequestHandler(BaseHTTPRequestHandler):
+    server: 'SkillServer'
+
+    def setup(self):
+        # a client that stalls mid request would otherwise hold a worker forever
+        self.timeout = self.server.deadline_ms / 1000
+        super().setup()
+
+    def _send_json(self, status: int, body: dict) -> None:
+        payload = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            self._send_json(200, self.server.metrics())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path not in ('/', '/alexa'):
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+        if not 0 < length <= MAX_BODY_BYTES:
+            self._send_json(400, {'error': 'bad content length'})
+            return
+        try:
+            body = self.rfile.read(length)
+        except socket.timeout:
+            self.close_connection = True
+            self._send_json(408, {'error': 'timed out reading body'})
+            return
+        try:
+            event = json.loads(body.decode('utf-8'))
+        except ValueError:
+            self._send_json(400, {'error': 'body is not json'})
+            return
+        self._send_json(*self.server.invoke(event))
+
+    def log_message(self, fmt, *args):
+        LOG.debug('%s - ' + fmt, self.address_string(), *args)
+
+
+class _Rejecter(object):
+    """
+    Answers connections there is no room for, on one thread: health checks
+    200, anything else 503. Up to ``REJECT_HEAD_BYTES`` of what the client
+    sent is read first, otherwise closing with unread data resets the
+    connection before it reads the answer. Only the request line matters,
+    so there is no point buffering a whole body while overloaded. Clients
+    that send nothing in ``timeout`` get the 503 anyway.
+    """
+
+    def __init__(self, stats: _ServerStats, backlog: int = REJECT_BACKLOG,
+                 timeout: float = REJECT_READ_SECONDS):
+        self._stats = stats
+        self._backlog = backlog
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._pending: List[socket.socket] = []
+        self._deadlines = {}
+        self._selector = selectors.DefaultSelector()
+        self._wakeup, self._waker = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='skill-reject', daemon=True)
+        self._thread.start()
+
+    def add(self, request: socket.socket) -> bool:
+        """:returns: False if there are too many waiting already"""
+        with self._lock:
+            if self._closed or len(self._pending) + len(self._deadlines) >= self._backlog:
+                return False
+            self._pending.append(request)
+        self._waker.send(b'x')
+        return True
+
+    def _answer(self, request: socket.socket, head: bytes) -> None:
+        self._selector.unregister(request)
+        del self._deadlines[request]
+        try:
+            if head.startswith(b'GET /health '):
+                request.sendall(_HEALTH_RESPONSE)
+            else:
+                self._stats.reject()
+                request.sendall(_BUSY_RESPONSE)
+            request.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        request.close()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                closed = self._closed
+            now = time.monotonic()
+            for request in pending:
+                request.setblocking(False)
+                self._deadlines[request] = now + self._timeout
+                self._selector.register(request, selectors.EVENT_READ)
+            if closed:
+                for request in list(self._deadlines):
+                    self._answer(request, b'')
+                break
+            for key, _ in self._selector.select(self._timeout / 4):
+                if key.fileobj is self._wakeup:
+                    try:
+                        self._wakeup.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                try:
+                    head = key.fileobj.recv(REJECT_HEAD_BYTES)
+                except OSError:
+                    head = b''
+                self._answer(key.fileobj, head)
+            now = time.monotonic()
+            for request in [r for r, deadline in self._deadlines.items() if deadline <= now]:
+                self._answer(request, b'')
+        self._selector.close()
+        self._wakeup.close()
+        self._waker.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        self._waker.send(b'x')
+        self._thread.join()
+
+
+class SkillServer(HTTPServer):
+    """
+    HTTP server that runs requests on a bounded thread pool.
+
+    :param handler: the lambda handler, ``handler(event_dict, context) -> dict``
+    :param workers: requests processed concurrently
+    :param queue: accepted connections allowed to wait for a worker
+    :param control_events: run refresh and keep-warm events instead of refusing them
+    """
+    request_queue_size = 128
+    """Listen backlog. The default 5 drops connections in a burst long before the pool is full."""
+
+    def __init__(self, address, handler: Callable[[dict, object], dict],
+                 workers: int = DEFAULT_WORKERS, queue: int = DEFAULT_QUEUE,
+                 deadline_ms: int = DEFAULT_DEADLINE_MS, control_events: bool = False):
+        super().__init__(address, _SkillRequestHandler)
+        self.handler = handler
+        self.control_events = control_events
+        self.deadline_ms = deadline_ms
+        self.stats = _ServerStats()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='skill-worker')
+        self._capacity = threading.BoundedSemaphore(workers + queue)
+        self._rejecter = _Rejecter(self.stats)
+        self._workers = workers
+        self._queue = queue
+        self._seq = itertools.count(1)
+
+    def process_request(self, request: socket.socket, client_address) -> None:
+        if self._capacity.acquire(blocking=False):
+            self._pool.submit(self._process_request, request, client_address)
+        elif not self._rejecter.add(request):
+            self.stats.reject()
+            self.shutdown_request(request)
+
+    def _process_request(self, request: socket.socket, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._capacity.release()
+
+    def invoke(self, event: dict):
+        """Run one event through the handler. Returns (http status, body)."""
+        if not self.control_events and _is_control_event(event):
+            LOG.warning('Refused a control event')
+            self.stats.record(0.0, True)
+            return 403, {'error': 'control events are disabled'}
+        context = InvocationContext('server-%d' % next(self._seq), self.deadline_ms)
+        start = time.perf_counter()
+        error = True
+        try:
+            body = self.handler(event, context)
+            error = False
+            return 200, body
+        except incoming_types.InvalidApplicationId as e:
+            LOG.warning('Rejected event: %s', e)
+            return 400, {'error': str(e)}
+        except Exception as e:
+            LOG.exception('Handler failed')
+            return 500, {'error': e.__class__.__name__}
+        finally:
+            self.stats.record((time.perf_counter() - start) * 1000, error)
+
+    def metrics(self) -> dict:
+        return {
+            'server': dict(self.stats.dict(), workers=self._workers, queue=self._queue),
+            'wods': wods.stats(),
+            'prefetch': interaction_model.QUERY_MIX.stats(),
+            'device_time_zones': device_settings.TIME_ZONES.stats(),
+        }
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._pool.shutdown(wait=True)
+        self._rejecter.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Serve the skill over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--queue', type=int, default=DEFAULT_QUEUE)
+    parser.add_argument('--allow-control-events', action='store_true',
+                        help='run scheduled refresh and keep-warm events POSTed to the server')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(levelname)s %(threadName)s %(filename)s-%(funcName)s-%(lineno)d: %(message)s')
+
+    from ebcf_alexa import lambda_handler
+    server = SkillServer((args.host, args.port), lambda_handler, workers=args.workers, queue=args.queue,
+                         control_events=args.allow_control_events)
+    LOG.warning('Serving on http://%s:%d/', *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Duplicate call suppression.
+
+When several threads ask for the same thing at once (e.g. everybody asking for
+today's WOD the minute it is published), only the first one should do the
+work; the rest wait for it and share its result, or its exception.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Flight(object):
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call per key at a time. Callers arriving while a call
+    for their key is in flight block until it finishes and get the same
+    outcome. Nothing is remembered once a call completes; that is the job of
+    a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        """Calls that actually ran."""
+        self.coalesced = 0
+        """Calls that waited for another caller's result instead of running."""
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Call ``func(*args, **kwargs)`` unless a call for ``key`` is already
+        running, in which case wait for that one.
+
+        :returns: (result, shared) where shared is True if the result came
+            from another caller's call.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+                leader = True
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func(*args, **kwargs)
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def in_flight(self) -> int:
+        """Number of keys currently being worked on."""
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced}
@@ -0,0 +1,105 @@
+"""
+Prefix index for resolving spoken slot values.
+
+Alexa hands us whatever it heard for a slot ("today's", "strength section",
+"metcon please"), so slot values are resolved by the first known word the
+value *starts with*. A ``SlotIndex`` does that in one walk down a character
+trie, i.e. in time proportional to the length of the value, instead of trying
+every known word in turn.
+
+Speech recognition also regularly mangles a letter or two ("tomorow",
+"strenght"). Every word of at least ``min_variant_length`` characters is
+expanded at build time into all strings one edit away from it (deletion,
+transposition, substitution, insertion). Variants live in a flat dict rather
+than the trie (a few thousand single-use tails would bloat it), and are
+checked with one dict lookup per possible variant length, so a misspelling
+still resolves immediately instead of costing the user another turn of "I
+didn't understand". Known words always win over variants, and variants that
+are one edit away from two different values are dropped as ambiguous.
+"""
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+VARIANT_ALPHABET = "abcdefghijklmnopqrstuvwxyz'"
+DEFAULT_MIN_VARIANT_LENGTH = 5
+
+_TERMINAL = ''
+"""Trie key holding the (rank, value) for a word ending at that node.
+Can't collide with a child key, which is always one character."""
+
+
+def edit_variants(word: str, alphabet: str = VARIANT_ALPHABET) -> Iterator[str]:
+    """Yield every string at edit distance 1 from ``word`` (may repeat)."""
+    for i in range(len(word) + 1):
+        head, tail = word[:i], word[i:]
+        if tail:
+            yield head + tail[1:]
+            if len(tail) > 1:
+                yield head + tail[1] + tail[0] + tail[2:]
+        for c in alphabet:
+            if tail:
+                yield head + c + tail[1:]
+            yield head + c + tail
+
+
+class SlotIndex(object):
+    __slots__ = ('_trie', '_variants', '_min_variant_length', '_max_variant_length')
+
+    def __init__(self, entries: Iterable[Tuple[str, Any]],
+                 min_variant_length: int = DEFAULT_MIN_VARIANT_LENGTH):
+        """
+        :param entries: (word, value) pairs in priority order; when a slot value
+            starts with more than one known word, the earliest entry wins.
+        :param min_variant_length: shortest word that gets misspelling variants.
+            Variants of short words match far too much.
+        """
+        self._trie: Dict[str, Any] = {}
+        self._variants: Dict[str, Tuple[int, Any]] = {}
+        self._min_variant_length = self._max_variant_length = 0
+        ambiguous = set()
+        words = {}
+        for rank, (word, value) in enumerate(entries):
+            word = word.lower()
+            words.setdefault(word, value)
+            self._insert(word, rank, value)
+            if len(word) < min_variant_length:
+                continue
+            for variant in set(edit_variants(word)):
+                existing = self._variants.get(variant)
+                if existing is None:
+                    self._variants[variant] = (rank, value)
+                elif existing[1] != value:
+                    ambiguous.add(variant)
+        for variant in ambiguous.union(words):
+            self._variants.pop(variant, None)
+        if self._variants:
+            self._min_variant_length = min(map(len, self._variants))
+            self._max_variant_length = max(map(len, self._variants))
+
+    def _insert(self, word: str, rank: int, value: Any) -> None:
+        node = self._trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        if _TERMINAL not in node:
+            node[_TERMINAL] = (rank, value)
+
+    def lookup(self, text: str) -> Optional[Any]:
+        """
+        :param text: lower-cased slot value
+        :returns: the value of the best known word ``text`` starts with, else
+            of the best misspelling variant it starts with, else None.
+        """
+        best = None
+        node = self._trie
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            hit = node.get(_TERMINAL)
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = hit
+        if best is None:
+            for end in range(self._min_variant_length, min(len(text), self._max_variant_length) + 1):
+                hit = self._variants.get(text[:end])
+                if hit is not None and (best is None or hit[0] < best[0]):
+                    best = hit
+        return best[1] if best is not None else None
@@ -1,5 +1,6 @@
 from typing import Union
 import xml.etree.ElementTree as libxml
+from . import metrics
 
 class _Dictable(object):
     def dict(self) -> dict:
@@ -26,6 +27,7 @@ def xml_error(parse_err: libxml.ParseError, txt: str) -> SSMLParseError:
     return SSMLParseError(default_msg)
 
 
+@metrics.timed('validate_ssml')
 def validate_ssml(ssml_str: str):
     try:
         doc: libxml.Element = libxml.fromstring(ssml_str)
@@ -123,6 +125,7 @@ class SpeechletResponse(_Dictable):
         self.attributes = attributes
         self.should_end = should_end
 
+    @metrics.timed('speechlet_response_dict')
     def dict(self) -> dict:
         x = {
             'version': '1.0',
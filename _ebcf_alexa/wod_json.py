@@ -0,0 +1,84 @@
+"""
+Field-selective, incremental parsing of EBCF API responses.
+
+A JSON:API document from the wods endpoint is mostly ``links``,
+``relationships`` and ids we never look at; all the skill uses is
+``data[*].attributes``. For range queries, which can cover months, this
+reads the response a chunk at a time, jumps from one ``"attributes":`` key
+to the next with a regex search, decodes just that object with
+``JSONDecoder.raw_decode`` and keeps only the fields `wods.WOD` reads.
+Everything in between is never decoded, and the whole document is never in
+memory at once: ``bench.wod_json`` shows about the same CPU time as
+``json.load`` (the C decoder is hard to beat) at well under half the peak
+memory on a year-long response.
+"""
+import codecs
+import json
+import re
+from typing import Iterator
+
+WOD_FIELDS = ('date', 'publishDate', 'image', 'strength', 'conditioning')
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_ATTRIBUTES = re.compile(r'"attributes"\s*:\s*(?=\{)')
+"""No lookbehind for an escaping backslash: it makes the search ~15x slower.
+The quote before a match is checked by hand instead."""
+_KEEP_TAIL = 64
+"""Characters kept when no key is found, in case one straddles two chunks."""
+_DECODER = json.JSONDecoder()
+
+
+def iter_wod_attributes(stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Yield the WOD fields of every ``attributes`` object in a response.
+
+    :param stream: file-like object giving bytes (UTF-8) or str
+    :raises ValueError: if the document ends inside an ``attributes`` object
+    """
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+    buf = ''
+    pos = 0
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buf, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        if isinstance(chunk, bytes):
+            # may be '' mid-stream, while a multi-byte character is incomplete
+            chunk = decode(chunk, final=eof)
+        buf += chunk
+        return not eof
+
+    while True:
+        match = _ATTRIBUTES.search(buf, pos)
+        if match is None:
+            buf = buf[max(pos, len(buf) - _KEEP_TAIL):]
+            pos = 0
+            if not read_more():
+                return
+            continue
+        if match.start() and buf[match.start() - 1] == '\\':
+            # an escaped quote inside some string value, not a key
+            pos = match.start() + 1
+            continue
+        try:
+            attributes, end = _DECODER.raw_decode(buf, match.end())
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError('Response ends inside a WOD at offset %d' % match.end())
+            buf = buf[match.start():]
+            pos = 0
+            read_more()
+            continue
+        yield {k: attributes[k] for k in WOD_FIELDS if k in attributes}
+        pos = end
+
+
+def load_wod_attributes(stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Drop-in for ``json.load`` on a wods response: returns a document with
+    only ``data[*].attributes`` (and only the WOD fields of those).
+    """
+    return {'data': [{'attributes': a} for a in iter_wod_attributes(stream, chunk_size)]}
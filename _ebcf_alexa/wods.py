@@ -1,18 +1,25 @@
-from urllib.request import urlopen
+from urllib.request import Request, urlopen
 from urllib.parse import urlencode
 from urllib.error import HTTPError
+from collections import OrderedDict
+import functools
+import gzip
 import json
 import logging
-from datetime import datetime, date as Date
+import os
+from datetime import datetime, timedelta, date as Date
 import sys
 import re
-from typing import List, Iterator, Tuple, Optional
-from . import env
+import threading
+import time
+from typing import Callable, Dict, List, Iterator, Iterable, Sequence, Tuple, Optional
+from . import cache, env, logs, metrics, wod_json
+from .singleflight import SingleFlight
+from .ratelimit import TokenBucket
 
 LOG = logging.getLogger(__name__)
-LOG.setLevel(logging.DEBUG)
 
-URL = 'http://www.elliottbaycrossfit.com/api/v1/wods?'
+URL = os.environ.get('EBCF_API_URL', 'http://www.elliottbaycrossfit.com/api/v1/wods?')
 
 
 def _is_announcement_line(line: str) -> bool:
@@ -64,15 +71,21 @@ def _get_conditioning(conditioning_raw: Optional[str]) -> List[str]:
     return conditioning_raw.strip().splitlines(False)
 
 
+STRENGTH_SECTION = 'Strength Section:'
+CONDITIONING_SECTION = 'Conditioning:'
+
+
 class WOD(object):
     """
     Class representing a WOD from the EBCF API.
     """
     def __init__(self, wod_attributes: dict):
+        self.strength_raw = wod_attributes.get('strength', '')
+        self.conditioning_raw = wod_attributes.get('conditioning', '')
         self.announcement_lines, self.strength_lines = _split_announcement_and_strength(
-            wod_attributes.get('strength', '')
+            self.strength_raw
         )
-        self.conditioning_lines = _get_conditioning(wod_attributes.get('conditioning', ''))
+        self.conditioning_lines = _get_conditioning(self.conditioning_raw)
         self.image = wod_attributes.get('image', None)
         self.datetime = _safe_datetime(wod_attributes.get('date'))
         self.date = None
@@ -103,7 +116,7 @@ class WOD(object):
 
     def strength_ssml(self) -> str:
         if self.strength_lines:
-            return _convert_ssml(self.strength_lines, 'Strength Section:')
+            return _convert_ssml(self.strength_lines, STRENGTH_SECTION)
         return ''
 
     def strength_pprint(self) -> str:
@@ -113,7 +126,7 @@ class WOD(object):
 
     def conditioning_ssml(self) -> str:
         if self.conditioning_lines:
-            return _convert_ssml(self.conditioning_lines, 'Conditioning:')
+            return _convert_ssml(self.conditioning_lines, CONDITIONING_SECTION)
         return ''
 
     def conditioning_pprint(self) -> str:
@@ -136,8 +149,8 @@ class WOD(object):
             'strength': self.strength_raw,
             'conditioning': self.conditioning_raw,
             'image': self.image,
-            'date': self.datetime.strftime(EBCF_API_TSTAMP_FMT),
-            'publishDate': self.publish_datetime.strftime(EBCF_API_TSTAMP_FMT)
+            'date': self.datetime.strftime(EBCF_API_TSTAMP_FMT) if self.datetime else None,
+            'publishDate': self.publish_datetime.strftime(EBCF_API_TSTAMP_FMT) if self.publish_datetime else None
         }
 
 
@@ -179,28 +192,232 @@ def _urlencode_multilevel(obj: dict) -> str:
     return urlencode(flattened_params)
 
 
-def _call_api(params: dict) -> dict:
+_API_FLIGHTS = SingleFlight()
+"""Concurrent identical API queries share one HTTP request."""
+
+
+def _env_rate(name: str, default: float) -> Optional[float]:
+    rate = env.setting(name, default)
+    return rate if rate > 0 else None
+
+
+USER_BUCKET = TokenBucket(_env_rate('EBCF_API_RATE', 2.0),
+                          env.setting('EBCF_API_BURST', 10, int))
+"""Budget for API calls made while a user is waiting. 0 disables the limit."""
+
+BACKGROUND_BUCKET = TokenBucket(_env_rate('EBCF_API_BACKGROUND_RATE', 0.2),
+                                env.setting('EBCF_API_BACKGROUND_BURST', 4, int))
+"""Separate, smaller budget for prefetching, cache priming and syncing."""
+
+
+class RateLimited(Exception):
+    """Raised instead of calling the API when its budget is used up."""
+
+
+VALIDATORS_MAX = 64
+"""How many query URLs we remember ETag/Last-Modified for."""
+
+_VALIDATORS: 'OrderedDict[str, Tuple[Optional[str], Optional[str], str]]' = OrderedDict()
+"""Query URL -> ETag, Last-Modified and the `CACHE` key of the response
+they validate. The response itself lives in `CACHE`, within its budget."""
+_VALIDATORS_LOCK = threading.Lock()
+
+_RESPONSE_PREFIX = 'apiresponse:'
+
+_TRANSFER_LOCK = threading.Lock()
+_TRANSFER = {
+    'bytes_received': 0,
+    'gzip_responses': 0,
+    'not_modified': 0,
+    'modified': 0,
+}
+"""Bytes on the wire, and how conditional requests turned out."""
+
+
+def _count_transfer(key: str, n: int = 1) -> None:
+    with _TRANSFER_LOCK:
+        _TRANSFER[key] += n
+
+
+class _CountingReader(object):
+    """File wrapper counting the bytes read through it."""
+    __slots__ = ('_f', 'bytes')
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes = 0
+
+    def read(self, size: int = -1):
+        data = self._f.read(size)
+        self.bytes += len(data)
+        return data
+
+
+def _header(response, name: str) -> Optional[str]:
+    headers = getattr(response, 'headers', None)
+    value = headers.get(name) if headers is not None else None
+    return value if isinstance(value, str) else None
+
+
+def _read_json(response, load: Callable = json.load) -> dict:
+    """Parse a response body, decompressing gzip as it is read."""
+    counted = _CountingReader(response)
+    stream = counted
+    if _header(response, 'Content-Encoding') == 'gzip':
+        _count_transfer('gzip_responses')
+        stream = gzip.GzipFile(fileobj=counted)
+    try:
+        return load(stream)
+    finally:
+        _count_transfer('bytes_received', counted.bytes)
+
+
+def _cached_response(key: str) -> Optional[dict]:
+    """:returns: the API response `_remember_validators` stored under ``key``, unless it was evicted"""
+    raw = CACHE.get(key)
+    if raw is None:
+        return None
+    try:
+        return json.loads(cache.decompress(raw).decode('utf-8'))
+    except ValueError:
+        LOG.exception('Ignoring cached API response %s', key)
+        return None
+
+
+def _remember_validators(query_url: str, etag: Optional[str], last_modified: Optional[str],
+                         response: dict) -> None:
+    if not (etag or last_modified):
+        with _VALIDATORS_LOCK:
+            _VALIDATORS.pop(query_url, None)
+        return
+    body = json.dumps(response, separators=(',', ':')).encode('utf-8')
+    key = cache.content_key(_RESPONSE_PREFIX, body)
+    CACHE.set(key, cache.compress(body), STALE_TTL_SECONDS)
+    with _VALIDATORS_LOCK:
+        _VALIDATORS[query_url] = (etag, last_modified, key)
+        _VALIDATORS.move_to_end(query_url)
+        while len(_VALIDATORS) > VALIDATORS_MAX:
+            _VALIDATORS.popitem(last=False)
+
+
+def _fetch_json(query_url: str, bucket: TokenBucket, load: Callable = json.load) -> dict:
+    """
+    GET ``query_url`` with gzip, revalidating against the ETag/Last-Modified
+    of the previous response for the same URL so an unchanged result is a
+    bodiless 304, answered from the copy of that response in `CACHE`. If the
+    copy has been evicted since, the GET is made again, unconditionally.
+
+    :param load: parses the (decompressed) response stream
+    """
+    if not bucket.try_acquire():
+        raise RateLimited(query_url)
+    with _VALIDATORS_LOCK:
+        validators = _VALIDATORS.get(query_url)
+    while True:
+        headers = {'Accept-Encoding': 'gzip'}
+        if validators is not None:
+            etag, last_modified, _ = validators
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        LOG.debug('HTTP GET %s', query_url)
+        try:
+            with urlopen(Request(query_url, headers=headers)) as f:
+                response = _read_json(f, load)
+                etag, last_modified = _header(f, 'ETag'), _header(f, 'Last-Modified')
+            break
+        except HTTPError as http_error:
+            if http_error.code == 304 and validators is not None:
+                LOG.debug('Not modified: %s', query_url)
+                _count_transfer('not_modified')
+                response = _cached_response(validators[2])
+                if response is not None:
+                    return response
+                LOG.debug('Response for %s was evicted, asking again', query_url)
+                validators = None
+                continue
+            if http_error.code == 401:
+                # indicates that the wod is not yet released AFAIK
+                return {}
+            else:
+                raise
+    if validators is not None:
+        _count_transfer('modified')
+    _remember_validators(query_url, etag, last_modified, response)
+    return response
+
+
+@metrics.timed('call_api')
+def _call_api(params: dict, background: bool = False, load: Callable = json.load) -> dict:
+    """
+    :param background: True if no user is waiting on this call; it then
+        comes out of the background budget.
+    :param load: parses the response stream; a given query must always be
+        made with the same one, since concurrent calls share the result
+    :raises RateLimited: if the budget for this kind of call is used up
+    """
     LOG.debug('EBCF API params: %s', params)
     query_url = URL + _urlencode_multilevel(params)
-    LOG.debug('HTTP GET %s', query_url)
-    try:
-        with urlopen(query_url) as f:
-            return json.load(f)
-    except HTTPError as http_error:
-        if http_error.code == 401:
-            # indicates that the wod is not yet released AFAIK
-            return {}
-        else:
-            raise
+    bucket = BACKGROUND_BUCKET if background else USER_BUCKET
+    # only calls on the same budget share a flight, and so its RateLimited
+    response, shared = _API_FLIGHTS.do((query_url, background), _fetch_json, query_url, bucket, load)
+    if shared:
+        metrics.incr('api_call_coalesced')
+    return response
+
+
+_stale_served = 0
+
+
+def stats() -> dict:
+    """Counters for tuning the API client."""
+    return {
+        'api_calls': _API_FLIGHTS.calls,
+        'api_calls_coalesced': _API_FLIGHTS.coalesced,
+        'stale_served': _stale_served,
+        'transfer': dict(_TRANSFER),
+        'cache': CACHE.stats(),
+        'ssml_cache': SSML_CACHE.stats(),
+        'decoded': _DECODED.stats(),
+        'publish_times': PUBLISH_TIMES.stats(),
+        'rate_limit': {
+            'user': USER_BUCKET.stats(),
+            'background': BACKGROUND_BUCKET.stats(),
+        },
+    }
+
+
+_WOD_LISTENERS: List[Callable[[WOD], None]] = []
+
+
+def add_wod_listener(listener: Callable[[WOD], None]) -> None:
+    """
+    Call ``listener`` with every WOD parsed from the API or decoded from the
+    cache, e.g. to index them. Listeners must be quick; their errors are
+    logged and otherwise ignored.
+    """
+    _WOD_LISTENERS.append(listener)
+
+
+def _notify_listeners(wod: WOD) -> None:
+    for listener in _WOD_LISTENERS:
+        try:
+            listener(wod)
+        except Exception:
+            LOG.exception('WOD listener %r failed', listener)
 
 
 def _parse_wod_response(api_response: dict) -> Iterator[WOD]:
-    LOG.debug('EBCF API response: %s', api_response)
+    if logs.payload_sampled(LOG):
+        LOG.debug('EBCF API response: %s', logs.Truncated(api_response))
     wod_list = api_response.get('data', [])
     for wod_data in wod_list:
         try:
-            wod = WOD(wod_data['attributes'])
+            with metrics.span('parse_wod_response'):
+                wod = WOD(wod_data['attributes'])
             if wod.has_content():
+                _notify_listeners(wod)
                 yield wod
         except KeyError:
             continue
@@ -209,12 +426,13 @@ def _parse_wod_response(api_response: dict) -> Iterator[WOD]:
 EBCF_RANGE_STRF_FMT = '%Y-%m-%dT%H:%M:%S%z'
 
 
-def get_wods_by_range(start_date: datetime, end_date: datetime) -> List[WOD]:
+def get_wods_by_range(start_date: datetime, end_date: datetime, background: bool = False) -> List[WOD]:
     """
     Gets the WOD by publishDate range.
 
     :param start_date: Start day
     :param end_date: End day
+    :param background: see `_call_api`
     :return: WOD
     :rtype: WOD
     """
@@ -225,24 +443,390 @@ def get_wods_by_range(start_date: datetime, end_date: datetime) -> List[WOD]:
         },
         'enabled': True
     }}}
-    return list(_parse_wod_response(_call_api(params)))
+    # ranges can span months; only decode the attributes we use
+    return list(_parse_wod_response(_call_api(params, background, wod_json.load_wod_attributes)))
+
+
+PUBLISH_SAMPLES_PER_WEEKDAY = 12
+PUBLISH_MIN_SAMPLES = 3
+PUBLISH_QUANTILE = 0.1
+PUBLISH_MARGIN = timedelta(minutes=10)
+"""Subtracted from the learned quantile, since publishing earlier than
+predicted costs users a stale "no WOD" and later only costs a poll."""
 
 
-def get_wod(date: Date) -> WOD:
+class PublishTimes(object):
+    """
+    Learns when WODs get published, from the WODs that go by (fetched or
+    read back from the cache): for each weekday in `env.TZ`, the offsets of
+    the last ``PUBLISH_SAMPLES_PER_WEEKDAY`` WODs' publishDate from local
+    midnight of their date. WODs usually go up the evening before, so the
+    offsets are mostly negative.
     """
-    gets the WOD for a specific day.
 
-    :param datetime.date date: the date
-    :returns: wod data or None if not found
-    :rtype: WOD
+    def __init__(self, per_weekday: int = PUBLISH_SAMPLES_PER_WEEKDAY):
+        self._lock = threading.Lock()
+        self._per_weekday = per_weekday
+        self._offsets: Dict[int, Dict[Date, float]] = {weekday: {} for weekday in range(7)}
+        """weekday -> WOD date -> seconds from local midnight to publish"""
+
+    def clear(self) -> None:
+        with self._lock:
+            for offsets in self._offsets.values():
+                offsets.clear()
+
+    @staticmethod
+    def _midnight(date: Date) -> datetime:
+        return env.TZ.localize(datetime(date.year, date.month, date.day))
+
+    def observe(self, wod: WOD) -> None:
+        if wod.date is None or wod.publish_datetime is None:
+            return
+        offset = (wod.publish_datetime - self._midnight(wod.date)).total_seconds()
+        with self._lock:
+            offsets = self._offsets[wod.date.weekday()]
+            offsets[wod.date] = offset
+            if len(offsets) > self._per_weekday:
+                del offsets[min(offsets)]
+
+    def earliest(self, date: Date, quantile: float = PUBLISH_QUANTILE) -> Optional[datetime]:
+        """
+        The earliest instant the WOD for ``date`` is likely to be published:
+        a low quantile of that weekday's offsets (of every weekday's while
+        there are too few), less ``PUBLISH_MARGIN``.
+
+        :returns: an aware datetime, or None until enough WODs have been seen
+        """
+        with self._lock:
+            offsets = list(self._offsets[date.weekday()].values())
+            if len(offsets) < PUBLISH_MIN_SAMPLES:
+                offsets = [o for by_date in self._offsets.values() for o in by_date.values()]
+        if len(offsets) < PUBLISH_MIN_SAMPLES:
+            return None
+        offsets.sort()
+        offset = offsets[int(quantile * (len(offsets) - 1))]
+        return (self._midnight(date) + timedelta(seconds=offset) - PUBLISH_MARGIN).astimezone(env.UTC)
+
+    def seconds_until(self, date: Date) -> float:
+        """How long until `earliest` for ``date``; 0 if it has passed or isn't known."""
+        earliest = self.earliest(date)
+        if earliest is None:
+            return 0.0
+        return max((earliest - env.now()).total_seconds(), 0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'samples': sum(len(offsets) for offsets in self._offsets.values())}
+
+
+PUBLISH_TIMES = PublishTimes()
+add_wod_listener(PUBLISH_TIMES.observe)
+
+
+CACHE_TTL_SECONDS = 10 * 60
+"""How long a fetched WOD is served from cache before we ask the API again."""
+
+NEGATIVE_CACHE_TTL_SECONDS = 60
+"""How long we remember that a day had no (released) WOD, at least."""
+MAX_NEGATIVE_CACHE_TTL_SECONDS = 30 * 60
+"""The longest we remember that a day had no WOD when `PUBLISH_TIMES` says
+it won't be out for a while yet. Kept short: a WOD posted earlier than
+usual shouldn't go unheard for long."""
+
+STALE_TTL_SECONDS = 24 * 60 * 60
+"""How long entries stay in the cache backend after they stop being fresh,
+so there is something to serve when the API budget runs out."""
+
+CACHE = cache.configure(os.environ.get('EBCF_CACHE', 'memory'))
+"""Where fetched WODs are shared, e.g.
+``EBCF_CACHE=memory,memcached:10.0.0.12:11211``. See `cache.configure`."""
+
+SSML_CACHE = cache.MemoryCache(env.setting('EBCF_SSML_CACHE_BYTES', 512 * 1024, int))
+"""Rendered SSML sections, keyed by a hash of the section's raw text."""
+SSML_CACHE_TTL_SECONDS = 24 * 60 * 60
+"""Rendering is deterministic; this only bounds how long an unused entry
+lingers when the cache isn't full."""
+
+
+class _DecodedEntries(object):
+    """
+    Last decoded entry per cache key, so repeated hits on unchanged bytes
+    skip parsing and keep returning the same WOD object. LRU, bounded by
+    roughly the bytes its entries take up, like `cache.MemoryCache`.
+    """
+
+    WOD_OVERHEAD_BYTES = 1024
+    """Rough cost of a WOD object beyond its text: attributes, lists, dates."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Tuple[bytes, float, Optional[WOD], int]]' = OrderedDict()
+
+    @classmethod
+    def _size(cls, key: str, raw: bytes, wod: Optional[WOD]) -> int:
+        size = len(key) + len(raw) + cache.ENTRY_OVERHEAD_BYTES
+        if wod is not None:
+            # the raw text, and again split into lines
+            size += 2 * (len(wod.strength_raw) + len(wod.conditioning_raw)) + cls.WOD_OVERHEAD_BYTES
+        return size
+
+    def get(self, key: str, raw: bytes) -> Optional[Tuple[float, Optional[WOD]]]:
+        """:returns: (fresh until, WOD) decoded from ``raw``, if that's what was last decoded for ``key``"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != raw:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key: str, raw: bytes, fresh_until: float, wod: Optional[WOD]) -> None:
+        size = self._size(key, raw, wod)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[3]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (raw, fresh_until, wod, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted[3]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        return {'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                'evictions': self.evictions}
+
+
+_DECODED = _DecodedEntries(env.setting('EBCF_DECODED_CACHE_BYTES', 512 * 1024, int))
+"""Decoded WODs, in their own byte budget next to `CACHE` and `SSML_CACHE`."""
+
+
+def clear_cache() -> None:
+    """Forget every cached WOD, rendered section and stored API response."""
+    CACHE.clear()
+    SSML_CACHE.clear()
+    _DECODED.clear()
+    with _VALIDATORS_LOCK:
+        _VALIDATORS.clear()
+
+
+def _cache_key(date: Date) -> str:
+    return 'wod:' + date.isoformat()
+
+
+_BODY_PREFIX = 'wodbody:'
+
+
+def _encode_entry(fresh_until: float, wod: Optional[WOD]) -> Tuple[bytes, Optional[Tuple[str, bytes]]]:
+    """
+    Serialize a day's cache entry. The workout text lives in a separate body
+    entry keyed by its hash, so a workout that is programmed again on another
+    day is stored once.
+
+    :returns: the day's entry, and the (key, value) of the body it points at
+    """
+    if wod is None:
+        entry = {'f': round(fresh_until, 3), 'w': None}
+        return cache.compress(json.dumps(entry, separators=(',', ':')).encode('utf-8')), None
+    attributes = wod.as_wod_attributes()
+    body = json.dumps([attributes.pop('strength'), attributes.pop('conditioning')],
+                      separators=(',', ':')).encode('utf-8')
+    attributes['body'] = body_key = cache.content_key(_BODY_PREFIX, body)
+    entry = {'f': round(fresh_until, 3), 'w': attributes}
+    return cache.compress(json.dumps(entry, separators=(',', ':')).encode('utf-8')), (body_key, cache.compress(body))
+
+
+def _decode_entry(key: str, raw: bytes) -> Optional[Tuple[float, Optional[WOD]]]:
+    """
+    :returns: (fresh until, WOD), or None if the body has been evicted
+    :raises ValueError: if ``raw`` is not an entry written by `_encode_entry`
     """
+    decoded = _DECODED.get(key, raw)
+    if decoded is not None:
+        return decoded
+    try:
+        entry = json.loads(cache.decompress(raw).decode('utf-8'))
+        fresh_until = float(entry['f'])
+        attributes = entry['w']
+        wod = None
+        if attributes is not None:
+            body = CACHE.get(attributes.pop('body'))
+            if body is None:
+                LOG.debug('WOD body for %s was evicted', key)
+                return None
+            attributes['strength'], attributes['conditioning'] = json.loads(cache.decompress(body).decode('utf-8'))
+            wod = WOD(attributes)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError('Bad WOD cache entry: %s' % e)
+    if wod is not None:
+        _notify_listeners(wod)
+    _DECODED.put(key, raw, fresh_until, wod)
+    return fresh_until, wod
+
+
+def _fetch_wod(date: Date, background: bool) -> Optional[WOD]:
     params = {'filter': {'simple': {
         'date': date.strftime('%Y-%m-%d') + 'T00:00:00.000Z',
         'enabled': True
     }}}
-    for wod in _parse_wod_response(_call_api(params)):
+    for wod in _parse_wod_response(_call_api(params, background)):
         if wod.date == date:
             return wod
+    return None
+
+
+def _cached_entry(date: Date) -> Optional[Tuple[float, Optional[WOD]]]:
+    """:returns: (fresh until, WOD) from the cache, fresh or not, or None"""
+    key = _cache_key(date)
+    raw = CACHE.get(key)
+    if raw is None:
+        return None
+    try:
+        return _decode_entry(key, raw)
+    except ValueError:
+        LOG.exception('Ignoring WOD cache entry for %s', date)
+        return None
+
+
+def _negative_ttl(date: Date) -> float:
+    return min(max(NEGATIVE_CACHE_TTL_SECONDS, PUBLISH_TIMES.seconds_until(date)),
+               MAX_NEGATIVE_CACHE_TTL_SECONDS)
+
+
+def _store_wod(date: Date, wod: Optional[WOD], now: float) -> None:
+    key = _cache_key(date)
+    ttl = CACHE_TTL_SECONDS if wod is not None else _negative_ttl(date)
+    raw, body = _encode_entry(now + ttl, wod)
+    _DECODED.put(key, raw, now + ttl, wod)
+    if body is not None:
+        CACHE.set(body[0], body[1], ttl + STALE_TTL_SECONDS)
+    CACHE.set(key, raw, ttl + STALE_TTL_SECONDS)
+
+
+def _serve_stale(what: object) -> None:
+    global _stale_served
+    LOG.warning('API budget used up, serving stale WOD for %s', what)
+    metrics.incr('wod_stale_served')
+    _stale_served += 1
+
+
+def get_wod(date: Date, background: bool = False, on_miss: Optional[Callable[[], None]] = None) -> WOD:
+    """
+    gets the WOD for a specific day.
+
+    Results (including "there is no WOD") are kept in `CACHE` for a while,
+    so neither a warm lambda container nor its siblings sharing the cache hit
+    the API for every request. If the API budget is used up, an expired
+    entry is served rather than waiting.
+
+    :param datetime.date date: the date
+    :param background: True if no user is waiting for the answer
+    :param on_miss: called before going to the API, e.g. to tell the user
+        to hang on
+    :returns: wod data or None if not found
+    :rtype: WOD
+    :raises RateLimited: if over budget and there is nothing cached at all
+    """
+    now = time.time()
+    cached = _cached_entry(date)
+    if cached is not None and cached[0] > now:
+        LOG.debug('WOD cache hit for %s', date)
+        metrics.incr('wod_cache_hit')
+        return cached[1]
+    metrics.incr('wod_cache_miss')
+    if on_miss is not None:
+        on_miss()
+    try:
+        wod = _fetch_wod(date, background)
+    except RateLimited:
+        if cached is None:
+            raise
+        _serve_stale(date)
+        return cached[1]
+    _store_wod(date, wod, now)
+    return wod
+
+
+def get_wods(dates: Sequence[Date], background: bool = False) -> Dict[Date, Optional[WOD]]:
+    """
+    The WODs for several days, mostly from one API call: if any day isn't
+    freshly cached, one publishDate range query covering all of them is made
+    and each stale day's result is cached, as `get_wod` would. Freshly cached
+    days are left alone. A stale day that had a WOD but is missing from the
+    range (published earlier than its padding) is fetched on its own rather
+    than forgotten.
+
+    :returns: date -> WOD, or None for days without one
+    :raises RateLimited: if over budget and none of the days are cached
+    """
+    now = time.time()
+    cached = {date: _cached_entry(date) for date in dates}
+    if all(c is not None and c[0] > now for c in cached.values()):
+        metrics.incr('wod_cache_hit', len(cached))
+        return {date: c[1] for date, c in cached.items()}
+    metrics.incr('wod_cache_miss')
+    # WODs are published the evening before (local time), so pad the range
+    # by a day each way and match on the WOD's own date
+    first, last = min(cached), max(cached)
+    start = env.UTC.localize(datetime(first.year, first.month, first.day)) - timedelta(days=1)
+    end = env.UTC.localize(datetime(last.year, last.month, last.day)) + timedelta(days=2)
+    try:
+        fetched = get_wods_by_range(start, end, background)
+    except RateLimited:
+        if all(c is None for c in cached.values()):
+            raise
+        _serve_stale('%s..%s' % (first, last))
+        return {date: c[1] if c is not None else None for date, c in cached.items()}
+    by_date = {wod.date: wod for wod in fetched if wod.date in cached}
+    found = {}
+    for date, c in cached.items():
+        if c is not None and c[0] > now:
+            found[date] = c[1]
+        elif date not in by_date and c is not None and c[1] is not None:
+            found[date] = get_wod(date, background)
+        else:
+            _store_wod(date, by_date.get(date), now)
+            found[date] = by_date.get(date)
+    return found
+
+
+def refresh_wod(date: Date, background: bool = True) -> Optional[WOD]:
+    """
+    Fetch the WOD for ``date`` whether or not it is freshly cached, e.g. to
+    catch it the moment it is published, and cache the result.
+
+    :returns: the WOD, or None if it isn't out yet
+    :raises RateLimited: if over budget
+    """
+    now = time.time()
+    wod = _fetch_wod(date, background)
+    _store_wod(date, wod, now)
+    return wod
+
+
+def prime_cache(dates: Iterable[Date]) -> None:
+    """
+    Fetch the WODs for ``dates`` into the cache ahead of any user asking for
+    them, out of the background API budget. Failures are logged and
+    otherwise ignored.
+    """
+    for date in dates:
+        try:
+            get_wod(date, background=True)
+        except RateLimited:
+            LOG.info('API budget used up, not priming WOD cache for %s', date)
+        except Exception:
+            LOG.exception('Failed to prime WOD cache for %s', date)
 
 
 _ALIASES = {
@@ -253,28 +837,35 @@ _ALIASES = {
     r'E(\d)MOM': r'every \1 minutes on the minute',
     r'HSPU': r'hand stand push ups',
     r'#': r'<sub alias="pounds">#</sub>',
-    r'(\d+)"': r'\1<sub alias="inches">"</sub>',
-    r'(\d+)\'': r'\1<sub alias="feet">\'</sub>',
+    r'(?<!\d)(\d+)"': r'\1<sub alias="inches">"</sub>',
+    r'(?<!\d)(\d+)\'': r'\1<sub alias="feet">\'</sub>',
     r'&': 'and',
-    r'(\d+) [Ss]ec\.? ': r'\1 second ',
+    r'(?<!\d)(\d+) [Ss]ec\.? ': r'\1 second ',
     r'\bT2B\b': r'<sub alias="toes to bar">T2B</sub>',  # T2B => toes 2 bar
     r'( ?)\bx ?(\b\d+\b)': r'\1times \2',  # 'x3' or ' x 3' => times 3
     r' \+ ': '<break strength="strong"/> + ', # slow down between plusses
 }
+# A bare (\d+) is tried at every digit of a run, rescanning the rest of it
+# each time: quadratic in the run's length. (?<!\d) only lets it start at the
+# beginning of a run, where the longest (and so the same) match starts anyway.
+# See bench/tts_regex.py.
+_ALIAS_RXS = [(re.compile(pattern), replacement) for pattern, replacement in _ALIASES.items()]
+_SETS_RX = re.compile(r'(?<!\d)(\d+)x(\d+)')
+_RX_RX = re.compile(r'(?<!\d)(\d+[#"\'])/(\d+[#"\'])')
 
 
 def _inject_aliases(text: str) -> str:
-    for key, replacement in _ALIASES.items():
-        text = re.sub(key, replacement, text)
+    for rx, replacement in _ALIAS_RXS:
+        text = rx.sub(replacement, text)
     return text
 
 
 def _fix_sets(text: str) -> str:
-    return re.sub(r'(\d+)x(\d+)', r'\1 sets of \2', text)
+    return _SETS_RX.sub(r'\1 sets of \2', text)
 
 
 def _fix_rx(text: str) -> str:
-    return re.sub(r'(\d+[#"\'])/(\d+[#"\'])', r'<prosody rate="fast">\1 male, \2 female</prosody>', text)
+    return _RX_RX.sub(r'<prosody rate="fast">\1 male, \2 female</prosody>', text)
 
 
 def _clean_illegal_ssml_chars(text: str) -> str:
@@ -288,18 +879,99 @@ def _massage_for_tts(text: str) -> str:
     return text
 
 
-def _convert_ssml(lines: List[str], section: str) -> str:
+@metrics.timed('convert_ssml')
+def _convert_ssml(lines: List[str], section: str, share: bool = False) -> str:
+    """
+    :param share: also put the rendered SSML in `CACHE`, for every container
+        sharing it (see `share_rendered`)
+    """
+    source = json.dumps([section, lines], separators=(',', ':')).encode('utf-8')
+    key = cache.content_key('ssml:', source)
+    packed = SSML_CACHE.get(key)
+    if packed is not None:
+        metrics.incr('ssml_cache_hit')
+    else:
+        packed = CACHE.get(key)  # rendered ahead of time by a scheduled refresh
+        if packed is not None:
+            metrics.incr('ssml_shared_hit')
+            SSML_CACHE.set(key, packed, SSML_CACHE_TTL_SECONDS)
+    if packed is None:
+        ssml = _render_ssml(lines, section)
+        packed = cache.compress(ssml.encode('utf-8'))
+        SSML_CACHE.set(key, packed, SSML_CACHE_TTL_SECONDS)
+    else:
+        ssml = cache.decompress(packed).decode('utf-8')
+    if share:
+        CACHE.set(key, packed, SSML_CACHE_TTL_SECONDS)
+    return ssml
+
+
+def share_rendered(wod: WOD) -> None:
+    """
+    Render every section of ``wod`` into `SSML_CACHE` and `CACHE`, so the
+    first user in any container sharing `CACHE` gets it without rendering.
+    """
+    if wod.strength_lines:
+        _convert_ssml(wod.strength_lines, STRENGTH_SECTION, share=True)
+    if wod.conditioning_lines:
+        _convert_ssml(wod.conditioning_lines, CONDITIONING_SECTION, share=True)
+
+
+def _render_ssml(lines: List[str], section: str) -> str:
     section = '<p>%s</p>' % section
     new_lines = [
-        '<s>{}</s>'.format(_massage_for_tts(l))
-        for l in lines
+        '<s>{}</s>'.format(l)
+        for l in tts_lines(lines)
     ]
     return section + ''.join(new_lines)
 
 
+_LINE_SEP = '\x1e'
+"""ASCII record separator; none of the TTS patterns can match across it."""
+
+
+def tts_lines(lines: Sequence[str]) -> List[str]:
+    """
+    Massage many lines for TTS in one pass: the lines are joined, every
+    substitution runs once over the whole text, and the result is split
+    again. Same output as massaging line by line, at a fraction of the
+    regex calls.
+    """
+    if not lines:
+        return []
+    if any(_LINE_SEP in l for l in lines):
+        return [_massage_for_tts(l) for l in lines]
+    return _massage_for_tts(_LINE_SEP.join(lines)).split(_LINE_SEP)
+
+
 EBCF_API_TSTAMP_FMT = '%Y-%m-%dT%H:%M:%S.000Z'
 
 
+_MIDNIGHT_SUFFIX = 'T00:00:00.000Z'
+_API_TSTAMP_RX = re.compile(r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.000Z', re.ASCII)
+
+
+def _parse_api_timestamp(datestr: str) -> datetime:
+    """
+    Parse ``YYYY-MM-DDTHH:MM:SS.000Z`` by checking the layout with a regex
+    and handing the fields to ``fromisoformat``, which is several times faster
+    than strptime (and doesn't take its lock). Anything that isn't laid out
+    exactly like that goes to strptime, so what is accepted doesn't change.
+
+    :raises ValueError: if it isn't a timestamp
+    """
+    if _API_TSTAMP_RX.fullmatch(datestr):
+        return datetime.fromisoformat(datestr[:19]).replace(tzinfo=env.UTC)
+    return env.UTC.localize(datetime.strptime(datestr, EBCF_API_TSTAMP_FMT))
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_midnight(datestr: str) -> datetime:
+    """WOD ``date`` values are always midnight, and the same days come back
+    over and over."""
+    return _parse_api_timestamp(datestr)
+
+
 def _safe_datetime(datestr: str) -> datetime:
     """Tries to convert a timestamp into a datetime object, without crashing.
 
@@ -309,8 +981,10 @@ def _safe_datetime(datestr: str) -> datetime:
     if not datestr:
         return None
     try:
-        return env.UTC.localize(datetime.strptime(datestr, EBCF_API_TSTAMP_FMT))
-    except ValueError:
+        if datestr.endswith(_MIDNIGHT_SUFFIX):
+            return _parse_midnight(datestr)
+        return _parse_api_timestamp(datestr)
+    except (ValueError, TypeError, AttributeError):
         return None
 
 
@@ -0,0 +1,16 @@
+"""
+Benchmarks and load-testing tools. These are not part of the deployed
+package; run them from the repository root, e.g.::
+
+    $ python3 -m bench.incoming_types
+    $ python3 -m bench.standin --port 4500
+"""
+import timeit
+from typing import Callable
+
+
+def report(name: str, func: Callable[[], object], number: int = 10000, repeat: int = 5) -> float:
+    """Time ``func`` and print the best per-call time in microseconds."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print('{:<50} {:>10.2f} us'.format(name, best * 1e6))
+    return best
@@ -0,0 +1,80 @@
+"""
+Benchmarks ``LambdaEvent`` parsing for events with a large ``context`` and
+``sessionAttributes``, comparing the access pattern of the lambda handler
+(application id, request type, intent) against touching every section.
+"""
+import copy
+from _ebcf_alexa.incoming_types import LambdaEvent
+from . import report
+
+
+def _big_event(n_attribute_intents: int = 50, n_interfaces: int = 200) -> dict:
+    slots = {
+        'RelativeTo': {'name': 'RelativeTo', 'value': "today's"},
+        'RequestType': {'name': 'RequestType', 'value': 'workout'},
+    }
+    return {
+        'version': '1.0',
+        'session': {
+            'new': False,
+            'sessionId': 'amzn1.echo-api.session.bench',
+            'application': {'applicationId': 'amzn1.ask.skill.d6f2f7c4-7689-410d-9c35-8f8baae37969'},
+            'user': {'userId': 'amzn1.ask.account.' + 'X' * 200},
+            'attributes': {'intents': dict(
+                {'Intent%d' % i: {'name': 'Intent%d' % i, 'slots': copy.deepcopy(slots)}
+                 for i in range(n_attribute_intents)},
+                DefaultQuery={'name': 'DefaultQuery', 'slots': copy.deepcopy(slots)},
+            )},
+        },
+        'context': {
+            'AudioPlayer': {'playerActivity': 'IDLE'},
+            'Display': {'token': ''},
+            'System': {
+                'application': {'applicationId': 'amzn1.ask.skill.d6f2f7c4-7689-410d-9c35-8f8baae37969'},
+                'user': {'userId': 'amzn1.ask.account.' + 'X' * 200},
+                'device': {
+                    'deviceId': 'amzn1.ask.device.' + 'X' * 200,
+                    'supportedInterfaces': {'Interface%d' % i: {'version': '1.0'}
+                                            for i in range(n_interfaces)},
+                },
+                'apiEndpoint': 'https://api.amazonalexa.com',
+            },
+        },
+        'request': {
+            'type': 'IntentRequest',
+            'requestId': 'amzn1.echo-api.request.bench',
+            'timestamp': '2017-10-28T18:42:10Z',
+            'locale': 'en-US',
+            'intent': {'name': 'DefaultQuery', 'slots': {
+                'RelativeTo': {'name': 'RelativeTo'},
+                'RequestType': {'name': 'RequestType', 'value': 'strength'},
+            }},
+        },
+    }
+
+
+def handler_access(event_dict: dict) -> LambdaEvent:
+    event = LambdaEvent(event_dict)
+    event.session.application.application_id
+    event.request.type
+    event.request.intent.slots
+    return event
+
+
+def full_access(event_dict: dict) -> None:
+    event = handler_access(event_dict)
+    event.session.user.user_id
+    event.session.attributes.intents
+    event.context.system.device.supported_interfaces
+    event.context.system.user.user_id
+    event.context.audio_player.activity
+
+
+def main() -> None:
+    event_dict = _big_event()
+    report('LambdaEvent: handler access pattern', lambda: handler_access(event_dict))
+    report('LambdaEvent: every section materialized', lambda: full_access(event_dict))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Movement index build and query times over years of synthetic WODs::
+
+    $ python3 -m bench.movement_index
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+import itertools
+
+from _ebcf_alexa import movement_index, wods
+from . import report
+from .standin import wod_attributes
+
+
+def _scan(history: list, term: str, start: date, end: date) -> int:
+    return sum(start <= wod.date <= end and term in movement_index.wod_terms(wod) for wod in history)
+
+
+def _bisect(postings: list, start: date, end: date) -> int:
+    return bisect_right(postings, end) - bisect_left(postings, start)
+
+
+def main() -> None:
+    for years in (1, 3, 10):
+        first = date(2010, 1, 1)
+        history = [wods.WOD(wod_attributes(first + timedelta(days=i))) for i in range(365 * years)]
+        index = movement_index.MovementIndex()
+
+        def build():
+            index.clear()
+            for wod in history:
+                index.add(wod)
+
+        print('{} years, {} WODs'.format(years, len(history)))
+        report('  build (in date order)', build, number=1, repeat=3)
+        end = history[-1].date
+        start = movement_index.period_start('quarter', end)
+        postings = index.dates('deadlift')
+        assert index.count('deadlift', start, end) == _bisect(postings, start, end)
+        report('  count this quarter (prefix sums)', lambda: index.counts.count('deadlift', start, end), 100000)
+        report('  count this quarter (bisect postings)', lambda: _bisect(postings, start, end), 100000)
+        report('  count this quarter (query normalized)', lambda: index.count('deadlifts', start, end), 20000)
+        report('  count this quarter (scan WODs)', lambda: _scan(history, 'deadlift', start, end), 3, repeat=3)
+        year_ago = history[-365]
+        changed = wods.WOD(dict(year_ago.as_wod_attributes(), strength='Muscle Ups'))
+        versions = itertools.cycle([changed, year_ago])  # every add changes the day
+        report('  reindex a day a year back', lambda: index.add(next(versions)), 1000)
+        print('  {} terms, {} KiB of prefix sums'.format(
+            len(index._postings), round(index.counts.nbytes() / 1024)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Differential fuzzing of the SSML renderers: proof that a faster renderer
+says exactly what the reference says::
+
+    $ python3 -m bench.ssml_diff --cases 5000
+    $ python3 -m bench.ssml_diff --candidate mybranch.renderer:FastRenderer --seed 7
+
+The expected SSML in test_wods.py and test_e2e.py is byte-exact, and a few
+hand-written cases don't cover what gym staff actually type. This makes up
+realistic WODs (set schemes, Rx weights, units, announcements, ``&`` and
+unicode, now and then a stray ``<``) and renders each with the frozen
+`bench.ssml_reference.ReferenceRenderer` and with a candidate: by default
+the current tree (`CurrentRenderer`), or any class with the same methods.
+Each part (announcement, strength, conditioning, and validation of the
+whole) must come out identical.
+
+The first divergence is shrunk, dropping lines and then characters for as
+long as it still diverges, and printed with both outputs. Time spent in
+each renderer is added up per part and reported as candidate/reference.
+Exits non-zero on a divergence.
+"""
+import argparse
+import importlib
+import random
+import sys
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from _ebcf_alexa import speechlet, wods
+from .ssml_reference import ReferenceRenderer
+
+PARTS = ('announcement_ssml', 'strength_ssml', 'conditioning_ssml', 'validate')
+
+_MOVEMENTS = [
+    'Back Squat', 'Front Squat', 'Deadlift', 'Push Press', 'OH Squat', 'OH Lunges', 'DB Snatches',
+    'KB Swings', 'HSPU', 'T2B', 'Strict T2B', 'Pull-ups', 'Wall Balls', 'Cal Row', 'Burpees',
+    'Box Jumps', 'Double Unders', 'Thrusters', 'Clean & Jerk', 'Power Snatch', 'Run', 'Handstand Hold',
+]
+_SCHEMES = [
+    '{s}x{r}', '{s} x {r}', '{s}x{r} @ {p}%', 'x{r}', 'x {r}', '{r} reps', '{r}-{r}-{s}-{s}',
+    'E{k}MOM', 'EMOM for {m} Min', '{m} Min AMRAP', '{s} Rounds', '{t} sec hold ', '{t} Sec. rest ',
+    '{t}sec', '{r}m', '({t} sec down, {k} sec pause)', '{m} Min Cap', 'every {k} min x {s}',
+]
+_RX = ['{m}#/{f}#', '{m}"/{f}"', "{m}'/{f}'", '{m}#', '{m}"', '({m}/{f})', '{m}/{f}#', '@ {m}#']
+_JOINERS = [' + ', ' & ', ', ', ' then ', ' / ', ' ', '+', '&']
+_UNICODE = ['½', '×', '–', '’', 'é', 'ü', '“95#”', '💪', ' ', '°', '→']
+_STRAY = ['<', '>', '&amp;', '"', "'", '\x1e', '\t']
+_ANNOUNCEMENTS = [
+    'HAPPY BIRTHDAY {name}!!!!', 'NO 6AM CLASS TOMORROW', 'NO EVENING CLASSES TODAY',
+    'Welcome back & congrats {name}!!', 'BRING A FRIEND FRIDAY', 'PARKING LOT CLOSED 7/4 & 7/5',
+]
+_NAMES = ['KELSEY', 'ROHAN', 'José', 'ZOË', "O'BRIEN"]
+
+
+def _fill(rng: random.Random, template: str) -> str:
+    return template.format(s=rng.randint(1, 12), r=rng.randint(1, 50), p=rng.choice([65, 70, 75, 80, 85]),
+                           k=rng.randint(2, 5), m=rng.randint(5, 315), f=rng.randint(5, 225),
+                           t=rng.choice([5, 10, 15, 20, 30, 60, 90]), name=rng.choice(_NAMES))
+
+
+def _line(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.choice([1, 1, 1, 2, 3])):
+        part = []
+        if rng.random() < 0.4:
+            part.append(str(rng.randint(1, 50)))
+        part.append(rng.choice(_MOVEMENTS))
+        if rng.random() < 0.6:
+            part.append(_fill(rng, rng.choice(_SCHEMES)))
+        if rng.random() < 0.4:
+            part.append(_fill(rng, rng.choice(_RX)))
+        if rng.random() < 0.15:
+            part.append(rng.choice(_UNICODE))
+        if rng.random() < 0.1:
+            rng.shuffle(part)
+        parts.append(' '.join(part))
+    line = rng.choice(_JOINERS).join(parts)
+    if rng.random() < 0.03:
+        at = rng.randint(0, len(line))
+        line = line[:at] + rng.choice(_STRAY) + line[at:]
+    return line
+
+
+def random_wod(rng: random.Random) -> dict:
+    """Raw WOD attributes, the way the API hands them over."""
+    strength = [_line(rng) for _ in range(rng.randint(0, 4))]
+    if rng.random() < 0.2:
+        announcements = [_fill(rng, rng.choice(_ANNOUNCEMENTS)) for _ in range(rng.randint(1, 2))]
+        strength = announcements + [''] * rng.randint(0, 1) + strength
+    conditioning = [_fill(rng, rng.choice(_SCHEMES))] + [_line(rng) for _ in range(rng.randint(0, 6))]
+    if rng.random() < 0.2:
+        conditioning.insert(rng.randint(0, len(conditioning)), '')
+    return {'date': '2017-07-03T00:00:00.000Z', 'strength': '\n'.join(strength),
+            'conditioning': '\n'.join(conditioning)}
+
+
+class CurrentRenderer(object):
+    """The renderers in this tree, as the skill calls them."""
+
+    name = 'current'
+
+    def strength_ssml(self, wod: wods.WOD) -> str:
+        return wod.strength_ssml()
+
+    def conditioning_ssml(self, wod: wods.WOD) -> str:
+        return wod.conditioning_ssml()
+
+    def announcement_ssml(self, wod: wods.WOD) -> str:
+        return wod.announcement_ssml()
+
+    def validate(self, ssml: str) -> Optional[str]:
+        try:
+            speechlet.validate_ssml(ssml)
+        except speechlet.SSMLParseError as e:
+            return 'not <speak>' if str(e).startswith('ssml must start') else 'parse error'
+        return None
+
+
+def _render(renderer, part: str, wod: wods.WOD, reference: ReferenceRenderer) -> object:
+    if part != 'validate':
+        return getattr(renderer, part)(wod)
+    # validate what the reference says, and the raw text as if it were SSML
+    full = ''.join(getattr(reference, p)(wod) for p in PARTS[:3])
+    return renderer.validate('<speak>%s</speak>' % full), \
+        renderer.validate('<speak>%s</speak>' % wod.strength_raw)
+
+
+class Divergence(NamedTuple):
+    part: str
+    attributes: dict
+    expected: object
+    got: object
+
+    def __str__(self):
+        return '\n'.join([
+            'DIVERGENCE in {}'.format(self.part),
+            '  strength:     {!r}'.format(self.attributes['strength']),
+            '  conditioning: {!r}'.format(self.attributes['conditioning']),
+            '  reference:    {!r}'.format(self.expected),
+            '  candidate:    {!r}'.format(self.got),
+        ])
+
+
+def diverges(candidate, attributes: dict, part: str,
+             reference: ReferenceRenderer = ReferenceRenderer()) -> Optional[Divergence]:
+    """:returns: how ``candidate`` renders ``part`` of the WOD differently, if it does"""
+    wod = wods.WOD(attributes)
+    try:
+        got = _render(candidate, part, wod, reference)
+    except Exception as e:
+        got = e
+    expected = _render(reference, part, wod, reference)
+    if type(got) is type(expected) and got == expected:
+        return None
+    return Divergence(part, attributes, expected, got)
+
+
+def _shrink_text(text: str, fails: Callable[[str], bool]) -> str:
+    """Drop lines, then ever smaller runs of characters, while ``fails`` still holds."""
+    lines = text.split('\n')
+    i = 0
+    while i < len(lines) and len(lines) > 1:
+        candidate = lines[:i] + lines[i + 1:]
+        if fails('\n'.join(candidate)):
+            lines = candidate
+        else:
+            i += 1
+    text = '\n'.join(lines)
+    chunk = max(len(text) // 2, 1)
+    while chunk >= 1:
+        i = 0
+        while i < len(text):
+            candidate = text[:i] + text[i + chunk:]
+            if fails(candidate):
+                text = candidate
+            else:
+                i += chunk
+        chunk //= 2
+    return text
+
+
+def minimize(candidate, divergence: Divergence) -> Divergence:
+    """The same divergence, on as little WOD text as will still show it."""
+    attributes = dict(divergence.attributes)
+    for field in ('strength', 'conditioning'):
+        def fails(text: str) -> bool:
+            return diverges(candidate, dict(attributes, **{field: text}), divergence.part) is not None
+        attributes[field] = _shrink_text(attributes[field], fails)
+    return diverges(candidate, attributes, divergence.part) or divergence
+
+
+class Result(NamedTuple):
+    cases: int
+    divergence: Optional[Divergence]
+    seconds: Dict[str, Tuple[float, float]]
+    """part -> (reference, candidate) seconds"""
+
+    def speedups(self) -> Dict[str, float]:
+        return {part: ref / cand if cand else float('inf') for part, (ref, cand) in self.seconds.items()}
+
+
+def _timed(func: Callable[[], object]) -> Tuple[object, float]:
+    start = time.perf_counter()
+    try:
+        value = func()
+    except Exception as e:
+        value = e
+    return value, time.perf_counter() - start
+
+
+def run(candidate=None, cases: int = 1000, seed: int = 0, parts: Sequence[str] = PARTS) -> Result:
+    """
+    Render ``cases`` random WODs with the reference and ``candidate``
+    (default `CurrentRenderer`), stopping at the first divergence, minimized.
+    """
+    candidate = candidate if candidate is not None else CurrentRenderer()
+    reference = ReferenceRenderer()
+    rng = random.Random(seed)
+    seconds = {part: [0.0, 0.0] for part in parts}
+    for case in range(cases):
+        attributes = random_wod(rng)
+        wod = wods.WOD(attributes)
+        for part in parts:
+            expected, ref_s = _timed(lambda: _render(reference, part, wod, reference))
+            got, cand_s = _timed(lambda: _render(candidate, part, wod, reference))
+            seconds[part][0] += ref_s
+            seconds[part][1] += cand_s
+            if type(got) is not type(expected) or got != expected:
+                divergence = minimize(candidate, Divergence(part, attributes, expected, got))
+                return Result(case + 1, divergence, {p: tuple(s) for p, s in seconds.items()})
+    return Result(cases, None, {p: tuple(s) for p, s in seconds.items()})
+
+
+def load_renderer(spec: str):
+    """``package.module:Class`` -> an instance of it."""
+    module, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module), name)()
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cases', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--candidate', help='module:Class of the renderer to check, default the current tree')
+    parser.add_argument('--parts', default=','.join(PARTS), help='comma separated, of ' + ', '.join(PARTS))
+    parser.add_argument('--cached', action='store_true',
+                        help="leave the current tree's SSML cache on (default: render every time)")
+    args = parser.parse_args(argv)
+    candidate = load_renderer(args.candidate) if args.candidate else CurrentRenderer()
+    caches = wods.SSML_CACHE, wods.CACHE
+    if not args.cached:
+        wods.SSML_CACHE = wods.CACHE = wods.cache.MemoryCache(0)
+    try:
+        result = run(candidate, args.cases, args.seed, args.parts.split(','))
+    finally:
+        wods.SSML_CACHE, wods.CACHE = caches
+    print('{} cases, seed {}, {} vs {}'.format(result.cases, args.seed, candidate.name, ReferenceRenderer.name))
+    for part, speedup in result.speedups().items():
+        ref, cand = result.seconds[part]
+        print('  {:<18} reference {:>8.1f} ms  candidate {:>8.1f} ms  {:>6.2f}x'.format(
+            part, ref * 1000, cand * 1000, speedup))
+    if result.divergence is not None:
+        print(result.divergence)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Frozen reference for what the skill says: the SSML rendering as it was
+before any of it was optimized. Plain ``re.sub`` calls on one line at a
+time, no caches, no joined lines. It is deliberately slow and deliberately
+never changed, so `bench.ssml_diff` can hold faster renderers to it.
+
+If the skill is meant to say something different, change `wods` and the
+expected output in the tests, then update this module in the same commit.
+"""
+import re
+import xml.etree.ElementTree as libxml
+from typing import List, Optional
+
+STRENGTH_SECTION = 'Strength Section:'
+CONDITIONING_SECTION = 'Conditioning:'
+
+_ALIASES = {
+    r'OH': r'<sub alias="overhead">OH</sub>',
+    r'DB': r'<sub alias="dumbbell">DB</sub>',
+    r'KB': r'<sub alias="kettlebell">KB</sub>',
+    r'EMOM': r'every minute on the minute',
+    r'E(\d)MOM': r'every \1 minutes on the minute',
+    r'HSPU': r'hand stand push ups',
+    r'#': r'<sub alias="pounds">#</sub>',
+    r'(\d+)"': r'\1<sub alias="inches">"</sub>',
+    r'(\d+)\'': r'\1<sub alias="feet">\'</sub>',
+    r'&': 'and',
+    r'(\d+) [Ss]ec\.? ': r'\1 second ',
+    r'\bT2B\b': r'<sub alias="toes to bar">T2B</sub>',
+    r'( ?)\bx ?(\b\d+\b)': r'\1times \2',
+    r' \+ ': '<break strength="strong"/> + ',
+}
+
+
+def massage_for_tts(text: str) -> str:
+    text = re.sub(r'(\d+)x(\d+)', r'\1 sets of \2', text)
+    text = re.sub(r'(\d+[#"\'])/(\d+[#"\'])', r'<prosody rate="fast">\1 male, \2 female</prosody>', text)
+    for key, replacement in _ALIASES.items():
+        text = re.sub(key, replacement, text)
+    return text
+
+
+class ReferenceRenderer(object):
+    """
+    The renderer `bench.ssml_diff` compares candidates against. Each method
+    renders one part of a `wods.WOD` as its method of the same name would;
+    splitting the raw text into lines isn't under test.
+    """
+
+    name = 'reference'
+
+    def _section(self, lines: List[str], section: str) -> str:
+        if not lines:
+            return ''
+        return '<p>%s</p>' % section + ''.join('<s>{}</s>'.format(massage_for_tts(l)) for l in lines)
+
+    def strength_ssml(self, wod) -> str:
+        return self._section(wod.strength_lines, STRENGTH_SECTION)
+
+    def conditioning_ssml(self, wod) -> str:
+        return self._section(wod.conditioning_lines, CONDITIONING_SECTION)
+
+    def announcement_ssml(self, wod) -> str:
+        if not wod.announcement_lines:
+            return ''
+        chunks = ['<p>Announcement:']
+        for line in wod.announcement_lines:
+            line = line.strip()
+            chunks.append('<s>{}</s>'.format(line.replace('&', 'and')) if line else '<break time="500ms"/>')
+        chunks.append('</p>')
+        return ''.join(chunks)
+
+    def validate(self, ssml: str) -> Optional[str]:
+        """:returns: why ``ssml`` isn't valid, or None if it is"""
+        try:
+            doc = libxml.fromstring(ssml)
+        except libxml.ParseError:
+            return 'parse error'
+        if doc.tag != 'speak':
+            return 'not <speak>'
+        return None
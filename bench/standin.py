@@ -0,0 +1,381 @@
+"""
+Local stand-ins for the EBCF WOD API and for memcached, for load tests and
+integration tests.
+
+It answers the same JSON:API queries the skill makes (by ``date`` or by a
+``publishDate`` range) with synthetic, deterministic WODs for any day, and
+can be told to be slow or to treat days as not yet published. Responses
+carry an ETag (answering ``If-None-Match`` with 304) and are gzipped when
+the client accepts it::
+
+    $ python3 -m bench.standin --port 4500 --latency-ms 150
+    $ EBCF_API_URL='http://127.0.0.1:4500/api/v1/wods?' python3 -m _ebcf_alexa.server
+
+``StandinMemcached`` speaks just enough of the memcached text protocol
+(``get``, ``set``, ``delete``, ``flush_all``) for ``cache.MemcachedCache``,
+and ``StandinAlexaAPI`` answers device time zone lookups for
+``device_settings`` and takes the directives ``progressive`` posts.
+"""
+from datetime import date, datetime, time as Time, timedelta, timezone
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+import argparse
+import gzip
+import hashlib
+import json
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional
+
+API_PATH = '/api/v1/wods'
+TSTAMP_FMT = '%Y-%m-%dT%H:%M:%S.000Z'
+RANGE_FMT = '%Y-%m-%dT%H:%M:%S%z'
+PUBLISH_OFFSET = timedelta(hours=4)
+"""WODs go up the evening before, which is 04:00 UTC on the day."""
+
+_STRENGTH = [
+    'Back Squat\n5x5 @ 75% of 1RM',
+    'Tempo Front Squat\n3x10 (3 sec down, 2 sec pause at bottom, 1 sec rise)',
+    'Deadlift\n5-5-3-3-1-1',
+    'EMOM for 14 Min:\nEven: 25 Sec Handstand Hold\nOdd: 3 Strict T2B',
+    'Push Press\n4x6',
+    'Power Clean + Split Jerk\n15 Min to establish a heavy complex',
+    'OH Squat\n5x3',
+]
+_CONDITIONING = [
+    '3 Rounds\n400 m Run\n15 Hang Power Cleans 115#/95#\n15 Thrusters 115#/95#\n\n20 Min Cap',
+    '21-15-9\nKB Swings 53#/35#\nBurpees',
+    '12 Min AMRAP\n10 DB Snatches 50#/35#\n10 Box Jumps 24"/20"\n10 HSPU',
+    'For Time\n50 Double Unders\n40 Wall Balls 20#/14#\n30 Cal Row\n20 T2B\n10 Deadlifts 225#/155#',
+    'EMOM for 10 Min\n5 Power Snatches 95#/65#\n10 Air Squats',
+]
+_ANNOUNCEMENTS = ['HAPPY BIRTHDAY KELSEY!!!!', 'NO EVENING CLASSES TODAY']
+
+
+def wod_attributes(day: date) -> dict:
+    """A made up but realistic looking WOD for ``day``. Same day, same WOD."""
+    n = day.toordinal()
+    strength = _STRENGTH[n % len(_STRENGTH)]
+    if n % 11 == 0:
+        strength = _ANNOUNCEMENTS[n % len(_ANNOUNCEMENTS)] + '\n\n' + strength
+    midnight = datetime.combine(day, Time(), tzinfo=timezone.utc)
+    return {
+        'enabled': True, 'title': None, 'description': None, 'videoId': None,
+        'date': midnight.strftime(TSTAMP_FMT),
+        'publishDate': (midnight + PUBLISH_OFFSET).strftime(TSTAMP_FMT),
+        'image': 'http://ebcf.s3.amazonaws.com/%s.jpg' % day.strftime('%Y%m%d'),
+        'strength': strength,
+        'conditioning': _CONDITIONING[n % len(_CONDITIONING)],
+    }
+
+
+def document(attribute_list: List[dict]) -> dict:
+    """Wrap WOD attributes the way the real API does, unused bits and all."""
+    return {
+        'meta': {},
+        'links': {'self': 'http://localhost:4500' + API_PATH},
+        'data': [{
+            'id': '%024x' % i, 'type': 'wods', 'attributes': attrs,
+            'links': {'self': 'http://localhost:4500/api/v1/wods/%024x' % i},
+            'relationships': {'tags': {
+                'data': [{'type': 'tags', 'id': '56e61406e17eab8d035f2a4b'}],
+                'links': {'self': 'http://localhost:4500/api/v1/wods/relationships/tags'}}},
+        } for i, attrs in enumerate(attribute_list)],
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: 'StandinAPI'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != API_PATH:
+            self.send_error(404)
+            return
+        self.server.count_request()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if 'filter[simple][date]' in query:
+            day = datetime.strptime(query['filter[simple][date]'], TSTAMP_FMT).date()
+            if not self.server.is_published(day):
+                self.send_error(401)
+                return
+            days = [day]
+        else:
+            start = datetime.strptime(query['filter[simple][publishDate][$gt]'], RANGE_FMT)
+            end = datetime.strptime(query['filter[simple][publishDate][$lt]'], RANGE_FMT)
+            first = (start - PUBLISH_OFFSET).date()
+            days = [first + timedelta(days=i) for i in range((end - start).days + 2)]
+            days = [d for d in days if self.server.is_published(d)
+                    and start < datetime.combine(d, Time(), tzinfo=timezone.utc) + PUBLISH_OFFSET < end]
+        body = json.dumps(document([self.server.wod(d) for d in days])).encode('utf-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            self.server.count_not_modified()
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.api+json')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(self.server.started, usegmt=True))
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class StandinAPI(ThreadingHTTPServer):
+    """
+    :param latency: seconds to sleep before answering each request
+    :param published_until: days after this one answer 401, like unreleased WODs
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency: float = 0.0,
+                 published_until: Optional[date] = None):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.published_until = published_until
+        self.overrides: Dict[date, dict] = {}
+        self.requests = 0
+        self.not_modified = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Value for ``EBCF_API_URL`` / ``wods.URL``."""
+        return 'http://%s:%d%s?' % (self.server_address[0], self.server_address[1], API_PATH)
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def count_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def is_published(self, day: date) -> bool:
+        return self.published_until is None or day <= self.published_until
+
+    def wod(self, day: date) -> dict:
+        return self.overrides.get(day) or wod_attributes(day)
+
+    def start(self) -> 'StandinAPI':
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _AlexaHandler(BaseHTTPRequestHandler):
+    server: 'StandinAlexaAPI'
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.split('/')
+        # /v2/devices/{deviceId}/settings/System.timeZone
+        if len(parts) != 6 or parts[1:3] != ['v2', 'devices'] or parts[4:] != ['settings', 'System.timeZone']:
+            self.send_error(404)
+            return
+        self.server.count_request()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.headers.get('Authorization') != 'Bearer ' + self.server.token:
+            self.send_error(403)
+            return
+        zone = self.server.time_zones.get(unquote(parts[3]))
+        if zone is None:
+            self.send_error(404)
+            return
+        body = json.dumps(zone).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # /v1/directives
+        if urlparse(self.path).path != '/v1/directives':
+            self.send_error(404)
+            return
+        self.server.count_request()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.headers.get('Authorization') != 'Bearer ' + self.server.token:
+            self.send_error(403)
+            return
+        try:
+            directive = json.loads(body.decode('utf-8'))
+            directive['header']['requestId'], directive['directive']['speech']
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400)
+            return
+        self.server.add_directive(directive)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class StandinAlexaAPI(ThreadingHTTPServer):
+    """
+    The device settings and directive parts of the Alexa API: each device's
+    time zone, and progressive responses (kept in ``directives`` as they
+    arrive, with when they arrived in ``directive_times``), for requests
+    bearing ``token``.
+
+    :param time_zones: device id -> time zone name
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), time_zones: Optional[Dict[str, str]] = None,
+                 token: str = 'standin-token', latency: float = 0.0):
+        super().__init__(address, _AlexaHandler)
+        self.time_zones = dict(time_zones or {})
+        self.token = token
+        self.latency = latency
+        self.requests = 0
+        self.directives: List[dict] = []
+        self.directive_times: List[float] = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        """Value for ``context.System.apiEndpoint`` in events."""
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def add_directive(self, directive: dict) -> None:
+        with self._lock:
+            self.directives.append(directive)
+            self.directive_times.append(time.monotonic())
+
+    def start(self) -> 'StandinAlexaAPI':
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _MemcachedHandler(socketserver.StreamRequestHandler):
+    server: 'StandinMemcached'
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.split()
+            if not parts:
+                continue
+            command = parts[0]
+            now = time.time()
+            if command == b'get':
+                with self.server.lock:
+                    for key in parts[1:]:
+                        entry = store.get(key)
+                        if entry is not None and entry[0] > now:
+                            self.wfile.write(b'VALUE %s %d %d\r\n%s\r\n' % (
+                                key, entry[2], len(entry[1]), entry[1]))
+                self.wfile.write(b'END\r\n')
+            elif command == b'set':
+                value = self.rfile.read(int(parts[4]) + 2)[:-2]
+                with self.server.lock:
+                    store[parts[1]] = (now + int(parts[3]), value, int(parts[2]))
+                self.wfile.write(b'STORED\r\n')
+            elif command == b'delete':
+                with self.server.lock:
+                    found = store.pop(parts[1], None) is not None
+                self.wfile.write(b'DELETED\r\n' if found else b'NOT_FOUND\r\n')
+            elif command == b'flush_all':
+                with self.server.lock:
+                    store.clear()
+                self.wfile.write(b'OK\r\n')
+            else:
+                self.wfile.write(b'ERROR\r\n')
+
+
+class StandinMemcached(socketserver.ThreadingTCPServer):
+    """In-memory memcached, one ``store`` dict of key -> (expires, value, flags)."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        super().__init__(address, _MemcachedHandler)
+        self.store: Dict[bytes, tuple] = {}
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def start(self) -> 'StandinMemcached':
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Stand-in EBCF WOD API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4500)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--memcached-port', type=int, help='also run a stand-in memcached')
+    args = parser.parse_args()
+    server = StandinAPI((args.host, args.port), latency=args.latency_ms / 1000)
+    print('EBCF_API_URL=' + server.url)
+    if args.memcached_port:
+        StandinMemcached((args.host, args.memcached_port)).start()
+        print('EBCF_CACHE=memory,memcached:%s:%d' % (args.host, args.memcached_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Worst cases for the TTS regexes: render times of long and pathological
+lines, rule by rule, and how they grow with the line's length::
+
+    $ python3 -m bench.tts_regex
+    $ python3 -m bench.tts_regex --sizes 1000,8000 --max-exponent 1.3
+
+The text comes from gym staff typing into a CMS, so nothing stops a pasted
+spreadsheet or a line of 10,000 digits. Each rule (`wods._fix_sets`,
+`wods._fix_rx` and every `wods._ALIASES` pattern) and the whole pipeline
+(`wods._massage_for_tts`, `wods._render_ssml` as `wods._convert_ssml` runs
+it on a cache miss) is timed on each input in `ADVERSARIAL` at each size.
+Growth is reported as the exponent k in time ~ length^k between the
+smallest and largest size: about 1 is linear, 2 is a regex rescanning the
+line from every position. Exits non-zero if any exponent is over
+``--max-exponent`` or a line of ``LINE_CHARS`` takes longer than
+``LINE_BUDGET_SECONDS`` to massage.
+
+Timings are noisy on a busy machine, so `scan_steps` also counts the work
+that makes a regex quadratic, which doesn't depend on the machine:
+`step_failures` holds every pattern to a fixed number of steps per
+character of input, the check the unit tests run.
+"""
+import argparse
+import math
+import re
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+from _ebcf_alexa import wods
+from .standin import wod_attributes
+
+LINE_CHARS = 2000
+"""Longer than any line a person would type, about a pasted paragraph."""
+LINE_BUDGET_SECONDS = 0.02
+"""Most `_massage_for_tts` may take for a ``LINE_CHARS`` line."""
+MAX_EXPONENT = 1.5
+SIZES = (2000, 16000)
+MIN_SAMPLE_SECONDS = 0.002
+STEP_SIZES = (500, 4000)
+MAX_STEPS_PER_CHAR = 1
+"""A pattern's first repeat may scan each character once, from the start of its run."""
+
+
+def _repeat(unit: str) -> Callable[[int], str]:
+    return lambda n: (unit * (n // len(unit) + 1))[:n]
+
+
+def _realistic(n: int) -> str:
+    from datetime import date, timedelta
+    lines = []
+    day = date(2017, 1, 1)
+    while sum(map(len, lines)) < n:
+        wod = wods.WOD(wod_attributes(day))
+        lines += wod.strength_lines + wod.conditioning_lines
+        day += timedelta(days=1)
+    return ' '.join(lines)[:n]
+
+
+ADVERSARIAL: Dict[str, Callable[[int], str]] = {
+    'digits': _repeat('1'),
+    'digits, then a near miss': lambda n: '1' * (n - 5) + ' sex ',
+    'digit runs without x': _repeat('9' * 50 + 'y'),
+    'sets storm': _repeat('3x5'),
+    'Rx near misses': _repeat('95#/'),
+    'weights without slash': lambda n: '1' * (n - 1) + '#',
+    'x storm': _repeat(' x'),
+    'x before long number': lambda n: 'x ' + '1' * (n - 3) + 'a',
+    'secs': _repeat('10 sec '),
+    'plus storm': _repeat(' + '),
+    'specials': _repeat('&#"\'/'),
+    'unicode': _repeat('3×5 ½ – “95#” '),
+    'realistic': _realistic,
+}
+
+
+def rules() -> List[Tuple[str, Callable[[str], str]]]:
+    """Each substitution on its own, then the whole pipeline."""
+    found = [('_fix_sets', wods._fix_sets), ('_fix_rx', wods._fix_rx)]
+    for rx, replacement in wods._ALIAS_RXS:
+        found.append(('alias ' + rx.pattern, lambda text, rx=rx, r=replacement: rx.sub(r, text)))
+    found.append(('_massage_for_tts', wods._massage_for_tts))
+    found.append(('_render_ssml', lambda text: wods._render_ssml([text], wods.STRENGTH_SECTION)))
+    return found
+
+
+def best_time(func: Callable[[str], str], text: str, repeat: int = 3) -> float:
+    """Best seconds per call, calling often enough to be measurable."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func(text)
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            break
+        number *= 4
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+
+class Growth(NamedTuple):
+    rule: str
+    input: str
+    times: Tuple[float, ...]
+    exponent: float
+
+
+def growth(func: Callable[[str], str], make: Callable[[int], str],
+           sizes: Sequence[int]) -> Tuple[Tuple[float, ...], float]:
+    """:returns: seconds per call at each size, and the exponent between the first and last"""
+    times = tuple(best_time(func, make(n)) for n in sizes)
+    exponent = math.log(times[-1] / times[0]) / math.log(sizes[-1] / sizes[0])
+    return times, exponent
+
+
+_REPEAT = re.compile(r'(?:\\[dDsSwW]|\[[^\]]*\]|(?<!\\)\.)[+*]')
+_ESCAPE_OR_CLASS = re.compile(r'\\.|\[[^\]]*\]')
+
+
+def patterns() -> List[Tuple[str, 're.Pattern']]:
+    """Every regex `wods._massage_for_tts` runs."""
+    found = [('_fix_sets', wods._SETS_RX), ('_fix_rx', wods._RX_RX)]
+    found += [('alias ' + rx.pattern, rx) for rx, _ in wods._ALIAS_RXS]
+    return found
+
+
+def scan_steps(rx: 're.Pattern', text: str) -> int:
+    """
+    Characters the first repeat of ``rx`` (the ``\\d+`` of ``(\\d+)x``, or
+    of ``( ?)\\bx ?(\\b\\d+\\b)``) scans over ``text``, summed over every
+    position a search gets to it from: the work before the rest of the
+    pattern can fail. Whatever comes before the repeat has to match too, so
+    a prefix like ``(?<!\\d)`` or ``\\bx`` limits where it can start.
+    Quadratic in the length of a run unless only the start of a run may
+    begin a match; 0 for patterns without a ``+`` or ``*`` repeat.
+    """
+    m = _REPEAT.search(rx.pattern)
+    if m is None:
+        return 0
+    prefix = rx.pattern[:m.start()]
+    bare = _ESCAPE_OR_CLASS.sub('', prefix)
+    unclosed = bare.count('(') - bare.count(')')
+    head = re.compile(prefix + '(?P<_repeat>' + m.group() + ')' + ')' * unclosed, rx.flags)
+    steps = 0
+    for i in range(len(text)):
+        found = head.match(text, i)
+        if found is not None:
+            steps += found.end('_repeat') - found.start('_repeat')
+    return steps
+
+
+def step_failures(found: Sequence[Tuple[str, 're.Pattern']] = None, sizes: Sequence[int] = STEP_SIZES,
+                  max_steps_per_char: float = MAX_STEPS_PER_CHAR) -> List[str]:
+    """Patterns scanning more than ``max_steps_per_char`` per character of any `ADVERSARIAL` input."""
+    failed = []
+    for rule, rx in found if found is not None else patterns():
+        for name, make in ADVERSARIAL.items():
+            for n in sizes:
+                steps = scan_steps(rx, make(n))
+                if steps > max_steps_per_char * n:
+                    failed.append('{} on {}: {} steps for {} chars'.format(rule, name, steps, n))
+                    break
+    return failed
+
+
+def measure(sizes: Sequence[int] = SIZES) -> List[Growth]:
+    found = []
+    for rule, func in rules():
+        for name, make in ADVERSARIAL.items():
+            times, exponent = growth(func, make, sizes)
+            found.append(Growth(rule, name, times, exponent))
+    return found
+
+
+def line_times() -> Dict[str, float]:
+    """Seconds to massage a ``LINE_CHARS`` line of each `ADVERSARIAL` input."""
+    return {name: best_time(wods._massage_for_tts, make(LINE_CHARS)) for name, make in ADVERSARIAL.items()}
+
+
+def failures(measured: Sequence[Growth], lines: Dict[str, float], max_exponent: float = MAX_EXPONENT,
+             budget: float = LINE_BUDGET_SECONDS) -> List[str]:
+    found = ['{} on {}: time ~ length^{:.2f}'.format(g.rule, g.input, g.exponent)
+             for g in measured if g.exponent > max_exponent]
+    found += ['_massage_for_tts on {}: {:.1f} ms for {} chars'.format(name, seconds * 1000, LINE_CHARS)
+              for name, seconds in lines.items() if seconds > budget]
+    return found
+
+
+def main(argv: Sequence[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)), help='comma separated line lengths')
+    parser.add_argument('--max-exponent', type=float, default=MAX_EXPONENT)
+    parser.add_argument('--budget-ms', type=float, default=LINE_BUDGET_SECONDS * 1000,
+                        help='per line budget for a {} char line'.format(LINE_CHARS))
+    args = parser.parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(',')]
+    measured = measure(sizes)
+    print('{:<40} {:<26} {}  {:>5}'.format('rule', 'input', ' '.join('{:>9}'.format(n) for n in sizes), 'k'))
+    for g in measured:
+        print('{:<40} {:<26} {}  {:>5.2f}'.format(g.rule[:40], g.input, ' '.join(
+            '{:>7.1f}us'.format(t * 1e6) for t in g.times), g.exponent))
+    lines = line_times()
+    print()
+    for name, seconds in lines.items():
+        print('_massage_for_tts, {} chars of {:<26} {:>8.3f} ms'.format(LINE_CHARS, name, seconds * 1000))
+    failed = failures(measured, lines, args.max_exponent, args.budget_ms / 1000) + step_failures()
+    for failure in failed:
+        print('FAIL', failure)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+How much of the in-process cache a quarter of WODs (and their rendered
+SSML) takes, and what a cache hit costs::
+
+    $ python3 -m bench.wod_cache
+"""
+from datetime import date, timedelta
+import json
+
+from _ebcf_alexa import cache, wods
+from . import report
+from .standin import wod_attributes
+
+DAYS = 90
+
+
+def main() -> None:
+    start = date(2017, 7, 1)
+    days = [start + timedelta(days=i) for i in range(DAYS)]
+    all_wods = [wods.WOD(wod_attributes(day)) for day in days]
+
+    plain = sum(len(json.dumps({'f': 0.0, 'w': wod_attributes(day)}).encode('utf-8')) for day in days)
+    mem = cache.MemoryCache(max_bytes=1 << 30)
+    for day, wod in zip(days, all_wods):
+        raw, (body_key, body) = wods._encode_entry(0.0, wod)
+        mem.set(body_key, body, 60)
+        mem.set(wods._cache_key(day), raw, 60)
+    print('{:<50} {:>10d} bytes'.format('%d days, one JSON entry per day' % DAYS, plain))
+    print('{:<50} {:>10d} bytes ({} entries)'.format('%d days, deduplicated + compressed' % DAYS,
+                                                   mem.bytes - mem.stats()['entries'] * cache.ENTRY_OVERHEAD_BYTES,
+                                                   mem.stats()['entries']))
+
+    rendered = [wod.full_ssml() for wod in all_wods]
+    print('{:<50} {:>10d} bytes'.format('%d days of rendered SSML' % DAYS, sum(len(s.encode('utf-8')) for s in rendered)))
+    print('{:<50} {:>10d} bytes ({} entries)'.format('SSML cache', wods.SSML_CACHE.bytes,
+                                                   wods.SSML_CACHE.stats()['entries']))
+
+    wod = all_wods[0]
+    report('full_ssml (SSML cache hit)', wod.full_ssml)
+    report('full_ssml (rendered)', lambda: wods._render_ssml(wod.strength_lines, 'Strength Section:')
+           + wods._render_ssml(wod.conditioning_lines, 'Conditioning:'))
+    wods.clear_cache()
+    wods.CACHE.set(body_key, body, 60)
+    report('decode entry (memoised)', lambda: wods._decode_entry('wod:x', raw))
+
+
+if __name__ == '__main__':
+    main()
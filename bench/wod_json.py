@@ -0,0 +1,55 @@
+"""
+Field-selective parse vs ``json.load`` on multi-month range responses::
+
+    $ python3 -m bench.wod_json
+"""
+from datetime import date, timedelta
+import gzip
+import io
+import json
+import tracemalloc
+
+from _ebcf_alexa import wod_json, wods
+from . import report
+from .standin import document, wod_attributes
+
+
+def _full(raw: bytes) -> list:
+    return [wods.WOD(d['attributes']) for d in json.load(io.BytesIO(raw))['data']]
+
+
+def _selective(raw: bytes) -> list:
+    return [wods.WOD(a) for a in wod_json.iter_wod_attributes(io.BytesIO(raw))]
+
+
+def _peak_kib(func) -> float:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    for days in (31, 92, 365):
+        doc = document([wod_attributes(date(2017, 1, 1) + timedelta(days=i)) for i in range(days)])
+        raw = json.dumps(doc).encode('utf-8')
+        packed = gzip.compress(raw)
+        number = max(10, 3000 // days)
+        print('{} days, {} bytes ({} gzipped)'.format(days, len(raw), len(packed)))
+        report('  json.load', lambda: json.load(io.BytesIO(raw)), number)
+        report('  load_wod_attributes', lambda: wod_json.load_wod_attributes(io.BytesIO(raw)), number)
+        report('  json.load (gzip stream)',
+               lambda: json.load(gzip.GzipFile(fileobj=io.BytesIO(packed))), number)
+        report('  load_wod_attributes (gzip stream)',
+               lambda: wod_json.load_wod_attributes(gzip.GzipFile(fileobj=io.BytesIO(packed))), number)
+        report('  json.load + WOD()', lambda: _full(raw), number)
+        report('  iter_wod_attributes + WOD()', lambda: _selective(raw), number)
+        print('  peak KiB: json.load {:.0f}, load_wod_attributes {:.0f} (gzip stream)'.format(
+            _peak_kib(lambda: json.load(gzip.GzipFile(fileobj=io.BytesIO(packed)))),
+            _peak_kib(lambda: wod_json.load_wod_attributes(gzip.GzipFile(fileobj=io.BytesIO(packed))))))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,199 @@
 """
 Entry point for lambda
 """
-from _ebcf_alexa import interaction_model, incoming_types, speechlet
+from _ebcf_alexa import interaction_model, incoming_types, speechlet, wods, env, logs, metrics, profiling
+from _ebcf_alexa import refresh, device_settings, progressive
+from datetime import timedelta, tzinfo
+from typing import Optional
+import contextlib
 import logging
+import os
+import time
 
 LOG = logging.getLogger()
-LOG.setLevel(logging.DEBUG)
+logs.configure()
 ALEXA_SKILL_ID = 'amzn1.ask.skill.d6f2f7c4-7689-410d-9c35-8f8baae37969'
 
+WARMUP_PRIMES_CACHE = os.environ.get('EBCF_WARMUP_PRIME_CACHE', '').lower() in ('1', 'true', 'yes')
+"""If set, keep-warm pings also fetch today's and tomorrow's WOD into the cache."""
 
+WARMUP_PREFETCHES = os.environ.get('EBCF_WARMUP_PREFETCH', '').lower() in ('1', 'true', 'yes')
+"""If set, keep-warm pings also prefetch the queries the observed traffic mix
+says are coming next; see `interaction_model.prefetch_likely_queries`."""
+
+WARMUP_SYNCS_MOVEMENTS = os.environ.get('EBCF_WARMUP_SYNC_MOVEMENTS', '').lower() in ('1', 'true', 'yes')
+"""If set, keep-warm pings also pull the rest of the movement index's
+history in; see `interaction_model.sync_movement_index`."""
+
+WARMUP_RESPONSE = {'warmup': True}
+
+
+def _is_warmup_event(event_dict: dict) -> bool:
+    """
+    Keep-warm pings are either CloudWatch scheduled events or a bare
+    ``{"warmup": true}`` payload. Neither looks anything like an Alexa event.
+    Scheduled events asking for a refresh are checked for first.
+    """
+    return event_dict.get('source') == 'aws.events' or bool(event_dict.get('warmup'))
+
+
+def _section(raw: dict, name: str) -> dict:
+    """``raw[name]`` if it is an object, else an empty one."""
+    section = raw.get(name)
+    return section if isinstance(section, dict) else {}
+
+
+def _raw_application_id(event_dict: dict) -> Optional[str]:
+    """Pull the application id out of the raw event without parsing it."""
+    app = _section(_section(event_dict, 'session'), 'application')
+    if not app:
+        app = _section(_section(_section(event_dict, 'context'), 'System'), 'application')
+    return app.get('applicationId')
+
+
+def _on_warmup(event_dict: dict) -> dict:
+    LOG.info('Keep-warm ping')
+    if WARMUP_PRIMES_CACHE:
+        today = env.localdate()
+        wods.prime_cache([today, today + timedelta(days=1)])
+    if WARMUP_PREFETCHES:
+        interaction_model.prefetch_likely_queries()
+    if WARMUP_SYNCS_MOVEMENTS:
+        interaction_model.sync_movement_index()
+    return WARMUP_RESPONSE
+
+
+def _on_refresh(event_dict: dict, context) -> dict:
+    LOG.info('Scheduled refresh')
+    return refresh.on_refresh_event(event_dict, context)
+
+
+def _predispatch(event_dict: dict, context=None) -> Optional[dict]:
+    """
+    Cheap checks on the raw event before we bother parsing it.
+
+    :returns: a response if the event has already been handled, else None
+    :raises incoming_types.InvalidApplicationId: if the event is for some other skill, or isn't an object
+    """
+    if not isinstance(event_dict, dict):
+        raise incoming_types.InvalidApplicationId("Event is not an object: %s" % type(event_dict).__name__)
+    if refresh.is_refresh_event(event_dict):
+        return _on_refresh(event_dict, context)
+    if _is_warmup_event(event_dict):
+        return _on_warmup(event_dict)
+
+    # This is the official application id
+    application_id = _raw_application_id(event_dict)
+    if application_id != ALEXA_SKILL_ID:
+        raise incoming_types.InvalidApplicationId("Invalid Application ID: %s" % application_id)
+    return None
+
+
+def _device_time_zone(event: incoming_types.LambdaEvent) -> Optional[tzinfo]:
+    with metrics.span('device_time_zone'):
+        return device_settings.event_time_zone(event)
+
+
+@profiling.profiled
 def lambda_handler(event_dict: dict, context) -> dict:
     """ Route the incoming request based on type (LaunchRequest, IntentRequest,
     etc.) The JSON body of the request is provided in the event parameter.
     """
-    LOG.debug(repr(event_dict))
-    event = incoming_types.LambdaEvent(event_dict)
-    LOG.info("Start Lambda Event for event.session.application.applicationId=%s",
-             event.session.application.application_id)
+    response = _predispatch(event_dict, context)
+    if response is not None:
+        return response
+    logs.begin_request()
+    if logs.payload_sampled(LOG):  # redacting copies the whole event
+        LOG.debug('Event: %s', logs.Truncated(logs.redact_event(event_dict)))
+    metrics.begin()
+    start = time.perf_counter()
+    summary = {'outcome': 'error'}
+    try:
+        with metrics.span('lambda_handler'):
+            with metrics.span('parse_event'):
+                event = incoming_types.LambdaEvent(event_dict)
+                request = event.request
+            summary.update(request_id=request.request_id, request_type=request.type.name)
+            if request.type == incoming_types.RequestTypes.IntentRequest:
+                summary['intent'] = request.intent.name
+            if event.session is not None:
+                summary['user'] = logs.redact_user_id(event.session.user.user_id)
+            with env.local_timezone(resolve=lambda: _device_time_zone(event)), \
+                    progressive.for_request(event, context):
+                response = interaction_model.handle_event(event).dict()
+        summary['outcome'] = 'ok'
+        return response
+    finally:
+        summary['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        logs.log_request_summary(LOG, **summary)
+        metrics.emit(request_id=summary.get('request_id'),
+                     request_type=summary.get('request_type'),
+                     intent=summary.get('intent'),
+                     outcome=summary['outcome'])
 
-    # This is the official application id
-    if event.session.application.application_id != ALEXA_SKILL_ID:
-        raise ValueError("Invalid Application ID: %s" % event.session.application.application_id)
 
-    return interaction_model.handle_event(event).dict()
+def _replay(args) -> int:
+    from _ebcf_alexa import replay
+    logging.basicConfig(format='%(levelname)s %(filename)s-%(funcName)s-%(lineno)d: %(message)s', level=logging.WARNING)
+    if args.now:
+        env.freeze(replay.parse_now(args.now))
+    with open(args.replay) as corpus, contextlib.ExitStack() as files:
+        # golden first: if it can't be opened, output hasn't been truncated yet
+        golden = files.enter_context(open(args.golden)) if args.golden else None
+        output = files.enter_context(open(args.output, 'w')) if args.output else None
+        return replay.run(corpus, lambda_handler, workers=args.workers, output=output, golden=golden)
 
 
-if __name__ == '__main__':
-    logging.basicConfig(format='%(levelname)s %(filename)s-%(funcName)s-%(lineno)d: %(message)s', level=logging.DEBUG)
+def _main(argv: Optional[list] = None) -> None:
+    """
+    Run a single event from stdin through the handler, for local debugging.
+    Drops into pdb if the handler blows up.
+
+    With ``--replay`` runs a JSON lines corpus of events instead; see
+    `_ebcf_alexa.replay`.
+    """
+    import argparse
     import json
     import sys
     import pprint
     import pdb
     import traceback
+    parser = argparse.ArgumentParser(description='Run an Alexa event from stdin through lambda_handler.')
+    parser.add_argument('--profile', metavar='MODES',
+                        help='profile the invocation with these comma separated modes: '
+                             + ', '.join(profiling.MODES))
+    parser.add_argument('--profile-top', type=int, default=profiling.DEFAULT_TOP_N, metavar='N',
+                        help='number of functions / allocation sites to report')
+    parser.add_argument('--profile-dir', help='write profile summaries here instead of logging them')
+    replay_args = parser.add_argument_group('batch replay')
+    replay_args.add_argument('--replay', metavar='CORPUS', help='JSON lines file of events to run')
+    replay_args.add_argument('--workers', type=int, default=1, help='events run concurrently')
+    replay_args.add_argument('--output', help='write responses here as JSON lines')
+    replay_args.add_argument('--golden', help='report responses that differ from this earlier --output')
+    replay_args.add_argument('--now', help='pretend it is this time, e.g. 2017-09-01T19:00:00Z')
+    args = parser.parse_args(argv)
+    if args.output and args.golden and os.path.realpath(args.output) == os.path.realpath(args.golden):
+        parser.error('--output and --golden must be different files')
+    if args.replay:
+        sys.exit(_replay(args))
+
+    logging.basicConfig(format='%(levelname)s %(filename)s-%(funcName)s-%(lineno)d: %(message)s', level=logging.DEBUG)
+    logs.configure(dict({'EBCF_LOG_LEVEL': 'DEBUG', 'EBCF_LOG_PAYLOAD_SAMPLE_RATE': '1'}, **os.environ))
+    event_dict = json.load(sys.stdin)
     try:
-        pprint.pprint(lambda_handler(json.load(sys.stdin), None))
+        if args.profile:
+            settings = profiling.Settings(modes=[m.strip() for m in args.profile.split(',')],
+                                          top_n=args.profile_top, out_dir=args.profile_dir)
+            # call through __wrapped__ so the environment's sampling doesn't profile twice
+            response = profiling.run(lambda_handler.__wrapped__, event_dict, None, settings=settings)
+        else:
+            response = lambda_handler(event_dict, None)
+        pprint.pprint(response)
     except Exception:
         traceback.print_exc()
         pdb.post_mortem()
-        raise
\ No newline at end of file
+        raise
+
+
+if __name__ == '__main__':
+    _main()
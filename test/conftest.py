@@ -0,0 +1,43 @@
+from _ebcf_alexa import device_settings, interaction_model, movement_index, wods
+from _ebcf_alexa.ratelimit import TokenBucket
+from unittest.mock import patch
+import os
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption('--perf', action='store_true', default=os.environ.get('EBCF_PERF_TESTS', '') == '1',
+                     help='also run the timing tests marked perf; they are noisy on a busy machine')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--perf'):
+        return
+    skip = pytest.mark.skip(reason='timing test, run with --perf')
+    for item in items:
+        if 'perf' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def clear_wod_cache():
+    """Every test starts with a cold WOD cache and nothing learned from earlier tests."""
+    wods.clear_cache()
+    wods.PUBLISH_TIMES.clear()
+    movement_index.INDEX.clear()
+    interaction_model.QUERY_MIX.clear()
+    device_settings.TIME_ZONES.clear()
+    yield
+    wods.clear_cache()
+    wods.PUBLISH_TIMES.clear()
+    movement_index.INDEX.clear()
+    interaction_model.QUERY_MIX.clear()
+    device_settings.TIME_ZONES.clear()
+
+
+@pytest.fixture(autouse=True)
+def unlimited_api():
+    """Tests make API calls back to back; only the rate limit tests limit them."""
+    with patch.object(wods, 'USER_BUCKET', TokenBucket(None, 0)), \
+            patch.object(wods, 'BACKGROUND_BUCKET', TokenBucket(None, 0)):
+        yield
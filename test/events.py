@@ -0,0 +1,21 @@
+"""Alexa events shared by the tests; import them, there are no tests here."""
+
+OPEN_SKILL = {
+    'version': '1.0',
+    'session': {'new': True, 'sessionId': 'amzn1.echo-api.session.1',
+                'application': {'applicationId': 'amzn1.ask.skill.d6f2f7c4-7689-410d-9c35-8f8baae37969'},
+                'user': {'userId': 'amzn1.ask.account.XXXXX'}},
+    'request': {'type': 'LaunchRequest', 'requestId': 'amzn1.echo-api.request.1',
+                'timestamp': '2017-09-03T18:34:11Z', 'locale': 'en-US'}}
+"""A LaunchRequest without a ``context``, so without an Alexa API endpoint."""
+
+
+def with_alexa_api(api, device_id: str, token: str = None) -> dict:
+    """`OPEN_SKILL` from ``device_id``, with ``api`` (a `bench.standin.StandinAlexaAPI`) to call back."""
+    return dict(OPEN_SKILL, context={'System': {
+        'application': OPEN_SKILL['session']['application'],
+        'user': OPEN_SKILL['session']['user'],
+        'device': {'deviceId': device_id, 'supportedInterfaces': {}},
+        'apiEndpoint': api.endpoint,
+        'apiAccessToken': token or api.token,
+    }})
@@ -0,0 +1,208 @@
+from _ebcf_alexa import cache, wods
+from bench.standin import StandinAPI, StandinMemcached
+from datetime import date
+from unittest.mock import patch
+import socket
+import pytest
+
+
+@pytest.fixture
+def memcached():
+    with StandinMemcached() as server:
+        yield server
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'memcached'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        yield cache.MemoryCache()
+    elif request.param == 'sqlite':
+        yield cache.SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    else:
+        with StandinMemcached() as server:
+            yield cache.MemcachedCache(*server.server_address)
+
+
+def test_get_set_delete(backend):
+    assert backend.get('wod:2017-07-03') is None
+    backend.set('wod:2017-07-03', b'{"w":null}\r\nEND\r\n', 60)
+    assert backend.get('wod:2017-07-03') == b'{"w":null}\r\nEND\r\n'
+    backend.delete('wod:2017-07-03')
+    assert backend.get('wod:2017-07-03') is None
+    assert backend.stats()['hits'] == 1
+    assert backend.stats()['misses'] == 2
+
+
+def test_clear(backend):
+    backend.set('a', b'1', 60)
+    backend.clear()
+    assert backend.get('a') is None
+
+
+def test_memory_cache_expires_and_evicts_by_size():
+    entry = cache.MemoryCache._size('a', b'x' * 100)
+    mem = cache.MemoryCache(max_bytes=2 * entry)
+    mem.set('a', b'x' * 100, 60)
+    mem.set('b', b'x' * 100, 60)
+    mem.get('a')
+    mem.set('c', b'x' * 100, 60)
+    assert mem.get('b') is None  # least recently used
+    assert mem.get('a') == b'x' * 100
+    assert mem.stats()['bytes'] == 2 * entry
+    mem.set('d', b'x' * 10, 60)
+    assert mem.get('c') is None
+    assert mem.stats()['evictions'] == 2
+    mem.set('big', b'x' * 1000, 60)  # never fits, evicts nothing
+    assert mem.get('big') is None
+    assert mem.stats()['entries'] == 2
+    with patch.object(cache.time, 'monotonic', return_value=cache.time.monotonic() + 61):
+        assert mem.get('a') is None
+    mem.clear()
+    assert mem.stats()['bytes'] == 0
+
+
+def test_compress_round_trip():
+    short, long_ = b'{"w":null}', b'<prosody rate="fast">95<sub alias="pounds">#</sub></prosody>' * 20
+    assert cache.compress(short) == b'=' + short
+    assert len(cache.compress(long_)) < len(long_) / 4
+    assert cache.decompress(cache.compress(short)) == short
+    assert cache.decompress(cache.compress(long_)) == long_
+    with pytest.raises(ValueError):
+        cache.decompress(b'zgarbage')
+    with pytest.raises(ValueError):
+        cache.decompress(b'?')
+
+
+def test_remaining_ttl(backend):
+    backend.set('a', b'1', 600)
+    value, remaining = backend.get_entry('a')
+    assert value == b'1'
+    assert 590 < remaining <= 600
+
+
+def test_sqlite_errors_are_logged_not_raised(tmp_path, caplog):
+    broken = cache.SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    broken._conn.close()
+    broken.set('a', b'1', 60)
+    assert broken.get('a') is None
+    broken.delete('a')
+    broken.clear()
+    broken.purge_expired()
+    assert 'sqlite cache purge failed' in caplog.text
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache.SQLiteCache(path).set('a', b'1', 60)
+    assert cache.SQLiteCache(path).get('a') == b'1'
+
+
+def test_memcached_down_is_a_miss():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    client = cache.MemcachedCache('127.0.0.1', port)
+    client.set('a', b'1', 60)
+    assert client.get('a') is None
+    assert client.stats()['errors'] == 2
+
+
+def test_memcached_clear_does_not_flush_server(memcached):
+    client = cache.MemcachedCache(*memcached.server_address)
+    client.set('a', b'1', 60)
+    client.clear()
+    assert client.get('a') is None
+    assert len(memcached.store) == 1
+
+
+def test_tiered_backfills_faster_tiers(memcached):
+    l1, l2 = cache.MemoryCache(), cache.MemcachedCache(*memcached.server_address)
+    tiered = cache.TieredCache([l1, l2])
+    l2.set('a', b'1', 60)
+    assert tiered.get('a') == b'1'
+    assert l1.get('a') == b'1'
+    assert tiered.get('a') == b'1'
+    assert l2.stats()['hits'] == 1
+
+
+@pytest.mark.parametrize('ttl', [5, 3600])
+def test_tiered_backfill_keeps_remaining_ttl(memcached, ttl):
+    l1, l2 = cache.MemoryCache(), cache.MemcachedCache(*memcached.server_address)
+    tiered = cache.TieredCache([l1, l2])
+    l2.set('a', b'1', ttl)
+    assert tiered.get('a') == b'1'
+    assert ttl - 2 < l1.get_entry('a')[1] <= ttl  # not backfill_ttl
+
+
+def test_configure():
+    tiered = cache.configure('memory:10, memcached:127.0.0.1:1')
+    assert [t.name for t in tiered.tiers] == ['memory', 'memcached']
+    assert tiered.tiers[0].max_bytes == 10
+    assert tiered.tiers[1].address == ('127.0.0.1', 1)
+    assert isinstance(cache.configure('memory'), cache.MemoryCache)
+
+
+@pytest.mark.parametrize('spec', ['redis:localhost', 'memcached:host:abc', 'sqlite:/nonexistent/x.db',
+                                  'memory:lots', ''])
+def test_configure_bad_spec(spec, caplog):
+    assert isinstance(cache.configure(spec), cache.MemoryCache)
+    assert any(r.levelname == 'WARNING' for r in caplog.records)
+
+
+def test_configure_skips_bad_tiers(tmp_path):
+    tiered = cache.configure('memory:10, sqlite:/nonexistent/x.db, sqlite:%s' % (tmp_path / 'c.db'))
+    assert [t.name for t in tiered.tiers] == ['memory', 'sqlite']
+
+
+def test_containers_share_wods_through_memcached(memcached):
+    """Two containers (separate L1s) only call the API once between them."""
+    with StandinAPI() as api, patch.object(wods, 'URL', api.url):
+        for _ in range(2):
+            container = cache.TieredCache([cache.MemoryCache(), cache.MemcachedCache(*memcached.server_address)])
+            with patch.object(wods, 'CACHE', container):
+                wods.clear_cache()
+                wod = wods.get_wod(date(2017, 7, 3))
+        assert api.requests == 1
+    assert wod.date == date(2017, 7, 3)
+    assert wod.strength_lines
+
+
+def _wod(day: int, strength='HAPPY BIRTHDAY KELSEY!!!!\n\nBack Squat\n5x5'):
+    return wods.WOD({'date': '2017-07-%02dT00:00:00.000Z' % day, 'publishDate': '2017-07-%02dT04:00:00.000Z' % day,
+                     'strength': strength, 'conditioning': '21-15-9\nKB Swings 53#/35#\nBurpees', 'image': None})
+
+
+def test_wod_entry_round_trip():
+    wod = _wod(3)
+    raw, (body_key, body) = wods._encode_entry(1234.5, wod)
+    wods.CACHE.set(body_key, body, 60)
+    fresh_until, copy = wods._decode_entry('wod:2017-07-03', raw)
+    assert fresh_until == 1234.5
+    assert copy.full_ssml() == wod.full_ssml()
+    assert copy.publish_datetime == wod.publish_datetime
+    with pytest.raises(ValueError):
+        wods._decode_entry('wod:2017-07-03', b'={"x":1}')
+
+
+def test_wod_entry_with_evicted_body_is_a_miss():
+    raw, _ = wods._encode_entry(1234.5, _wod(3))
+    assert wods._decode_entry('wod:2017-07-03', raw) is None
+
+
+def test_repeated_workouts_share_a_body():
+    _, (first, _) = wods._encode_entry(1234.5, _wod(3))
+    _, (again, _) = wods._encode_entry(1234.5, _wod(24))
+    _, (other, _) = wods._encode_entry(1234.5, _wod(24, strength='Deadlift\n5-5-3-3-1-1'))
+    assert first == again
+    assert first != other
+
+
+def test_rendered_ssml_is_cached():
+    lines = ['21-15-9', 'KB Swings 53#/35#', 'Burpees']
+    first = wods._convert_ssml(lines, 'Conditioning:')
+    assert wods.SSML_CACHE.stats()['entries'] == 1
+    hits = wods.SSML_CACHE.stats()['hits']
+    assert wods._convert_ssml(list(lines), 'Conditioning:') == first
+    assert wods.SSML_CACHE.stats()['hits'] == hits + 1
+    assert wods._convert_ssml(lines, 'Strength Section:') != first
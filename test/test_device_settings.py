@@ -0,0 +1,138 @@
+from _ebcf_alexa import device_settings, env, incoming_types, wods
+from _ebcf_alexa.incoming_types import LambdaEvent
+from bench.standin import StandinAlexaAPI, StandinAPI
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest.mock import patch
+from ebcf_alexa import lambda_handler
+import pytest
+
+from events import OPEN_SKILL, with_alexa_api
+
+DEVICE = 'amzn1.ask.device.AEXAMPLE/1'
+
+
+@pytest.fixture
+def alexa():
+    with StandinAlexaAPI(time_zones={DEVICE: 'America/New_York', 'down-under': 'Australia/Sydney',
+                                     'nowhere': 'Mars/Olympus_Mons'}) as api, \
+            patch.object(incoming_types, 'ALEXA_API_ORIGINS', {api.endpoint}):
+        yield api
+
+
+def _event(api: StandinAlexaAPI, device_id: str = DEVICE, token: str = None) -> dict:
+    return with_alexa_api(api, device_id, token)
+
+
+def test_time_zone_url():
+    assert device_settings.time_zone_url('https://api.amazonalexa.com/', DEVICE) == \
+        'https://api.amazonalexa.com/v2/devices/amzn1.ask.device.AEXAMPLE%2F1/settings/System.timeZone'
+
+
+def test_cached_per_device(alexa):
+    zone = device_settings.event_time_zone(LambdaEvent(_event(alexa)))
+    assert zone.zone == 'America/New_York'
+    assert device_settings.event_time_zone(LambdaEvent(_event(alexa))) is zone
+    assert device_settings.event_time_zone(LambdaEvent(_event(alexa, 'down-under'))).zone == 'Australia/Sydney'
+    assert alexa.requests == 2
+    assert device_settings.TIME_ZONES.stats() == {'devices': 2, 'hits': 1, 'misses': 2, 'failures': 0,
+                                                  'lookups': 2}
+
+
+def test_expires(alexa):
+    zones = device_settings.TimeZones(ttl=60)
+    assert zones.get(alexa.endpoint, DEVICE, alexa.token).zone == 'America/New_York'
+    alexa.time_zones[DEVICE] = 'America/Chicago'
+    assert zones.get(alexa.endpoint, DEVICE, alexa.token).zone == 'America/New_York'
+    with patch.object(device_settings.time, 'monotonic', return_value=device_settings.time.monotonic() + 61):
+        assert zones.get(alexa.endpoint, DEVICE, alexa.token).zone == 'America/Chicago'
+    assert alexa.requests == 2
+
+
+def test_bounded(alexa):
+    zones = device_settings.TimeZones(max_devices=1)
+    zones.get(alexa.endpoint, DEVICE, alexa.token)
+    zones.get(alexa.endpoint, 'down-under', alexa.token)
+    zones.get(alexa.endpoint, DEVICE, alexa.token)
+    assert zones.stats()['devices'] == 1
+    assert alexa.requests == 3
+
+
+@pytest.mark.parametrize('device_id, token', [
+    ('unknown-device', None),
+    ('nowhere', None),
+    (DEVICE, 'wrong-token'),
+])
+def test_failures_fall_back_and_are_remembered(alexa, device_id, token):
+    event = LambdaEvent(_event(alexa, device_id, token))
+    assert device_settings.event_time_zone(event) is None
+    assert device_settings.event_time_zone(event) is None
+    assert alexa.requests == 1
+    assert device_settings.TIME_ZONES.stats()['failures'] == 1
+
+
+def test_unreachable_endpoint():
+    with patch.object(device_settings, 'TIMEOUT_SECONDS', 0.2), \
+            patch.object(incoming_types, 'ALEXA_API_ORIGINS', {'http://127.0.0.1:9'}):
+        assert device_settings.fetch_time_zone('http://127.0.0.1:9', DEVICE, 'token') is None
+
+
+@pytest.mark.parametrize('endpoint', [
+    'https://api.amazonalexa.com',
+    'https://API.eu.amazonalexa.com/',
+    'https://api.fe.amazonalexa.com',
+])
+def test_alexa_api_endpoints(endpoint):
+    assert incoming_types.is_alexa_api_endpoint(endpoint)
+
+
+@pytest.mark.parametrize('endpoint', [
+    'http://api.amazonalexa.com',
+    'https://api.amazonalexa.com.example.com',
+    'https://api.amazonalexa.com@example.com',
+    'https://api.amazonalexa.com:8443',
+    'https://example.com',
+])
+def test_token_only_sent_to_alexa(alexa, endpoint):
+    assert not incoming_types.is_alexa_api_endpoint(endpoint)
+    with patch.object(device_settings, 'urlopen', side_effect=AssertionError('called %s' % endpoint)):
+        assert device_settings.fetch_time_zone(endpoint, DEVICE, alexa.token) is None
+
+
+def test_not_enough_in_event(alexa):
+    event = _event(alexa)
+    del event['context']['System']['apiAccessToken']
+    assert device_settings.event_time_zone(LambdaEvent(event)) is None
+    assert device_settings.event_time_zone(LambdaEvent(OPEN_SKILL)) is None
+    assert alexa.requests == 0
+
+
+def test_concurrent_lookups_share_one_call(alexa):
+    alexa.latency = 0.2
+    with ThreadPoolExecutor(8) as pool:
+        zones = list(pool.map(lambda _: device_settings.TIME_ZONES.get(alexa.endpoint, DEVICE, alexa.token),
+                              range(8)))
+    assert {z.zone for z in zones} == {'America/New_York'}
+    assert alexa.requests == 1
+
+
+def test_today_is_the_devices(alexa):
+    env.freeze(datetime(2017, 9, 1, 19, tzinfo=env.UTC))  # noon in Seattle, 5am Saturday in Sydney
+    try:
+        with StandinAPI() as api, patch.object(wods, 'URL', api.url):
+            ssml = lambda_handler(_event(alexa, 'down-under'), None)['response']['outputSpeech']['ssml']
+            assert ssml.startswith('<speak><p>The workout for today, Saturday September 2, 2017</p>')
+            ssml = lambda_handler(_event(alexa, 'unknown-device'), None)['response']['outputSpeech']['ssml']
+            assert ssml.startswith('<speak><p>The workout for today, Friday September 1, 2017</p>')
+        assert env.tz() is env.TZ
+    finally:
+        env.freeze(None)
+
+
+def test_looked_up_only_when_a_date_is_needed(alexa):
+    event = _event(alexa)
+    event['request'] = {'type': 'IntentRequest', 'requestId': 'amzn1.echo-api.request.2',
+                        'timestamp': '2017-09-03T18:34:11Z', 'locale': 'en-US',
+                        'intent': {'name': 'AMAZON.HelpIntent'}}
+    lambda_handler(event, None)
+    assert alexa.requests == 0
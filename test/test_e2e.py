@@ -1,7 +1,8 @@
 import pytest
 from unittest.mock import NonCallableMagicMock, patch, mock_open, Mock
-from _ebcf_alexa import wods, env
+from _ebcf_alexa import wods, env, metrics
 from _ebcf_alexa.interaction_model import UnkownIntentException
+from _ebcf_alexa.incoming_types import InvalidApplicationId
 from ebcf_alexa import lambda_handler
 from datetime import datetime
 
@@ -123,3 +124,88 @@ def test_interaction_model_breaking_change():
         lambda_handler(DEPRECATED_CODE_REQUEST, NonCallableMagicMock('context'))
     # This is an old intent name that isnt used anymore..
     assert exc_info.value.intent.name == 'GetWOD'
+
+
+def test_foreign_application_id_is_rejected_before_parsing():
+    event = {'version': '1.0',
+             'session': {'application': {'applicationId': 'amzn1.ask.skill.someone-else'}}}
+    with pytest.raises(ValueError) as exc_info:
+        lambda_handler(event, NonCallableMagicMock(name='context'))
+    assert 'someone-else' in str(exc_info.value)
+
+
+@pytest.mark.parametrize('event', [
+    {'version': '1.0', 'context': None},
+    {'version': '1.0', 'session': None, 'context': {'System': None}},
+    {'version': '1.0', 'context': {'System': {'application': None}}},
+    {'version': '1.0', 'session': 'hello', 'context': ['System']},
+    {'version': '1.0', 'session': {'application': 'x'}, 'context': {'System': {'application': 3}}},
+    [],
+    'hello',
+])
+def test_malformed_event_is_rejected_before_parsing(event):
+    with pytest.raises(InvalidApplicationId):
+        lambda_handler(event, NonCallableMagicMock(name='context'))
+
+
+SCHEDULED_EVENT = {
+    'version': '0', 'id': '89d1a02d-5ec7-412e-82f5-13505f849b41',
+    'detail-type': 'Scheduled Event', 'source': 'aws.events',
+    'account': '123456789012', 'time': '2017-09-01T12:00:00Z', 'region': 'us-west-2',
+    'resources': ['arn:aws:events:us-west-2:123456789012:rule/ebcf-keep-warm'],
+    'detail': {}
+}
+
+
+@pytest.mark.parametrize('event', [SCHEDULED_EVENT, {'warmup': True}],
+                         ids=['scheduled-event', 'warmup-flag'])
+def test_warmup_ping(event, mock_urlopen):
+    assert lambda_handler(event, NonCallableMagicMock(name='context')) == {'warmup': True}
+    assert not mock_urlopen.called
+
+
+def test_warmup_ping_primes_cache(mock_now, mock_urlopen):
+    import ebcf_alexa
+    with patch.object(ebcf_alexa, 'WARMUP_PRIMES_CACHE', True):
+        lambda_handler(SCHEDULED_EVENT, NonCallableMagicMock(name='context'))
+    assert mock_urlopen.call_count == 2  # today and tomorrow
+    mock_urlopen.reset_mock()
+    resp = lambda_handler(OPEN_SKILL, NonCallableMagicMock(name='context'))
+    assert not mock_urlopen.called
+    assert EBCF_RESPONSE_WOD_20170901_SSML == resp['response']['outputSpeech']['ssml']
+
+
+def test_event_not_redacted_unless_logged(mock_now, mock_urlopen):
+    from _ebcf_alexa import logs
+    logs.configure({'EBCF_LOG_LEVEL': 'INFO', 'EBCF_LOG_PAYLOAD_SAMPLE_RATE': '1'})
+    try:
+        with patch.object(logs, 'redact_event') as redact_event:
+            lambda_handler(OPEN_SKILL, NonCallableMagicMock(name='context'))
+        assert not redact_event.called
+    finally:
+        logs.configure({})
+
+
+def test_request_summary_logged(mock_now, mock_urlopen, caplog):
+    import json
+    import logging
+    with caplog.at_level(logging.INFO):
+        lambda_handler(OPEN_SKILL, NonCallableMagicMock(name='context'))
+    summaries = [json.loads(r.getMessage()) for r in caplog.records if r.getMessage().startswith('{')]
+    assert len(summaries) == 1
+    summary = summaries[0]
+    assert summary['outcome'] == 'ok'
+    assert summary['request_type'] == 'LaunchRequest'
+    assert 'XXXXX' not in summary['user']
+
+
+def test_metrics_record_emitted(mock_now, mock_urlopen, capsys):
+    import json
+    with patch.object(metrics, 'ENABLED', True):
+        lambda_handler(OPEN_SKILL, NonCallableMagicMock(name='context'))
+    doc = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    for phase in ('lambda_handler', 'parse_event', 'call_api', 'parse_wod_response',
+                  'convert_ssml', 'validate_ssml', 'speechlet_response_dict'):
+        assert phase in doc, phase
+    assert doc['wod_cache_miss'] == 1
+    assert doc['outcome'] == 'ok'
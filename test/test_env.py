@@ -1,5 +1,5 @@
 from _ebcf_alexa import env
-from unittest.mock import patch, call
+from unittest.mock import Mock, patch, call
 import pytest
 
 
@@ -28,3 +28,65 @@ def test_local_date():
     with patch.object(env, 'localnow') as ln:
         assert env.localdate() == ln.return_value.date.return_value
 
+
+def test_freeze():
+    from datetime import datetime, timedelta, timezone
+    at = datetime(2017, 9, 1, 12, tzinfo=timezone(timedelta(hours=-7)))
+    env.freeze(at)
+    try:
+        assert env.now() == at
+        assert env.now().tzinfo is env.UTC
+        assert env.localdate() == at.date()
+    finally:
+        env.freeze(None)
+    assert env.now() != at
+
+
+def test_local_timezone():
+    import threading
+    from datetime import datetime
+    from pytz import timezone
+    env.freeze(datetime(2017, 9, 1, 19, tzinfo=env.UTC))
+    try:
+        seen = {}
+        with env.local_timezone(timezone('Australia/Sydney')):
+            assert env.localnow().hour == 5
+            assert str(env.localdate()) == '2017-09-02'
+            other = threading.Thread(target=lambda: seen.update(date=env.localdate()))
+            other.start()
+            other.join()
+            with env.local_timezone(None):
+                assert env.tz() is env.TZ
+            assert env.tz().zone == 'Australia/Sydney'
+        assert str(seen['date']) == '2017-09-01'  # only this thread's requests
+        assert env.tz() is env.TZ
+        assert str(env.localdate()) == '2017-09-01'
+    finally:
+        env.freeze(None)
+
+
+def test_setting(caplog):
+    assert env.setting('RATE', 2.0, environ={}) == 2.0
+    assert env.setting('RATE', 2.0, environ={'RATE': '0.5'}) == 0.5
+    assert env.setting('BURST', 10, int, environ={'BURST': '4'}) == 4
+    assert not caplog.records
+    assert env.setting('RATE', 2.0, environ={'RATE': 'fast'}) == 2.0
+    assert env.setting('BURST', 10, int, environ={'BURST': '4.5'}) == 10
+    assert [r.levelname for r in caplog.records] == ['WARNING', 'WARNING']
+
+
+@pytest.mark.parametrize('value', ['0', '-1', 'nan'])
+def test_positive_setting(value):
+    assert env.setting('HOURS', 72.0, env.positive, environ={'HOURS': value}) == 72.0
+    assert env.setting('HOURS', 72.0, env.positive, environ={'HOURS': '0.5'}) == 0.5
+
+
+def test_local_timezone_resolved_lazily():
+    from pytz import timezone
+    resolve = Mock(return_value=timezone('Australia/Sydney'))
+    with env.local_timezone(resolve=resolve):
+        assert not resolve.called
+        assert env.tz().zone == 'Australia/Sydney'
+        assert env.tz().zone == 'Australia/Sydney'
+    assert resolve.call_count == 1
+    assert env.tz() is env.TZ
@@ -256,3 +256,35 @@ def test_merging():
     assert req.request.intent.last_intent.name == 'DefaultQuery'
     assert req.request.intent.slots['RelativeTo'].value == 'today\'s'
     assert req.request.intent.slots['Section'].value == 'workout'
+
+
+def test_sections_are_materialized_lazily():
+    event = incoming_types.LambdaEvent(VALID_LAUNCH_REQUEST_LAMBDA_EVENT)
+    with pytest.raises(AttributeError):
+        event._context
+    with pytest.raises(AttributeError):
+        event._session
+    assert event.session.application.application_id == "amzn1.ask.skill.d6f2f7c4-7689-410d-9c35-8f8baae37969"
+    with pytest.raises(AttributeError):
+        event._context
+    assert event.context.system.device.device_id == 'amzn1.ask.device.XXXXX'
+    assert event.context.system.api_endpoint == 'https://api.amazonalexa.com'
+    assert event.context.audio_player.activity == 'STOPPED'
+
+
+def test_views_use_slots():
+    event = incoming_types.LambdaEvent(VALID_INTENT_LAMBDA_EVENT)
+    for obj in (event, event.session, event.context, event.request,
+                event.request.intent, event.request.intent.slots['Section']):
+        assert not hasattr(obj, '__dict__'), obj
+
+
+def test_merging_only_builds_matching_intent():
+    event = dict(INTENT_WITH_ATTRIBUTES)
+    event['session'] = dict(event['session'])
+    event['session']['attributes'] = {'intents': dict(
+        INTENT_WITH_ATTRIBUTES['session']['attributes']['intents'],
+        SomethingElse={'not': 'an intent'}  # would KeyError if it were built
+    )}
+    req = incoming_types.LambdaEvent(event)
+    assert req.request.intent.last_intent.name == 'DefaultQuery'
@@ -1,5 +1,5 @@
 from _ebcf_alexa import interaction_model as im
-from _ebcf_alexa.incoming_types import Intent
+from _ebcf_alexa.incoming_types import Intent, Slot
 from _ebcf_alexa.speechlet import SpeechletResponse
 from _ebcf_alexa.wods import WOD
 from _ebcf_alexa import env
@@ -255,3 +255,79 @@ class TestQueryIntentWithPatchedOutGetWOD(object):
         self.assert_is_full_workout(response)
         assert not response.attributes
         assert response.should_end
+
+
+class TestMisheardSlotValues(object):
+    @pytest.mark.parametrize('value,expected', [
+        ('strenght', im.RequestTypeSlot.STRENGTH),
+        ('conditionning', im.RequestTypeSlot.CONDITIONING),
+        ('workotu', im.RequestTypeSlot.FULL),
+    ])
+    def test_request_type_one_edit_away(self, value, expected):
+        slot = Slot({'name': 'RequestType', 'value': value})
+        assert im._resolve_request_type_slot(slot)[0] == expected
+
+    @pytest.mark.parametrize('value,expected', [
+        ('tomorow', im.RelativeToSlot.TOMORROW),
+        ("yesterdya's", im.RelativeToSlot.YESTERDAY),
+    ])
+    def test_relative_to_one_edit_away(self, value, expected):
+        slot = Slot({'name': 'RelativeTo', 'value': value})
+        assert im._get_relative_to_slot(slot) == expected
+        assert slot.is_valid
+        assert slot.value == expected.spoken_name
+
+
+class TestWeekQuery(object):
+    @pytest.fixture
+    def api(self, mock_now):
+        from bench.standin import StandinAPI
+        from _ebcf_alexa import wods
+        from datetime import date
+        mock_now.return_value = datetime(2017, 9, 6, 19, tzinfo=env.UTC)  # Wednesday
+        with StandinAPI(published_until=date(2017, 9, 7)) as api, patch.object(wods, 'URL', api.url):
+            yield api
+
+    @staticmethod
+    def intent(request_type=None):
+        raw = {'name': 'WeekQuery'}
+        if request_type is not None:
+            raw['slots'] = {'RequestType': {'name': 'RequestType', 'value': request_type}}
+        return Intent(raw)
+
+    def test_whole_week_from_one_call(self, api):
+        response = im._INTENTS['WeekQuery'](self.intent())
+        ssml = response.output_speech.ssml
+        assert api.requests == 1
+        assert ssml.startswith("<speak><p>This week's workout.</p><s>Monday: ")
+        for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday'):
+            assert '<s>%s: ' % day in ssml
+        assert 'Friday through Sunday are not posted yet.' in ssml
+        assert response.card.title == 'Workout for the week of Monday September 4, 2017'
+        assert response.card.content.count('Conditioning:') == 4
+        assert response.should_end
+
+        im._INTENTS['WeekQuery'](self.intent())
+        assert api.requests == 1  # every day is cached now
+        from _ebcf_alexa import wods
+        from datetime import date
+        assert wods._cached_entry(date(2017, 9, 5))[1].strength_lines
+        assert wods._cached_entry(date(2017, 9, 9))[1] is None
+
+    def test_one_section(self, api):
+        response = im.week_query(self.intent('metcon'))
+        assert response.output_speech.ssml.startswith("<speak><p>This week's metcon.</p>")
+        assert 'Strength:' not in response.card.content
+        assert ', then ' not in response.output_speech.ssml
+
+    def test_nothing_posted(self, api, mock_now):
+        api.published_until = datetime(2017, 9, 3).date()
+        response = im.week_query(self.intent())
+        assert response.output_speech.text == \
+            'There is no workout posted yet for the week of Monday September 4, 2017.'
+
+    def test_rate_limited(self, mock_now):
+        from _ebcf_alexa import wods
+        with patch.object(wods, 'USER_BUCKET', wods.TokenBucket(1e-9, 0)):
+            response = im.week_query(self.intent())
+        assert 'trouble reaching' in response.output_speech.text
@@ -0,0 +1,93 @@
+from _ebcf_alexa import logs
+from unittest.mock import patch
+import json
+import logging
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def restore_logging():
+    root = logging.getLogger()
+    saved = root.level, logging.getLogger('_ebcf_alexa.wods').level
+    yield
+    root.setLevel(saved[0])
+    logging.getLogger('_ebcf_alexa.wods').setLevel(saved[1])
+    logs.configure({})
+
+
+def test_configure_levels():
+    logs.configure({'EBCF_LOG_LEVEL': 'warning', 'EBCF_LOG_LEVELS': 'wods=DEBUG, bogus'})
+    assert logging.getLogger().level == logging.WARNING
+    assert logging.getLogger('_ebcf_alexa.wods').level == logging.DEBUG
+
+
+def test_configure_ignores_unknown_levels(caplog):
+    logs.configure({'EBCF_LOG_LEVEL': 'verbose', 'EBCF_LOG_LEVELS': 'wods=loud'})
+    assert logging.getLogger().level == logging.INFO
+    assert logging.getLogger('_ebcf_alexa.wods').level == logging.NOTSET
+    assert "Unknown log level 'VERBOSE'" in caplog.text
+
+
+def test_payload_sampling():
+    logger = logging.getLogger('_ebcf_alexa.wods')
+    logs.configure({'EBCF_LOG_LEVELS': 'wods=DEBUG', 'EBCF_LOG_PAYLOAD_SAMPLE_RATE': '0.5'})
+    with patch.object(logs.random, 'random', return_value=0.4):
+        assert logs.begin_request()
+    assert logs.payload_sampled(logger)
+    with patch.object(logs.random, 'random', return_value=0.6):
+        assert not logs.begin_request()
+    assert not logs.payload_sampled(logger)
+
+
+def test_payload_sampling_disabled_by_default():
+    logs.configure({'EBCF_LOG_LEVEL': 'DEBUG'})
+    assert not logs.begin_request()
+
+
+def test_truncated_is_lazy_and_bounded():
+    class Boom(object):
+        def __repr__(self):
+            raise AssertionError('formatted eagerly')
+    logs.Truncated(Boom())  # not formatted until str()
+    assert str(logs.Truncated('x' * 10, max_chars=4)) == 'xxxx...<6 more chars>'
+    assert str(logs.Truncated({'a': 1})) == "{'a': 1}"
+
+
+@pytest.mark.parametrize('user_id,prefix', [
+    ('amzn1.ask.account.XXXXX', 'amzn1.ask.account.~'),
+    ('nodots', '~'),
+])
+def test_redact_user_id(user_id, prefix):
+    redacted = logs.redact_user_id(user_id)
+    assert redacted.startswith(prefix)
+    assert 'XXXXX' not in redacted
+    assert redacted == logs.redact_user_id(user_id)
+
+
+def test_redact_event():
+    event = {
+        'session': {'user': {'userId': 'amzn1.ask.account.SECRETUSER', 'accessToken': 'linked-token'}},
+        'context': {'System': {
+            'apiAccessToken': 'bearer-token',
+            'user': {'userId': 'amzn1.ask.account.SECRETUSER'},
+            'device': {'deviceId': 'amzn1.ask.device.SECRETDEVICE', 'supportedInterfaces': {}},
+            'person': {'personId': 'amzn1.ask.person.SECRETPERSON'},
+        }},
+        'request': {'type': 'LaunchRequest', 'requestId': 'amzn1.echo-api.request.1'},
+    }
+    original = json.dumps(event)
+    redacted = logs.redact_event(event)
+    text = json.dumps(redacted)
+    for secret in ('SECRETUSER', 'SECRETDEVICE', 'SECRETPERSON', 'linked-token', 'bearer-token'):
+        assert secret not in text
+    assert redacted['context']['System']['device']['deviceId'].startswith('amzn1.ask.device.~')
+    assert redacted['request'] == event['request']
+    assert json.dumps(event) == original  # a copy
+
+
+def test_request_summary_is_one_json_line(caplog):
+    logger = logging.getLogger('test_logs')
+    with caplog.at_level(logging.INFO):
+        logs.log_request_summary(logger, request_id='r1', intent=None, duration_ms=1.5)
+    assert len(caplog.records) == 1
+    assert json.loads(caplog.records[0].getMessage()) == {'request_id': 'r1', 'duration_ms': 1.5}
@@ -0,0 +1,56 @@
+from _ebcf_alexa import metrics
+from unittest.mock import patch
+import json
+import pytest
+
+
+@pytest.fixture
+def enabled():
+    with patch.object(metrics, 'ENABLED', True):
+        yield
+    metrics._local.record = None
+
+
+def test_disabled_is_noop(capsys):
+    metrics.begin()
+    with metrics.span('x'):
+        pass
+    metrics.incr('y')
+    assert metrics.emit() is None
+    assert capsys.readouterr().out == ''
+
+
+def test_spans_and_counters(enabled, capsys):
+    @metrics.timed('func')
+    def func():
+        return 42
+
+    metrics.begin()
+    with metrics.span('block'):
+        assert func() == 42
+    func()
+    metrics.incr('hits')
+    metrics.incr('hits', 2)
+    doc = metrics.emit(request_id='abc', intent=None)
+    assert json.loads(capsys.readouterr().out) == doc
+    assert doc['hits'] == 3
+    assert doc['block'] >= doc['func'] / 2 >= 0
+    assert doc['request_id'] == 'abc'
+    assert 'intent' not in doc
+    definition = doc['_aws']['CloudWatchMetrics'][0]
+    assert definition['Namespace'] == metrics.NAMESPACE
+    assert {'Name': 'hits', 'Unit': 'Count'} in definition['Metrics']
+    assert {'Name': 'func', 'Unit': 'Milliseconds'} in definition['Metrics']
+    # the record is finished
+    assert metrics.emit() is None
+
+
+def test_timed_records_time_on_exception(enabled):
+    @metrics.timed('boom')
+    def boom():
+        raise RuntimeError()
+
+    metrics.begin()
+    with pytest.raises(RuntimeError):
+        boom()
+    assert 'boom' in metrics._current().timings
@@ -0,0 +1,346 @@
+from _ebcf_alexa import env, interaction_model as im, movement_index, wods
+from _ebcf_alexa.incoming_types import Intent
+from bench.standin import StandinAPI, wod_attributes
+from datetime import date, datetime, timedelta
+from ebcf_alexa import lambda_handler
+import ebcf_alexa
+from unittest.mock import patch
+import pytest
+
+
+def _wod(day: date, strength: str = '', conditioning: str = '') -> wods.WOD:
+    midnight = day.strftime('%Y-%m-%d') + 'T00:00:00.000Z'
+    return wods.WOD({'date': midnight, 'publishDate': midnight,
+                     'strength': strength, 'conditioning': conditioning})
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('15 Hang Power Cleans 115#/95#', {'hang', 'power', 'clean', 'hang power', 'power clean', 'hang power clean'}),
+    ('10 HSPU', {'handstand', 'push', 'up', 'handstand push', 'push up', 'handstand push up'}),
+    ('20 T2B', {'toes', 'to', 'bar', 'toes to', 'to bar', 'toes to bar'}),
+    ('3 Rounds', set()),
+    ('400 m Run', {'run'}),
+    ('OH Squat 5x3', {'overhead', 'squat', 'overhead squat'}),
+    ('Pull-ups', {'pull', 'up', 'pull up'}),
+])
+def test_line_terms(line, expected):
+    assert set(movement_index.line_terms(line)) == expected
+
+
+@pytest.mark.parametrize('spoken, term', [
+    ('front squats', 'front squat'),
+    ('Box Jumps', 'box jump'),
+    ('overhead squats', 'overhead squat'),
+    ('KB swings', 'kettlebell swing'),
+    ('the snatches', 'snatch'),
+    ('handstand pushups', 'handstand push up'),
+    ('push press', 'push press'),
+    ('Push Presses', 'push press'),
+    ('bench presses', 'bench press'),
+    ('glasses', 'glass'),
+    ('sit-ups', 'sit up'),
+])
+def test_query_term(spoken, term):
+    assert movement_index.query_term(spoken) == term
+
+
+def test_postings_sorted_and_replaced():
+    index = movement_index.MovementIndex()
+    index.add(_wod(date(2017, 9, 5), 'Front Squat\n5x5'))
+    index.add(_wod(date(2017, 9, 1), 'Front Squats\n3x3'))
+    index.add(_wod(date(2017, 9, 3), conditioning='Row 500m'))
+    assert index.dates('front squats') == [date(2017, 9, 1), date(2017, 9, 5)]
+    assert index.last('front squat') == date(2017, 9, 5)
+    assert index.last('front squat', on_or_before=date(2017, 9, 4)) == date(2017, 9, 1)
+    assert index.last('front squat', on_or_before=date(2017, 8, 31)) is None
+    assert index.last('back squat') is None
+
+    index.add(_wod(date(2017, 9, 5), 'Back Squat\n5x5'))  # the day was reprogrammed
+    assert index.dates('front squat') == [date(2017, 9, 1)]
+    assert index.dates('back squat') == [date(2017, 9, 5)]
+    assert len(index) == 3
+
+
+def test_long_query_intersects_pieces():
+    index = movement_index.MovementIndex()
+    index.add(_wod(date(2017, 9, 1), 'Sumo Deadlift High Pull'))
+    index.add(_wod(date(2017, 9, 2), 'Sumo Deadlift\nHigh Pull'))
+    assert index.dates('SDHP') == [date(2017, 9, 1)]
+    assert index.dates('sumo deadlift high pulls') == [date(2017, 9, 1)]
+
+
+def test_plural_queries():
+    index = movement_index.MovementIndex()
+    index.add(_wod(date(2017, 9, 1), 'Push Press\n5x3', 'Sumo Deadlift High Pull'))
+    index.add(_wod(date(2017, 9, 2), 'Push Presses 4x6'))
+    assert index.dates('push presses') == [date(2017, 9, 1), date(2017, 9, 2)]
+    assert index.dates('Push Press') == [date(2017, 9, 1), date(2017, 9, 2)]
+    assert index.dates('sumo deadlift high pulls') == [date(2017, 9, 1)]
+
+
+def test_long_query_counts():
+    index = movement_index.MovementIndex()
+    for day in (date(2017, 9, 1), date(2017, 9, 8), date(2017, 10, 2)):
+        index.add(_wod(day, 'SDHP 5x5', 'Kipping HSPU'))
+    index.add(_wod(date(2017, 9, 4), 'Sumo Deadlift\nHigh Pull'))
+    september = (date(2017, 9, 1), date(2017, 9, 30))
+    assert index.count('sdhp', *september) == 2
+    assert index.count('sumo deadlift high pulls', *september) == 2
+    assert index.count('kipping handstand push ups', *september) == 2
+    assert index.count('kipping handstand push ups', date(2017, 9, 2), date(2017, 10, 2)) == 2
+    assert index.count('kipping handstand push ups', date(2017, 9, 2), date(2017, 9, 7)) == 0
+
+
+def test_indexed_as_fetched():
+    with StandinAPI() as api, patch.object(wods, 'URL', api.url):
+        day = date(2017, 9, 5)
+        wods.get_wod(day)
+        expected = movement_index.wod_terms(wods.WOD(wod_attributes(day)))
+        assert movement_index.INDEX._indexed[day] == expected
+
+        movement_index.INDEX.clear()
+        wods._DECODED.clear()
+        wods.get_wod(day)  # from the cache this time
+        assert api.requests == 1
+        assert movement_index.INDEX._indexed[day] == expected
+
+
+def test_listener_errors_are_contained():
+    def broken(wod):
+        raise RuntimeError('nope')
+    with patch.object(wods, '_WOD_LISTENERS', [broken]), \
+            StandinAPI() as api, patch.object(wods, 'URL', api.url):
+        assert wods.get_wod(date(2017, 9, 5)).strength_lines
+
+
+class TestLastDidQuery(object):
+    @pytest.fixture
+    def api(self):
+        with StandinAPI(published_until=date(2017, 9, 7)) as api, \
+                patch.object(wods, 'URL', api.url), \
+                patch.object(env, 'now', return_value=datetime(2017, 9, 6, 19, tzinfo=env.UTC)) as now, \
+                patch.object(ebcf_alexa, 'WARMUP_SYNCS_MOVEMENTS', True):
+            api.now = now
+            yield api
+
+    @staticmethod
+    def intent(movement=None):
+        raw = {'name': 'LastDidQuery'}
+        if movement is not None:
+            raw['slots'] = {'Movement': {'name': 'Movement', 'value': movement}}
+        return Intent(raw)
+
+    @staticmethod
+    def _last(term: str, today: date) -> date:
+        day = today
+        while term not in movement_index.wod_terms(wods.WOD(wod_attributes(day))):
+            day -= timedelta(days=1)
+        return day
+
+    @pytest.fixture
+    def backfilled(self, api):
+        im.last_did_query(self.intent('burpees'))
+        assert lambda_handler({'warmup': True}, None) == {'warmup': True}
+        api.requests = 0
+        return api
+
+    def test_answered_from_one_sync(self, api):
+        today = date(2017, 9, 6)
+        expected = self._last('front squat', today)
+        response = im._INTENTS['LastDidQuery'](self.intent('Front Squats'))
+        assert api.requests == 1
+        assert response.output_speech.text == 'We last did front squats on {}, {} days ago.'.format(
+            im._get_speech_date(expected), (today - expected).days)
+        assert response.card.title == 'Front squats'
+        assert response.card.content.startswith('Last 2 times:\n' + im._get_speech_date(expected))
+        assert movement_index.INDEX.synced_since == today - timedelta(days=movement_index.REQUEST_SYNC_DAYS)
+
+        im.last_did_query(self.intent('burpees'))
+        assert api.requests == 1  # same day, nothing to catch up on
+
+    def test_history_backfilled_in_background(self, backfilled):
+        response = im.last_did_query(self.intent('Front Squats'))
+        assert backfilled.requests == 0
+        assert response.card.content.startswith('Last 5 times:\n')
+        assert movement_index.INDEX.synced_since == \
+            date(2017, 9, 6) - timedelta(days=movement_index.HISTORY_DAYS)
+
+        assert lambda_handler({'warmup': True}, None) == {'warmup': True}
+        assert backfilled.requests == 1  # only the catch-up, not the history again
+
+    def test_warmup_leaves_unasked_containers_alone(self, api):
+        assert lambda_handler({'warmup': True}, None) == {'warmup': True}
+        assert movement_index.INDEX.synced_since is None
+
+    def test_warmup_sync_is_opt_in(self, api):
+        im.last_did_query(self.intent('burpees'))
+        with patch.object(ebcf_alexa, 'WARMUP_SYNCS_MOVEMENTS', False):
+            assert lambda_handler({'warmup': True}, None) == {'warmup': True}
+        assert api.requests == 1
+
+    def test_catches_up_next_day(self, api):
+        im.last_did_query(self.intent('deadlifts'))
+        api.now.return_value = datetime(2017, 9, 7, 19, tzinfo=env.UTC)
+        api.published_until = date(2017, 9, 8)
+        response = im.last_did_query(self.intent('push press'))
+        assert api.requests == 2
+        expected = self._last('push press', date(2017, 9, 7))
+        assert im._days_ago(expected, date(2017, 9, 7)) in response.output_speech.text
+
+    def test_never(self, api):
+        response = im.last_did_query(self.intent('muscle ups'))
+        assert response.output_speech.text == \
+            'I don\'t see muscle ups in any workout since Wednesday August 23, 2017.'
+
+    def test_never_backfilled(self, backfilled):
+        response = im.last_did_query(self.intent('muscle ups'))
+        assert response.output_speech.text == \
+            'I don\'t see muscle ups in any workout since Friday March 10, 2017.'
+
+    @pytest.mark.parametrize('movement', [None, '', '3 rounds'])
+    def test_missing_movement(self, api, movement):
+        response = im.last_did_query(self.intent(movement))
+        assert response.output_speech.text.startswith('Which movement?')
+        assert not response.should_end
+        assert api.requests == 0
+
+    def test_rate_limited(self, api):
+        with patch.object(wods, 'USER_BUCKET', wods.TokenBucket(1e-9, 0)):
+            response = im.last_did_query(self.intent('front squats'))
+        assert 'trouble reaching' in response.output_speech.text
+
+
+def test_counts_match_postings():
+    import random
+    rng = random.Random(43)
+    index = movement_index.MovementIndex()
+    days = [date(2017, 1, 1) + timedelta(days=i) for i in range(120)]
+    rng.shuffle(days)  # older days arrive after newer ones, and some change
+    for day in days + days[:30]:
+        index.add(_wod(day, rng.choice(['Deadlift', 'Front Squat', 'Push Press']),
+                       rng.choice(['Row', 'Deadlifts\nBurpees', ''])))
+    for _ in range(200):
+        start = date(2016, 12, 20) + timedelta(days=rng.randrange(140))
+        end = start + timedelta(days=rng.randrange(-5, 60))
+        for movement in ('deadlift', 'front squat', 'burpee', 'row', 'muscle up'):
+            expected = sum(start <= d <= end for d in index.dates(movement))
+            assert index.count(movement, start, end) == expected
+
+
+def test_counts_compact():
+    counts = movement_index.MovementCounts()
+    counts.update(date(2017, 1, 10), (), ['deadlift'])
+    counts.update(date(2017, 1, 1), (), ['deadlift', 'row'])
+    assert counts.count('deadlift', date(2017, 1, 1), date(2017, 1, 10)) == 2
+    assert counts.count('deadlift', date(2017, 1, 2), date(2018, 1, 1)) == 1
+    assert counts.count('row', date(2017, 1, 1), date(2017, 1, 1)) == 1
+    assert counts.nbytes() == (11 + 2) * 2  # each array ends after its last change
+
+
+def test_counts_stay_right_while_rebasing():
+    import threading
+    counts = movement_index.MovementCounts()
+    day = date(2017, 1, 1)
+    counts.update(day, (), ['deadlift'])
+    done = threading.Event()
+    wrong = []
+
+    def count():
+        while not done.is_set():
+            n = counts.count('deadlift', day, day)
+            if n != 1:
+                wrong.append(n)
+
+    readers = [threading.Thread(target=count) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    try:
+        for back in range(1, 400):  # every update is an older day: a rebase
+            counts.update(day - timedelta(days=back), (), ['row'] * (back % 50 + 1))
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+    assert wrong == []
+
+
+@pytest.mark.parametrize('period, start', [
+    ('week', date(2017, 8, 14)),
+    ('month', date(2017, 8, 1)),
+    ('quarter', date(2017, 7, 1)),
+    ('year', date(2017, 1, 1)),
+])
+def test_period_start(period, start):
+    assert movement_index.period_start(period, date(2017, 8, 17)) == start
+
+
+def test_main(capsys):
+    with StandinAPI() as api, patch.object(wods, 'URL', api.url):
+        movement_index.main(['deadlift', 'muscle ups', '--through', '2017-09-06', '--days', '100'])
+    out = capsys.readouterr().out.splitlines()
+    assert api.requests == 1
+    assert out[0].endswith('days indexed, 2017-05-29 to 2017-09-06')
+    deadlift = out[2].split()
+    assert deadlift[0] == 'deadlift'
+    assert deadlift[1] == movement_index.INDEX.last('deadlift').isoformat()
+    assert out[3].split()[2:] == ['-', '0', '0', '0', '0']
+
+
+class TestMovementStatsQuery(object):
+    @pytest.fixture
+    def api(self):
+        with StandinAPI(published_until=date(2017, 9, 7)) as api, \
+                patch.object(wods, 'URL', api.url), \
+                patch.object(env, 'now', return_value=datetime(2017, 9, 6, 19, tzinfo=env.UTC)), \
+                patch.object(ebcf_alexa, 'WARMUP_SYNCS_MOVEMENTS', True):
+            yield api
+
+    @staticmethod
+    def intent(movement, period=None):
+        slots = {'Movement': {'name': 'Movement', 'value': movement}}
+        if period is not None:
+            slots['Period'] = {'name': 'Period', 'value': period}
+        return Intent({'name': 'MovementStatsQuery', 'slots': slots})
+
+    @staticmethod
+    def _expected(term: str, start: date, end: date) -> int:
+        return sum(term in movement_index.wod_terms(wods.WOD(wod_attributes(start + timedelta(days=i))))
+                   for i in range((end - start).days + 1))
+
+    @pytest.fixture
+    def backfilled(self, api):
+        im.movement_stats_query(self.intent('burpees'))
+        assert lambda_handler({'warmup': True}, None) == {'warmup': True}
+        api.requests = 0
+        return api
+
+    def test_this_quarter(self, backfilled):
+        count = self._expected('deadlift', date(2017, 7, 1), date(2017, 9, 6))
+        response = im._INTENTS['MovementStatsQuery'](self.intent('Deadlifts', 'this quarter'))
+        assert response.output_speech.text == 'We\'ve done deadlifts {} times this quarter.'.format(count)
+        assert backfilled.requests == 0
+
+    def test_partial_history_in_fresh_container(self, api):
+        count = self._expected('deadlift', date(2017, 8, 23), date(2017, 9, 6))
+        response = im.movement_stats_query(self.intent('Deadlifts', 'this quarter'))
+        assert response.output_speech.text == (
+            'We\'ve done deadlifts {} times this quarter that I know of, '
+            'going back to Wednesday August 23, 2017.'.format(count))
+        assert api.requests == 1
+
+    def test_defaults_to_month(self, api):
+        count = self._expected('box jump', date(2017, 9, 1), date(2017, 9, 6))
+        response = im.movement_stats_query(self.intent('box jumps', 'whenever'))
+        assert response.output_speech.text == 'We\'ve done box jumps {} {} this month.'.format(
+            count, 'time' if count == 1 else 'times')
+
+    def test_year_clipped_to_history(self, backfilled):
+        count = self._expected('thruster', date(2017, 3, 10), date(2017, 9, 6))
+        response = im.movement_stats_query(self.intent('thrusters', 'year'))
+        assert response.output_speech.text == (
+            'We\'ve done thrusters {} times this year that I know of, '
+            'going back to Friday March 10, 2017.'.format(count))
+
+    def test_never(self, api):
+        response = im.movement_stats_query(self.intent('muscle ups', 'week'))
+        assert response.output_speech.text == 'We haven\'t done muscle ups this week.'
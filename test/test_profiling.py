@@ -0,0 +1,90 @@
+from _ebcf_alexa import profiling
+from unittest.mock import patch
+import logging
+import pytest
+
+
+def work(n):
+    return sum(i * i for i in range(n))
+
+
+def test_run_with_cprofile_logs_summary(caplog):
+    settings = profiling.Settings(modes=[profiling.CPROFILE], top_n=5)
+    with caplog.at_level(logging.INFO, logger=profiling.__name__):
+        assert profiling.run(work, 10, settings=settings) == 285
+    summary = caplog.records[-1].getMessage()
+    assert 'Profiled work' in summary
+    assert 'cumulative' in summary
+
+
+def test_run_with_tracemalloc_writes_files(tmpdir):
+    settings = profiling.Settings(modes=[profiling.CPROFILE, profiling.TRACEMALLOC],
+                                  top_n=3, out_dir=str(tmpdir))
+    profiling.run(lambda: [str(i) for i in range(1000)], settings=settings)
+    names = sorted(f.basename for f in tmpdir.listdir())
+    assert len(names) == 2
+    assert names[0].endswith('.prof') and names[1].endswith('.txt')
+    assert 'allocation sites' in tmpdir.join(names[1]).read()
+    assert not profiling.tracemalloc.is_tracing()
+
+
+def test_reporting_failure_keeps_the_result(caplog):
+    settings = profiling.Settings(modes=[profiling.CPROFILE, profiling.TRACEMALLOC], out_dir='/nonexistent/dir')
+    with caplog.at_level(logging.ERROR, logger=profiling.__name__):
+        assert profiling.run(lambda: 1, settings=settings) == 1
+    assert 'Failed to report' in caplog.records[-1].getMessage()
+    assert not profiling.tracemalloc.is_tracing()
+
+
+def test_one_profiled_invocation_at_a_time():
+    import threading
+    settings = profiling.Settings(modes=[profiling.CPROFILE, profiling.TRACEMALLOC])
+    entered, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow():
+        entered.set()
+        release.wait(5)
+        return 'first'
+    first = threading.Thread(target=lambda: results.append(profiling.run(slow, settings=settings)))
+    first.start()
+    assert entered.wait(5)
+    with patch.object(profiling, '_report') as report:
+        assert profiling.run(work, 10, settings=settings) == 285  # not profiled, still answered
+        assert not report.called
+    release.set()
+    first.join(5)
+    assert results == ['first']
+    assert not profiling.tracemalloc.is_tracing()
+
+
+def test_profiled_samples():
+    calls = []
+
+    @profiling.profiled
+    def func():
+        return 1
+
+    with patch.object(profiling, 'run', side_effect=lambda f: calls.append(f) or f()):
+        with patch.object(profiling, 'SETTINGS', profiling.Settings(sample_rate=0)):
+            assert func() == 1
+        assert not calls
+        with patch.object(profiling, 'SETTINGS', profiling.Settings(sample_rate=1)):
+            assert func() == 1
+        assert len(calls) == 1
+
+
+def test_settings_from_environ():
+    settings = profiling.Settings.from_environ({
+        'EBCF_PROFILE_SAMPLE_RATE': '0.25', 'EBCF_PROFILE_MODES': 'cprofile, tracemalloc',
+        'EBCF_PROFILE_TOP_N': '7', 'EBCF_PROFILE_DIR': '/tmp'})
+    assert settings.sample_rate == 0.25
+    assert settings.modes == (profiling.CPROFILE, profiling.TRACEMALLOC)
+    assert settings.top_n == 7
+    assert settings.out_dir == '/tmp'
+    assert profiling.Settings.from_environ({'EBCF_PROFILE_MODES': 'strace'}).sample_rate == 0
+
+
+def test_bad_mode():
+    with pytest.raises(ValueError):
+        profiling.Settings(modes=['perf'])
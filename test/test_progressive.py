@@ -0,0 +1,116 @@
+from _ebcf_alexa import device_settings, env, incoming_types, progressive, wods
+from _ebcf_alexa.incoming_types import LambdaEvent
+from bench.standin import StandinAlexaAPI, StandinAPI
+from datetime import datetime
+from unittest.mock import call, patch
+from ebcf_alexa import lambda_handler
+import time
+import pytest
+
+from events import OPEN_SKILL, with_alexa_api
+
+SPEAK = {'header': {'requestId': 'amzn1.echo-api.request.1'},
+         'directive': {'type': 'VoicePlayer.Speak', 'speech': progressive.SPEECH}}
+
+
+class Context(object):
+    def __init__(self, remaining_ms: int):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self) -> int:
+        return self.remaining_ms
+
+
+@pytest.fixture
+def alexa():
+    with StandinAlexaAPI() as alexa, patch.object(device_settings, 'TIMEOUT_SECONDS', 0.05), \
+            patch.object(incoming_types, 'ALEXA_API_ORIGINS', {alexa.endpoint}):
+        yield alexa
+
+
+@pytest.fixture
+def api():
+    with StandinAPI(latency=0.3) as api, patch.object(wods, 'URL', api.url), \
+            patch.object(env, 'now', return_value=datetime(2017, 9, 6, 15, tzinfo=env.UTC)):
+        yield api
+
+
+def _event(alexa: StandinAlexaAPI, token: str = None) -> dict:
+    return with_alexa_api(alexa, 'amzn1.ask.device.1', token)
+
+
+def _ssml(response: dict) -> str:
+    return response['response']['outputSpeech']['ssml']
+
+
+def test_speaks_while_fetching(alexa, api):
+    response = lambda_handler(_event(alexa), Context(8000))
+    done = time.monotonic()
+    assert _ssml(response).startswith('<speak><p>The workout for today, Wednesday September 6, 2017</p>')
+    assert alexa.directives == [SPEAK]
+    assert alexa.directive_times[0] < done - 0.2  # while the 300ms fetch was still going
+
+    # cached now: nothing to wait for, nothing to say
+    lambda_handler(_event(alexa), Context(8000))
+    assert len(alexa.directives) == 1
+
+
+def test_not_past_the_deadline(alexa, api):
+    lambda_handler(_event(alexa), Context(int(progressive.DEADLINE_MARGIN_SECONDS * 1000) - 1))
+    assert alexa.directives == []
+    assert api.requests == 1
+
+
+def test_without_an_endpoint(alexa, api):
+    lambda_handler(OPEN_SKILL, Context(8000))
+    assert alexa.requests == 0
+
+
+def test_refused(alexa, api):
+    response = lambda_handler(_event(alexa, token='expired'), Context(8000))
+    assert _ssml(response).startswith('<speak><p>The workout for today')
+    assert alexa.directives == []
+    assert not progressive.send_speech(alexa.endpoint, 'expired', 'amzn1.echo-api.request.1', progressive.SPEECH, 1)
+
+
+def test_only_alexa_endpoints(alexa, api):
+    with patch.object(incoming_types, 'ALEXA_API_ORIGINS', frozenset()):
+        lambda_handler(_event(alexa), Context(8000))
+        assert not progressive.send_speech(alexa.endpoint, alexa.token, 'amzn1.echo-api.request.1',
+                                           progressive.SPEECH, 1)
+    assert alexa.requests == 0
+
+
+def test_slow_endpoint_is_not_waited_for(alexa):
+    alexa.latency = 0.8  # slow, but within the default TIMEOUT_SECONDS
+    start = time.monotonic()
+    with progressive.for_request(LambdaEvent(_event(alexa)), Context(8000)):
+        with progressive.Progressive() as progress:
+            progress.start()
+            progress.start()  # once per request
+    assert time.monotonic() - start < 0.5
+    assert alexa.requests == 1
+
+
+def test_answer_not_held_for_slow_directive(alexa, api):
+    alexa.latency = 0.8  # the fetch takes 0.3s
+    with patch.object(progressive.metrics, 'incr', wraps=progressive.metrics.incr) as incr:
+        response = lambda_handler(_event(alexa), Context(8000))
+    assert _ssml(response).startswith('<speak><p>The workout for today')
+    assert call('progressive_late') in incr.call_args_list  # answered with the directive in flight
+
+
+@pytest.mark.perf
+def test_answer_not_held_for_slow_directive_timing(alexa, api):
+    alexa.latency = 0.8
+    start = time.monotonic()
+    lambda_handler(_event(alexa), Context(8000))
+    # time zone lookup (0.05s timeout) + fetch, not the directive's 0.8s
+    assert time.monotonic() - start < 0.6
+
+
+def test_disabled(alexa):
+    with patch.object(progressive, 'ENABLED', False), progressive.for_request(LambdaEvent(_event(alexa))):
+        with progressive.Progressive() as progress:
+            progress.start()
+    assert alexa.requests == 0
@@ -0,0 +1,112 @@
+from _ebcf_alexa import env, interaction_model as im, query_mix, wods
+from _ebcf_alexa.interaction_model import RelativeToSlot, RequestTypeSlot
+from bench.standin import StandinAPI
+from datetime import datetime
+from unittest.mock import patch
+from ebcf_alexa import lambda_handler
+import ebcf_alexa
+import pytest
+
+HOUR = 60 * 60
+
+
+def test_decaying_weights():
+    mix = query_mix.QueryMix(half_life=HOUR)
+    for _ in range(4):
+        mix.record(7, 'today', now=0)
+    mix.record(7, 'tomorrow', now=0)
+    mix.record(19, 'tomorrow', now=0)
+    assert mix.weights([7], now=0) == {'today': 4.0, 'tomorrow': 1.0}
+    assert mix.weights([7], now=2 * HOUR) == {'today': 1.0, 'tomorrow': 0.25}
+    assert mix.weights([7, 19], now=HOUR) == {'today': 2.0, 'tomorrow': 1.0}
+
+    mix.record(7, 'tomorrow', now=2 * HOUR)  # the old counts fade as new ones arrive
+    assert mix.weights([7], now=2 * HOUR) == {'today': 1.0, 'tomorrow': 1.25}
+
+
+def test_predict():
+    mix = query_mix.QueryMix(half_life=HOUR)
+    for query, n in (('a', 10), ('b', 5), ('c', 3), ('d', 1)):
+        for _ in range(n):
+            mix.record(6, query, now=0)
+    mix.record(8, 'e', now=0)
+    assert mix.predict(6, now=0) == ['a', 'b', 'c']
+    assert mix.predict(6, now=0, min_share=0.2) == ['a', 'b']
+    assert mix.predict(5, now=0, top=1) == ['a']  # looks an hour ahead
+    assert mix.predict(5, now=0, hours_ahead=0) == []
+    assert mix.predict(23, now=0, hours_ahead=7) == ['a', 'b', 'c']  # wraps past midnight
+
+
+def test_prediction_scoring():
+    mix = query_mix.QueryMix()
+    mix.expect('a', now=0)
+    mix.expect('a', now=10)  # still live: not a new prediction
+    mix.expect('b', now=0)
+    assert mix.observed('a', now=20)
+    assert mix.observed('a', now=30)
+    assert not mix.observed('c', now=30)
+    assert not mix.observed('b', now=query_mix.PREDICTION_TTL_SECONDS + 1)  # too late
+    assert mix.stats() == {'predictions': 2, 'hits': 1, 'hit_rate': 0.5, 'predicted_queries': 2,
+                           'unpredicted_queries': 2, 'tracked': 0}
+
+
+class TestPrefetch(object):
+    @pytest.fixture
+    def api(self):
+        with StandinAPI() as api, patch.object(wods, 'URL', api.url), \
+                patch.object(env, 'now', return_value=datetime(2017, 9, 6, 3, tzinfo=env.UTC)) as now, \
+                patch.object(ebcf_alexa, 'WARMUP_PREFETCHES', True):
+            api.now = now  # 8pm the evening before, in Seattle
+            yield api
+
+    def test_evening_traffic_prefetches_tomorrow(self, api):
+        for _ in range(3):
+            im.wod_query(RelativeToSlot.TOMORROW, None, RequestTypeSlot.STRENGTH)
+        im.wod_query(RelativeToSlot.TODAY, None, RequestTypeSlot.CONDITIONING)
+        assert im.QUERY_MIX.stats()['unpredicted_queries'] == 4
+
+        # the next evening, before anyone asks
+        api.now.return_value = datetime(2017, 9, 7, 3, tzinfo=env.UTC)
+        requests = api.requests
+        assert lambda_handler({'warmup': True}, None) == {'warmup': True}
+        assert api.requests == requests + 1  # today's (the 6th) was cached last night
+        hits = wods.SSML_CACHE.stats()['hits']
+        response = im.wod_query(RelativeToSlot.TOMORROW, None, RequestTypeSlot.STRENGTH)
+        assert response.output_speech.ssml.startswith('<speak><p>The strength for tomorrow, Thursday September 7')
+        assert api.requests == requests + 1
+        assert wods.SSML_CACHE.stats()['hits'] > hits
+        stats = im.QUERY_MIX.stats()
+        assert stats['predictions'] == 2
+        assert stats['hits'] == 1
+
+    def test_warmup_prefetch_is_opt_in(self, api):
+        im.wod_query(RelativeToSlot.TOMORROW, None, RequestTypeSlot.STRENGTH)
+        api.now.return_value = datetime(2017, 9, 7, 3, tzinfo=env.UTC)
+        requests = api.requests
+        with patch.object(ebcf_alexa, 'WARMUP_PREFETCHES', False):
+            assert lambda_handler({'warmup': True}, None) == {'warmup': True}
+        assert api.requests == requests
+        assert im.QUERY_MIX.stats()['predictions'] == 0
+
+    def test_quiet_without_history(self, api):
+        assert im.prefetch_likely_queries() == 0
+        assert api.requests == 0
+
+    def test_rate_limited(self, api):
+        im.wod_query(RelativeToSlot.TODAY, None, RequestTypeSlot.FULL)
+        with patch.object(wods, 'BACKGROUND_BUCKET', wods.TokenBucket(1e-9, 0)):
+            wods.clear_cache()
+            assert im.prefetch_likely_queries() == 1
+        assert api.requests == 1
+
+    def test_recorded_in_gym_time(self, api):
+        from pytz import timezone
+        with env.local_timezone(timezone('US/Eastern')):  # 11pm there, 8pm at the gym
+            im.wod_query(RelativeToSlot.TOMORROW, None, RequestTypeSlot.STRENGTH)
+        assert im.QUERY_MIX.predict(20, hours_ahead=0) == [(RelativeToSlot.TOMORROW, RequestTypeSlot.STRENGTH)]
+        assert im.QUERY_MIX.predict(23, hours_ahead=0) == []
+
+        im.prefetch_likely_queries()  # expects the gym's tomorrow, the 6th
+        with env.local_timezone(timezone('US/Eastern')):
+            im.wod_query(RelativeToSlot.TOMORROW, None, RequestTypeSlot.STRENGTH)
+        assert im.QUERY_MIX.stats()['hits'] == 1
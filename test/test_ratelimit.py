@@ -0,0 +1,30 @@
+from _ebcf_alexa.ratelimit import TokenBucket
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.5  # one token
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 100  # never more than burst
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    stats = bucket.stats()
+    assert stats['allowed'] == 7
+    assert stats['throttled'] == 3
+    assert stats['tokens'] == 0
+
+
+def test_unlimited():
+    bucket = TokenBucket(rate=None, burst=0)
+    assert all(bucket.try_acquire() for _ in range(1000))
+    assert bucket.stats()['throttled'] == 0
@@ -0,0 +1,170 @@
+from _ebcf_alexa import env, refresh, replay, wods
+from bench.standin import StandinAPI
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+from ebcf_alexa import lambda_handler
+import json
+import pytest
+
+TODAY = date(2017, 9, 6)
+TOMORROW = TODAY + timedelta(days=1)
+SCHEDULED_REFRESH = {
+    'version': '0',
+    'id': '89d1a02d-5ec7-412e-82f5-13505f849b41',
+    'detail-type': 'Scheduled Event',
+    'source': 'aws.events',
+    'account': '123456789012',
+    'time': '2017-09-07T03:55:00Z',
+    'region': 'us-west-2',
+    'resources': ['arn:aws:events:us-west-2:123456789012:rule/ebcf-refresh'],
+    'detail': {'action': 'refresh'}
+}
+
+
+class FakeClock(object):
+    """Sleeping advances the clock, and publishes tomorrow's WOD at ``publish_at``."""
+
+    def __init__(self, api: StandinAPI, publish_at: float = None):
+        self.api = api
+        self.publish_at = publish_at
+        self.now = 0.0
+        self.sleeps = 0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps += 1
+        self.now += seconds
+        if self.publish_at is not None and self.now >= self.publish_at:
+            self.api.published_until = TOMORROW
+
+
+@pytest.fixture
+def api():
+    with StandinAPI(published_until=TODAY) as api, patch.object(wods, 'URL', api.url), \
+            patch.object(env, 'now', return_value=datetime(2017, 9, 7, 3, 55, tzinfo=env.UTC)):
+        yield api
+
+
+@pytest.mark.parametrize('event, expected', [
+    (SCHEDULED_REFRESH, True),
+    ({'action': 'refresh'}, True),
+    ({'refresh': True}, True),
+    ({'action': 'warmup'}, False),
+    (dict(SCHEDULED_REFRESH, detail={}), False),
+    (dict(SCHEDULED_REFRESH, source='aws.s3'), False),
+    ({'warmup': True}, False),
+])
+def test_is_refresh_event(event, expected):
+    assert refresh.is_refresh_event(event) == expected
+
+
+def test_polls_until_published(api):
+    clock = FakeClock(api, publish_at=90)
+    outcomes = refresh.refresh([TODAY, TOMORROW], window=600, poll=30, sleep=clock.sleep, clock=clock)
+    assert outcomes == {TODAY: refresh.PUBLISHED, TOMORROW: refresh.PUBLISHED}
+    assert clock.sleeps == 3
+    assert api.requests == 5  # today once, tomorrow until it showed up
+
+    # another container sharing the cache neither fetches nor renders
+    wods.SSML_CACHE.clear()
+    wods._DECODED.clear()
+    with patch.object(wods, '_render_ssml', side_effect=AssertionError('rendered')):
+        wod = wods.get_wod(TOMORROW)
+        assert '<p>Strength Section:</p>' in wod.full_ssml()
+    assert api.requests == 5
+
+
+def test_gives_up(api):
+    clock = FakeClock(api)
+    outcomes = refresh.refresh([TOMORROW], window=100, poll=30, sleep=clock.sleep, clock=clock)
+    assert outcomes == {TOMORROW: refresh.NOT_PUBLISHED}
+    assert clock.sleeps == 3
+    assert api.requests == 4
+    assert wods._cached_entry(TOMORROW)[1] is None
+
+
+def test_rate_limited(api):
+    clock = FakeClock(api)
+    with patch.object(wods, 'BACKGROUND_BUCKET', wods.TokenBucket(1e-9, 0)):
+        outcomes = refresh.refresh([TOMORROW], window=0, poll=30, sleep=clock.sleep, clock=clock)
+    assert outcomes == {TOMORROW: refresh.RATE_LIMITED}
+    assert api.requests == 0
+
+
+def test_poll_has_a_floor(api):
+    clock = FakeClock(api)
+    outcomes = refresh.refresh([TOMORROW], window=10, poll=0, sleep=clock.sleep, clock=clock)
+    assert outcomes == {TOMORROW: refresh.NOT_PUBLISHED}
+    assert api.requests == clock.sleeps + 1 == 11
+
+
+def test_bad_dates_are_skipped(caplog):
+    event = {'action': 'refresh', 'dates': ['2017-09-07', 'tomorrow', None]}
+    assert refresh.event_dates(event) == [TOMORROW]
+    assert len([r for r in caplog.records if r.levelname == 'WARNING']) == 2
+
+
+@pytest.mark.parametrize('options', [
+    {'window_s': 'soon', 'poll_s': 'often'},
+    {'window_s': -1, 'poll_s': 0},
+    {'window_s': None, 'poll_s': -5},
+    {'window_s': [], 'poll_s': float('nan')},
+])
+def test_bad_options_fall_back(options):
+    event = {'action': 'refresh', 'dates': ['2017-09-07']}
+    event.update(options)
+    assert refresh.event_window(event, None) == refresh.WINDOW_SECONDS
+    with patch.object(refresh, 'refresh', return_value={}) as run:
+        assert refresh.on_refresh_event(event, None) == {'refresh': {}}
+    assert run.call_args[0][1:] == (refresh.WINDOW_SECONDS, refresh.POLL_SECONDS)
+
+
+def test_window_capped_by_invocation_deadline():
+    assert refresh.event_window({'detail': {'window_s': 60}}, None) == 60
+    assert refresh.event_window(SCHEDULED_REFRESH, replay.ReplayContext(0)) == 8 - refresh.DEADLINE_MARGIN_SECONDS
+    assert refresh.event_window({'refresh': True}, replay.ReplayContext(0)) > 0
+
+
+@pytest.mark.parametrize('event', [
+    SCHEDULED_REFRESH,
+    json.loads('{"action": "refresh"}'),  # a rule's constant input, as is
+    {'action': 'refresh', 'dates': ['2017-09-06', '2017-09-07']},
+    {'refresh': True, 'detail': {'dates': ['2017-09-06', '2017-09-07']}},
+], ids=['scheduled-event', 'constant-input', 'constant-input-with-dates', 'refresh-flag'])
+def test_lambda_handler(api, event):
+    with patch.object(refresh, 'POLL_SECONDS', 0.01), patch.object(refresh, 'MIN_POLL_SECONDS', 0.01), \
+            patch.object(refresh, 'WINDOW_SECONDS', 0.05):
+        response = lambda_handler(event, None)
+    assert response == {'refresh': {'2017-09-06': 'published', '2017-09-07': 'not published'}}
+    assert wods._cached_entry(TODAY)[1].strength_lines
+    assert api.requests >= 3  # kept polling for tomorrow's
+
+
+def test_waits_for_expected_publish_time(api):
+    for day in (date(2017, 8, 31), date(2017, 9, 1), date(2017, 9, 2)):
+        wods.get_wod(day)  # teaches PUBLISH_TIMES: 9pm the evening before
+    requests = api.requests
+    api.published_until = TOMORROW
+    clock = FakeClock(api)
+    # 8:55pm: tomorrow's is expected from 8:50pm, the 8th's not for another day
+    outcomes = refresh.refresh([TOMORROW, TOMORROW + timedelta(days=1)], window=600, poll=30,
+                               sleep=clock.sleep, clock=clock)
+    assert outcomes == {TOMORROW: refresh.PUBLISHED, TOMORROW + timedelta(days=1): refresh.NOT_EXPECTED_YET}
+    assert api.requests == requests + 1
+    assert clock.sleeps == 0
+
+
+def test_sleeps_until_expected(api):
+    for day in (date(2017, 8, 31), date(2017, 9, 1), date(2017, 9, 2)):
+        wods.get_wod(day)
+    requests = api.requests
+    env.now.return_value = datetime(2017, 9, 7, 3, 30, tzinfo=env.UTC)  # 8:30pm, 20 minutes early
+    clock = FakeClock(api, publish_at=1200)
+    assert refresh.refresh([TOMORROW], window=600, poll=30, sleep=clock.sleep, clock=clock) == \
+        {TOMORROW: refresh.NOT_EXPECTED_YET}
+    assert (api.requests, clock.sleeps) == (requests, 0)
+    assert refresh.refresh([TOMORROW], window=1800, poll=30, sleep=clock.sleep, clock=clock) == \
+        {TOMORROW: refresh.PUBLISHED}
+    assert (api.requests, clock.sleeps, clock.now) == (requests + 1, 1, 1200)
@@ -0,0 +1,111 @@
+from _ebcf_alexa import env, replay, wods
+from bench.standin import StandinAPI
+from ebcf_alexa import lambda_handler, _main
+from datetime import datetime
+from unittest.mock import patch
+import io
+import json
+import pytest
+
+from events import OPEN_SKILL
+
+FOREIGN = dict(OPEN_SKILL, session=dict(OPEN_SKILL['session'], application={'applicationId': 'nope'}))
+
+
+def _corpus(*events) -> io.StringIO:
+    return io.StringIO('\n'.join(json.dumps(e) for e in events) + '\n\n')
+
+
+@pytest.fixture
+def api():
+    with StandinAPI() as api, patch.object(wods, 'URL', api.url):
+        env.freeze(datetime(2017, 9, 1, 19, tzinfo=env.UTC))
+        try:
+            yield api
+        finally:
+            env.freeze(None)
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_replay_in_order(api, workers):
+    results = replay.replay([OPEN_SKILL, FOREIGN, {'warmup': True}] * 3, lambda_handler, workers)
+    assert [r.index for r in results] == list(range(9))
+    assert results[0].response['response']['outputSpeech']['ssml'].startswith(
+        '<speak><p>The workout for today, Friday September 1, 2017</p>')
+    assert results[1].error == 'InvalidApplicationId: Invalid Application ID: nope'
+    assert results[2].response == {'warmup': True}
+    assert all(r.latency_ms >= 0 for r in results)
+
+
+def test_summarize():
+    results = [replay.Result(i, {}, None, float(i)) for i in range(1, 101)]
+    summary = replay.summarize(results, 2.0)
+    assert summary['events_per_s'] == 50.0
+    assert summary['latency_ms']['p50'] == 51.0
+    assert summary['latency_ms']['p99'] == 99.0
+    assert summary['latency_ms']['max'] == 100.0
+
+
+def test_run_writes_output_and_matches_golden(api):
+    output, report = io.StringIO(), io.StringIO()
+    assert replay.run(_corpus(OPEN_SKILL, {'warmup': True}), lambda_handler, output=output, report=report) == 0
+    assert '2 events in' in report.getvalue()
+    lines = [json.loads(l) for l in output.getvalue().splitlines()]
+    assert [l['index'] for l in lines] == [0, 1]
+    assert all(l['latency_ms'] >= 0 for l in lines)  # to find the slow ones
+
+    report = io.StringIO()
+    golden = io.StringIO(output.getvalue())
+    assert replay.run(_corpus(OPEN_SKILL, {'warmup': True}), lambda_handler, workers=2,
+                      golden=golden, report=report) == 0
+    assert '0 of 2 responses differ from golden' in report.getvalue()
+
+
+def test_run_reports_diffs_and_errors(api):
+    golden = io.StringIO(json.dumps({'index': 0, 'response': {'warmup': False}}) + '\n')
+    report = io.StringIO()
+    assert replay.run(_corpus({'warmup': True}, FOREIGN), lambda_handler, golden=golden, report=report) == 1
+    text = report.getvalue()
+    assert '-    "warmup": false' in text
+    assert '+    "warmup": true' in text
+    assert 'event 1 failed: InvalidApplicationId' in text
+    assert '2 of 2 responses differ from golden' in text
+
+
+def test_bad_corpus_line():
+    with pytest.raises(ValueError) as exc_info:
+        list(replay.read_jsonl(io.StringIO('{}\n{nope\n')))
+    assert 'line 2' in str(exc_info.value)
+
+
+def test_parse_now():
+    assert replay.parse_now('2017-09-01T19:00:00Z') == datetime(2017, 9, 1, 19, tzinfo=env.UTC)
+    with pytest.raises(ValueError):
+        replay.parse_now('2017-09-01T19:00:00')
+
+
+def test_main_replay(api, tmp_path, capsys):
+    corpus = tmp_path / 'corpus.jsonl'
+    corpus.write_text(json.dumps(OPEN_SKILL) + '\n')
+    out = tmp_path / 'out.jsonl'
+    with pytest.raises(SystemExit) as exc_info:
+        _main(['--replay', str(corpus), '--output', str(out), '--now', '2017-09-01T19:00:00Z'])
+    assert exc_info.value.code == 0
+    with pytest.raises(SystemExit) as exc_info:
+        _main(['--replay', str(corpus), '--golden', str(out)])
+    assert exc_info.value.code == 0
+    assert '0 of 1 responses differ' in capsys.readouterr().err
+
+
+def test_main_replay_keeps_golden(tmp_path):
+    corpus = tmp_path / 'corpus.jsonl'
+    corpus.write_text(json.dumps({'warmup': True}) + '\n')
+    out = tmp_path / 'out.jsonl'
+    out.write_text('previous\n')
+    with pytest.raises(FileNotFoundError):
+        _main(['--replay', str(corpus), '--output', str(out), '--golden', str(tmp_path / 'missing.jsonl')])
+    assert out.read_text() == 'previous\n'
+    with pytest.raises(SystemExit) as exc_info:
+        _main(['--replay', str(corpus), '--output', str(out), '--golden', str(tmp_path / '.' / 'out.jsonl')])
+    assert exc_info.value.code == 2
+    assert out.read_text() == 'previous\n'
@@ -0,0 +1,208 @@
+from _ebcf_alexa import incoming_types, server, wods, env
+from bench.standin import StandinAPI
+from ebcf_alexa import lambda_handler
+from datetime import datetime
+from unittest.mock import patch
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+import json
+import socket
+import threading
+import time
+import pytest
+
+from events import OPEN_SKILL
+
+
+def start(handler, **kwargs):
+    srv = server.SkillServer(('127.0.0.1', 0), handler, **kwargs)
+    threading.Thread(target=srv.serve_forever, args=(0.05,), daemon=True).start()
+    return srv
+
+
+def url(srv, path='/'):
+    return 'http://%s:%d%s' % (srv.server_address[0], srv.server_address[1], path)
+
+
+def post(srv, body: dict):
+    req = Request(url(srv), data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'})
+    with urlopen(req, timeout=5) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def echo_server():
+    srv = start(lambda event, context: {'echo': event, 'remaining': context.get_remaining_time_in_millis()})
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_health(echo_server):
+    with urlopen(url(echo_server, '/health'), timeout=5) as f:
+        assert json.load(f) == {'status': 'ok'}
+
+
+def test_post_and_metrics(echo_server):
+    resp = post(echo_server, {'hello': 'world'})
+    assert resp['echo'] == {'hello': 'world'}
+    assert 0 < resp['remaining'] <= server.DEFAULT_DEADLINE_MS
+    with urlopen(url(echo_server, '/metrics'), timeout=5) as f:
+        metrics = json.load(f)
+    assert metrics['server']['requests'] == 1
+    assert metrics['server']['errors'] == 0
+    assert 'api_calls' in metrics['wods']
+
+
+def test_bad_requests(echo_server):
+    with pytest.raises(HTTPError) as exc_info:
+        urlopen(Request(url(echo_server), data=b'not json'), timeout=5)
+    assert exc_info.value.code == 400
+    with pytest.raises(HTTPError) as exc_info:
+        urlopen(url(echo_server, '/nope'), timeout=5)
+    assert exc_info.value.code == 404
+
+
+def _raw_request(srv, data: bytes) -> bytes:
+    with socket.create_connection(srv.server_address[:2], timeout=5) as sock:
+        sock.sendall(data)
+        response = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return response
+            response += chunk
+
+
+def test_bad_content_length(echo_server):
+    response = _raw_request(echo_server, b'POST / HTTP/1.0\r\nContent-Length: lots\r\n\r\n{}')
+    assert response.startswith(b'HTTP/1.0 400 ')
+    assert b'bad content length' in response
+
+
+def test_stalled_body_times_out():
+    srv = start(lambda event, context: {}, workers=1, queue=0, deadline_ms=200)
+    try:
+        response = _raw_request(srv, b'POST / HTTP/1.0\r\nContent-Length: 10\r\n\r\n{')
+        assert response.startswith(b'HTTP/1.0 408 ')
+        assert post(srv, {}) == {}  # the worker is free again
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_handler_errors():
+    def handler(event, context):
+        if event.get('foreign'):
+            raise incoming_types.InvalidApplicationId('Invalid Application ID: x')
+        if event.get('upstream'):
+            raise wods.APIParseError('no data')  # a ValueError, but not the caller's
+        raise RuntimeError('boom')
+    srv = start(handler)
+    try:
+        for body, status in (({'foreign': True}, 400), ({'upstream': True}, 500), ({}, 500)):
+            with pytest.raises(HTTPError) as exc_info:
+                post(srv, body)
+            assert exc_info.value.code == status
+        assert srv.stats.dict()['errors'] == 3
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+@pytest.mark.parametrize('body', [
+    {'refresh': True, 'dates': ['2017-09-07']},
+    {'action': 'refresh'},
+    {'source': 'aws.events', 'detail': {}},
+    {'warmup': True},
+])
+def test_control_events_refused(body):
+    handled = []
+    srv = start(lambda event, context: handled.append(event) or {})
+    try:
+        with pytest.raises(HTTPError) as exc_info:
+            post(srv, body)
+        assert exc_info.value.code == 403
+        assert not handled
+    finally:
+        srv.shutdown()
+        srv.server_close()
+    srv = start(lambda event, context: {'handled': event}, control_events=True)
+    try:
+        assert post(srv, body) == {'handled': body}
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_backpressure():
+    entered, release = threading.Event(), threading.Event()
+
+    def blocking_handler(event, context):
+        entered.set()
+        release.wait(5)
+        return {}
+    srv = start(blocking_handler, workers=1, queue=0)
+    try:
+        first = threading.Thread(target=post, args=(srv, {}))
+        first.start()
+        assert entered.wait(5)
+        with pytest.raises(HTTPError) as exc_info:
+            post(srv, {})
+        assert exc_info.value.code == 503
+        with urlopen(url(srv, '/health'), timeout=5) as f:  # busy, not dead
+            assert json.load(f) == {'status': 'ok'}
+        release.set()
+        first.join(5)
+        assert srv.stats.dict()['rejected'] == 1
+        assert post(srv, {}) == {}
+    finally:
+        release.set()
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_slow_clients_do_not_stall_accepting():
+    entered, release = threading.Event(), threading.Event()
+
+    def blocking_handler(event, context):
+        entered.set()
+        release.wait(5)
+        return {}
+    srv = start(blocking_handler, workers=1, queue=0)
+    silent = []
+    try:
+        first = threading.Thread(target=post, args=(srv, {}))
+        first.start()
+        assert entered.wait(5)
+        # connect and never send anything
+        for _ in range(50):
+            silent.append(socket.create_connection(srv.server_address, timeout=5))
+        start_time = time.monotonic()
+        with urlopen(url(srv, '/health'), timeout=5) as f:
+            assert json.load(f) == {'status': 'ok'}
+        assert time.monotonic() - start_time < server.REJECT_READ_SECONDS  # not queued behind them
+        for s in silent:  # who then get the 503 anyway
+            assert s.recv(100).startswith(b'HTTP/1.0 503 ')
+        assert srv.stats.dict()['rejected'] == 50
+    finally:
+        release.set()
+        for s in silent:
+            s.close()
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_lambda_handler_against_standin_api():
+    with StandinAPI() as api, patch.object(wods, 'URL', api.url), \
+            patch.object(env, 'now', return_value=datetime(2017, 9, 1, 19, tzinfo=env.UTC)):
+        srv = start(lambda_handler)
+        try:
+            resp = post(srv, OPEN_SKILL)
+            assert resp['response']['outputSpeech']['ssml'].startswith(
+                '<speak><p>The workout for today, Friday September 1, 2017</p>')
+            post(srv, OPEN_SKILL)
+        finally:
+            srv.shutdown()
+            srv.server_close()
+        assert api.requests == 1  # second request came from the warm cache
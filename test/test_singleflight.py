@@ -0,0 +1,66 @@
+from _ebcf_alexa.singleflight import SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import pytest
+
+
+def _herd(sf: SingleFlight, key, func, n: int):
+    """Start n callers for the same key and return their futures once they
+    are all either running func or waiting on it."""
+    pool = ThreadPoolExecutor(n)
+    futures = [pool.submit(sf.do, key, func) for _ in range(n)]
+    pool.shutdown(wait=False)
+    return futures
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def test_concurrent_callers_share_one_call():
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return {'data': []}
+
+    sf = SingleFlight()
+    futures = _herd(sf, 'k', slow, 8)
+    _wait_for(lambda: sf.coalesced == 7)
+    release.set()
+    results = [f.result(5) for f in futures]
+    assert len(calls) == 1
+    assert all(r[0] is results[0][0] for r in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert sf.stats() == {'calls': 1, 'coalesced': 7}
+    assert sf.in_flight() == 0
+
+
+def test_waiters_get_the_exception():
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise IOError('upstream down')
+
+    sf = SingleFlight()
+    futures = _herd(sf, 'k', fail, 3)
+    _wait_for(lambda: sf.coalesced == 2)
+    release.set()
+    for f in futures:
+        with pytest.raises(IOError):
+            f.result(5)
+    assert sf.in_flight() == 0
+
+
+def test_sequential_calls_are_not_coalesced():
+    sf = SingleFlight()
+    assert sf.do('k', lambda: 1) == (1, False)
+    assert sf.do('k', lambda: 2) == (2, False)
+    assert sf.stats() == {'calls': 2, 'coalesced': 0}
@@ -0,0 +1,55 @@
+from _ebcf_alexa.slot_index import SlotIndex, edit_variants
+import pytest
+
+
+@pytest.fixture(scope='module')
+def index():
+    return SlotIndex([
+        ('workout', 'FULL'),
+        ('wod', 'FULL'),
+        ('strength', 'STRENGTH'),
+        ('stretch', 'MOBILITY'),
+        ('cardio', 'CONDITIONING'),
+    ])
+
+
+@pytest.mark.parametrize('text,expected', [
+    ('workout', 'FULL'),
+    ('wod', 'FULL'),
+    ("wod's", 'FULL'),
+    ('strength section', 'STRENGTH'),
+    ('cardio', 'CONDITIONING'),
+    ('strenght', 'STRENGTH'),      # transposition
+    ('strengh', 'STRENGTH'),       # deletion
+    ('cardiyo', 'CONDITIONING'),   # insertion
+    ('workous', 'FULL'),           # substitution
+    ('wad', None),                 # too short to get variants
+    ('strike', None),
+    ('', None),
+])
+def test_lookup(index, text, expected):
+    assert index.lookup(text) == expected
+
+
+def test_ambiguous_variants_dropped(index):
+    # 'streth' is one deletion from 'stretch' only
+    assert index.lookup('streth') == 'MOBILITY'
+    both = set(edit_variants('strength')) & set(edit_variants('stretch'))
+    for variant in both:
+        assert index.lookup(variant) in (None, 'STRENGTH', 'MOBILITY')
+        assert index._variants.get(variant) is None
+
+
+def test_earlier_entry_wins():
+    index = SlotIndex([('to', 'A'), ('today', 'B')])
+    assert index.lookup('today') == 'A'
+
+
+def test_known_words_beat_variants():
+    index = SlotIndex([('today', 'TODAY'), ('todax', 'OTHER')])
+    assert index.lookup('todax') == 'OTHER'
+
+
+def test_edit_variants():
+    variants = set(edit_variants('ab', alphabet='c'))
+    assert variants == {'b', 'a', 'ba', 'cb', 'ac', 'cab', 'acb', 'abc'}
@@ -0,0 +1,53 @@
+from _ebcf_alexa import wods
+from bench import ssml_diff
+
+
+class Sloppy(ssml_diff.CurrentRenderer):
+    """Forgets that ``&`` isn't allowed in SSML."""
+    name = 'sloppy'
+
+    def announcement_ssml(self, wod: wods.WOD) -> str:
+        return wod.announcement_ssml().replace('and', '&')
+
+
+class Crashes(ssml_diff.CurrentRenderer):
+    name = 'crashes'
+
+    def strength_ssml(self, wod: wods.WOD) -> str:
+        if len(wod.strength_lines) > 2:
+            raise IndexError('too many lines')
+        return wod.strength_ssml()
+
+
+def test_current_tree_matches_reference():
+    result = ssml_diff.run(cases=300, seed=1)
+    assert result.divergence is None, str(result.divergence)
+    assert result.cases == 300
+    assert set(result.speedups()) == set(ssml_diff.PARTS)
+
+
+def test_reports_first_divergence_minimized():
+    result = ssml_diff.run(Sloppy(), cases=300)
+    divergence = result.divergence
+    assert divergence.part == 'announcement_ssml'
+    assert divergence.attributes['conditioning'] == ''
+    assert divergence.attributes['strength'] in ('&', 'and')  # nothing left that doesn't matter
+    assert divergence.got != divergence.expected
+    assert 'DIVERGENCE in announcement_ssml' in str(divergence)
+
+
+def test_exceptions_are_divergences():
+    divergence = ssml_diff.run(Crashes(), cases=300).divergence
+    assert isinstance(divergence.got, IndexError)
+    assert divergence.attributes['strength'].count('\n') == 2
+
+
+def test_shrink_text():
+    assert ssml_diff._shrink_text('a\nbb 3x5 cc\nd', lambda text: '3x5' in text) == '3x5'
+    assert ssml_diff._shrink_text('abc', lambda text: False) == 'abc'
+
+
+def test_main(capsys):
+    assert ssml_diff.main(['--cases', '20', '--parts', 'strength_ssml,validate']) == 0
+    assert 'strength_ssml' in capsys.readouterr().out
+    assert ssml_diff.main(['--cases', '300', '--candidate', 'test_ssml_diff:Sloppy']) == 1
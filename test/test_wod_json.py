@@ -0,0 +1,57 @@
+from _ebcf_alexa import wod_json, wods
+from bench.standin import StandinAPI, document, wod_attributes
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+import io
+import json
+import pytest
+
+
+def _document(days: int = 60) -> dict:
+    return document([wod_attributes(date(2017, 7, 1) + timedelta(days=i)) for i in range(days)])
+
+
+def _expected(doc: dict) -> list:
+    return [{k: v for k, v in d['attributes'].items() if k in wod_json.WOD_FIELDS} for d in doc['data']]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, wod_json.DEFAULT_CHUNK_SIZE])
+def test_matches_json_load(chunk_size):
+    doc = _document()
+    raw = json.dumps(doc, indent=1).encode('utf-8')
+    assert list(wod_json.iter_wod_attributes(io.BytesIO(raw), chunk_size)) == _expected(doc)
+
+
+def test_text_stream():
+    doc = _document(3)
+    assert wod_json.load_wod_attributes(io.StringIO(json.dumps(doc)), 5) == {
+        'data': [{'attributes': a} for a in _expected(doc)]}
+
+
+def test_tricky_strings():
+    attrs = dict(wod_attributes(date(2017, 7, 3)),
+                 strength='Say "attributes": {"x": 1} \\" and café — done',
+                 conditioning='ends with a backslash \\')
+    doc = document([attrs, wod_attributes(date(2017, 7, 4))])
+    raw = json.dumps(doc, ensure_ascii=False).encode('utf-8')
+    for chunk_size in (1, 3, 13):
+        assert list(wod_json.iter_wod_attributes(io.BytesIO(raw), chunk_size)) == _expected(doc)
+
+
+def test_no_data():
+    assert wod_json.load_wod_attributes(io.BytesIO(b'{"meta": {}, "data": []}')) == {'data': []}
+    assert wod_json.load_wod_attributes(io.BytesIO(b'')) == {'data': []}
+
+
+def test_truncated():
+    raw = json.dumps(_document(2)).encode('utf-8')
+    with pytest.raises(ValueError):
+        wod_json.load_wod_attributes(io.BytesIO(raw[:raw.rindex(b'"strength"')]), 16)
+
+
+def test_range_query_uses_selective_parse():
+    with StandinAPI() as api, patch.object(wods, 'URL', api.url):
+        got = wods.get_wods_by_range(datetime(2017, 7, 1, tzinfo=wods.env.UTC),
+                                     datetime(2017, 7, 31, tzinfo=wods.env.UTC))
+    assert [w.date for w in got] == [date(2017, 7, d) for d in range(1, 31)]
+    assert got[2].pprint() == wods.WOD(wod_attributes(date(2017, 7, 3))).pprint()
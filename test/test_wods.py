@@ -1,10 +1,11 @@
 from _ebcf_alexa import env
 from _ebcf_alexa import wods
 from _ebcf_alexa.speechlet import SSML as assert_valid_ssml  # not really an assert, but this does do validation
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from textwrap import dedent
 from unittest.mock import patch, Mock
 import io
+import time
 import pytest
 import urllib.parse as parse
 from urllib.error import HTTPError
@@ -51,8 +52,8 @@ BROKEN_WOD_JSON = r"""
 """.strip()
 
 
-def mock_urlopen(urlstr: str):
-    parsed = parse.urlparse(urlstr)
+def mock_urlopen(request):
+    parsed = parse.urlparse(request.full_url)
     query = parse.parse_qs(parsed.query)
     query_date = query['filter[simple][date]'][0]
     # for some reason, parse_qs puts values inside lists.
@@ -93,7 +94,7 @@ def test_get_wod_e2e(fake_urlopen):
     """This exercises the whole code path for get_wod, including parsing the json
     into an object."""
     wod = wods.get_wod(date(2017, 7, 3))
-    urlstr = fake_urlopen.call_args[0][0]
+    urlstr = fake_urlopen.call_args[0][0].full_url
     parsedurl = parse.urlparse(urlstr)
     query = parse.parse_qs(parsedurl.query)
     # parse_qs puts values inside lists, so its the first item.
@@ -246,3 +247,366 @@ class TestSSMLTranslation(object):
         assert ' x 3 ' not in output
         assert output.count('<break strength="strong"/> + ') == 5
         assert_valid_ssml(output)
+
+
+def test_get_wod_is_cached(fake_urlopen):
+    first = wods.get_wod(date(2017, 7, 3))
+    assert wods.get_wod(date(2017, 7, 3)) is first
+    assert fake_urlopen.call_count == 1
+
+
+def test_get_wod_cache_expires(fake_urlopen):
+    wods.get_wod(date(2017, 7, 3))
+    with patch.object(wods.time, 'time', return_value=wods.time.time() + wods.CACHE_TTL_SECONDS + 1):
+        wods.get_wod(date(2017, 7, 3))
+    assert fake_urlopen.call_count == 2
+
+
+def test_decoded_wods_are_bounded_by_bytes(fake_urlopen):
+    wod = wods.get_wod(date(2017, 7, 3))
+    assert wods._DECODED.bytes > 2 * (len(wod.strength_raw) + len(wod.conditioning_raw))
+    entry_bytes = wods._DecodedEntries._size('wod:2017-07-01', b'raw', wod)
+    decoded = wods._DecodedEntries(int(entry_bytes * 2.5))
+    for day in range(1, 6):
+        decoded.put('wod:2017-07-0%d' % day, b'raw', 0.0, wod)
+    assert decoded.stats() == {'entries': 2, 'bytes': 2 * entry_bytes, 'max_bytes': decoded.max_bytes,
+                               'evictions': 3}
+    assert decoded.get('wod:2017-07-05', b'raw') == (0.0, wod)
+    assert decoded.get('wod:2017-07-05', b'changed') is None
+    assert decoded.get('wod:2017-07-01', b'raw') is None
+
+
+def test_user_call_does_not_share_a_rate_limited_background_flight(fake_urlopen):
+    import threading
+    checking, release = threading.Event(), threading.Event()
+
+    class SlowEmptyBucket(object):
+        def try_acquire(self):
+            checking.set()
+            release.wait(5)
+            return False
+    params = {'filter': {'simple': {'date': '2017-07-03T00:00:00.000Z', 'enabled': True}}}
+    errors = []
+
+    def background():
+        try:
+            wods._call_api(params, background=True)
+        except wods.RateLimited as e:
+            errors.append(e)
+    with patch.object(wods, 'BACKGROUND_BUCKET', SlowEmptyBucket()):
+        leader = threading.Thread(target=background)
+        leader.start()
+        assert checking.wait(5)
+        try:
+            assert wods._call_api(params)['data']  # on the user budget, while the background call is in flight
+        finally:
+            release.set()
+            leader.join(5)
+    assert len(errors) == 1
+    assert fake_urlopen.call_count == 1
+
+
+def test_missing_wod_is_negatively_cached(fake_urlopen):
+    assert wods.get_wod(date(2018, 1, 13)) is None
+    assert wods.get_wod(date(2018, 1, 13)) is None
+    assert fake_urlopen.call_count == 1
+
+
+def test_concurrent_api_calls_are_coalesced(fake_urlopen):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    release = threading.Event()
+
+    def slow_urlopen(url):
+        release.wait(5)
+        return mock_urlopen(url)
+    fake_urlopen.side_effect = slow_urlopen
+    before = wods.stats()
+    params = {'filter': {'simple': {'date': '2017-07-03T00:00:00.000Z', 'enabled': True}}}
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(wods._call_api, params) for _ in range(4)]
+        deadline = time.monotonic() + 5
+        while wods.stats()['api_calls_coalesced'] - before['api_calls_coalesced'] < 3:
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+        release.set()
+        results = [f.result(5) for f in futures]
+    assert fake_urlopen.call_count == 1
+    assert all(r['data'][0]['id'] == '595546898a91720004306145' for r in results)
+
+
+class TestRateLimiting(object):
+    @pytest.fixture
+    def empty_buckets(self):
+        with patch.object(wods, 'USER_BUCKET', wods.TokenBucket(1e-9, 0)), \
+                patch.object(wods, 'BACKGROUND_BUCKET', wods.TokenBucket(1e-9, 0)):
+            yield
+
+    def test_user_request_over_budget_without_cache(self, fake_urlopen, empty_buckets):
+        with pytest.raises(wods.RateLimited):
+            wods.get_wod(date(2017, 7, 3))
+        assert not fake_urlopen.called
+
+    def test_user_request_over_budget_serves_stale(self, fake_urlopen):
+        wod = wods.get_wod(date(2017, 7, 3))
+        later = wods.time.time() + wods.CACHE_TTL_SECONDS + 1
+        with patch.object(wods, 'USER_BUCKET', wods.TokenBucket(1e-9, 0)), \
+                patch.object(wods.time, 'time', return_value=later):
+            assert wods.get_wod(date(2017, 7, 3)) is wod
+        assert fake_urlopen.call_count == 1
+        assert wods.stats()['stale_served'] >= 1
+
+    def test_background_has_its_own_budget(self, fake_urlopen):
+        with patch.object(wods, 'BACKGROUND_BUCKET', wods.TokenBucket(1e-9, 0)):
+            wods.prime_cache([date(2017, 7, 3)])  # does not raise
+            assert not fake_urlopen.called
+            assert wods.get_wod(date(2017, 7, 3)) is not None
+        assert fake_urlopen.call_count == 1
+
+    def test_busy_response(self, fake_urlopen, empty_buckets):
+        from _ebcf_alexa import interaction_model
+        response = interaction_model.wod_query()
+        assert 'trouble reaching' in response.output_speech.text
+
+
+class TestConditionalGet(object):
+    @pytest.fixture
+    def api(self):
+        from bench.standin import StandinAPI
+        with StandinAPI() as api, patch.object(wods, 'URL', api.url):
+            yield api
+
+    def test_gzip_and_revalidation(self, api):
+        before = wods.stats()['transfer']
+        wod = wods.get_wod(date(2017, 7, 3))
+        after_first = wods.stats()['transfer']
+        assert after_first['gzip_responses'] == before['gzip_responses'] + 1
+        assert 0 < after_first['bytes_received'] - before['bytes_received'] < 1000
+
+        with patch.object(wods.time, 'time', return_value=wods.time.time() + wods.CACHE_TTL_SECONDS + 1):
+            again = wods.get_wod(date(2017, 7, 3))
+        after = wods.stats()['transfer']
+        assert api.requests == 2
+        assert api.not_modified == 1
+        assert after['not_modified'] == before['not_modified'] + 1
+        assert after['bytes_received'] == after_first['bytes_received']
+        assert again.full_ssml() == wod.full_ssml()
+
+    def test_changed_content_is_refetched(self, api):
+        wods.get_wod(date(2017, 7, 3))
+        api.overrides[date(2017, 7, 3)] = dict(api.wod(date(2017, 7, 3)), conditioning='21-15-9\nBurpees')
+        before = wods.stats()['transfer']
+        with patch.object(wods.time, 'time', return_value=wods.time.time() + wods.CACHE_TTL_SECONDS + 1):
+            wod = wods.get_wod(date(2017, 7, 3))
+        assert wod.conditioning_lines == ['21-15-9', 'Burpees']
+        assert wods.stats()['transfer']['modified'] == before['modified'] + 1
+
+    def test_sends_validators(self, fake_urlopen):
+        def urlopen_with_etag(request):
+            response = mock_urlopen(request)
+            response.headers = {'ETag': '"abc"', 'Last-Modified': 'Mon, 03 Jul 2017 04:00:00 GMT'}
+            return response
+        fake_urlopen.side_effect = urlopen_with_etag
+        params = {'filter': {'simple': {'date': '2017-07-03T00:00:00.000Z', 'enabled': True}}}
+        first = wods._call_api(params)
+
+        def not_modified(request):
+            assert request.get_header('If-none-match') == '"abc"'
+            assert request.get_header('If-modified-since') == 'Mon, 03 Jul 2017 04:00:00 GMT'
+            assert request.get_header('Accept-encoding') == 'gzip'
+            raise HTTPError(request.full_url, 304, 'Not Modified', HTTPMessage(), fp=None)
+        fake_urlopen.side_effect = not_modified
+        assert wods._call_api(params) == first
+        assert fake_urlopen.call_count == 2
+
+    def test_evicted_response_is_refetched(self, api):
+        wods.get_wod(date(2017, 7, 3))
+        _, _, key = next(iter(wods._VALIDATORS.values()))
+        assert wods.CACHE.get(key) is not None  # the response is in the cache, not the validators
+        wods.CACHE.delete(key)
+        with patch.object(wods.time, 'time', return_value=wods.time.time() + wods.CACHE_TTL_SECONDS + 1):
+            wod = wods.get_wod(date(2017, 7, 3))
+        assert wod.conditioning_lines
+        assert api.requests == 3  # 304, then the whole response again
+        assert api.not_modified == 1
+
+
+def _strptime_reference(datestr):
+    try:
+        return env.UTC.localize(datetime.strptime(datestr, wods.EBCF_API_TSTAMP_FMT)) if datestr else None
+    except ValueError:
+        return None
+
+
+@pytest.mark.parametrize('datestr', [
+    '2017-07-03T00:00:00.000Z', '2017-07-03T04:00:00.000Z', '2016-02-29T23:59:59.000Z',
+    '2017-7-3T4:00:00.000Z',  # strptime allows unpadded fields; still does
+    '2017-02-29T00:00:00.000Z', '2017-13-01T00:00:00.000Z', '2017-07-03T24:00:00.000Z',
+    '0000-07-03T00:00:00.000Z', '2017-07-03T00:00:00.123Z', '2017-07-03T00:00:00Z',
+    '2017-07-03 00:00:00.000Z', '2017-07-0aT00:00:00.000Z', '+017-07-03T00:00:00.000Z',
+    '2017-07-03T00:00:00.000Z ', '', None, 'garbage',
+])
+def test_safe_datetime_matches_strptime(datestr):
+    assert wods._safe_datetime(datestr) == _strptime_reference(datestr)
+
+
+def test_safe_datetime_is_utc_and_memoises_midnight():
+    first = wods._safe_datetime('2017-07-03T00:00:00.000Z')
+    assert first.tzinfo is env.UTC
+    assert wods._safe_datetime('2017-07-03T00:00:00.000Z') is first
+    assert wods._safe_datetime(12345) is None
+
+
+def test_tts_lines_matches_line_by_line():
+    from bench.standin import wod_attributes
+    from datetime import timedelta
+    lines = []
+    for i in range(40):
+        wod = wods.WOD(wod_attributes(date(2017, 7, 1) + timedelta(days=i)))
+        lines += wod.announcement_lines + wod.strength_lines + wod.conditioning_lines
+    lines += ['x3', '3x5', 'Odd: (Strict T2B + Strict T2B Left) x 3', '95#/65# & 24"/20"', '10 Sec hold ', '']
+    assert wods.tts_lines(lines) == [wods._massage_for_tts(l) for l in lines]
+    assert wods.tts_lines(['a\x1e3x5']) == [wods._massage_for_tts('a\x1e3x5')]
+    assert wods.tts_lines([]) == []
+
+
+class TestAdversarialTTS(object):
+    """Long and pathological lines, see bench/tts_regex.py."""
+
+    @staticmethod
+    def _unguard(rx):
+        import re
+        return re.compile(rx.pattern.replace('(?<!\\d)', ''))
+
+    @classmethod
+    def _unguarded(cls, text: str) -> str:
+        """`wods._massage_for_tts` with the digit-run regexes as they were, quadratic on long runs."""
+        text = cls._unguard(wods._SETS_RX).sub(r'\1 sets of \2', text)
+        text = cls._unguard(wods._RX_RX).sub(r'<prosody rate="fast">\1 male, \2 female</prosody>', text)
+        for rx, replacement in wods._ALIAS_RXS:
+            text = cls._unguard(rx).sub(replacement, text)
+        return text
+
+    @pytest.mark.parametrize('name', ['digits', 'sets storm', 'Rx near misses', 'secs', 'unicode', 'realistic'])
+    def test_guards_change_nothing(self, name):
+        from bench.tts_regex import ADVERSARIAL
+        text = ADVERSARIAL[name](300) + ' 12345x678 1234"/99\' 95#/65# 120 sec x 3 x12'
+        assert wods._massage_for_tts(text) == self._unguarded(text)
+
+    def test_bounded_steps(self):
+        from bench import tts_regex
+        assert tts_regex.step_failures() == []
+
+    def test_steps_catch_quadratic(self):
+        from bench import tts_regex
+        unguarded = [(rule, self._unguard(rx)) for rule, rx in tts_regex.patterns()]
+        failed = tts_regex.step_failures(unguarded)
+        assert any(f.startswith('_fix_sets on digits:') for f in failed)
+        assert any(f.startswith('_fix_rx on') for f in failed)
+
+    def test_steps_count_repeats_after_a_prefix(self):
+        import re
+        from bench import tts_regex
+        times = dict(tts_regex.patterns())['alias ( ?)\\bx ?(\\b\\d+\\b)']
+        assert tts_regex.scan_steps(times, tts_regex.ADVERSARIAL['x before long number'](500)) > 0
+        assert tts_regex.step_failures([('unbounded', re.compile(r'( ?)(\d+)x'))])
+
+    @pytest.mark.perf
+    def test_linear(self):
+        from bench import tts_regex
+        measured = []
+        for name, make in tts_regex.ADVERSARIAL.items():
+            times, exponent = tts_regex.growth(wods._massage_for_tts, make, (1000, 8000))
+            measured.append(tts_regex.Growth('_massage_for_tts', name, times, exponent))
+        assert tts_regex.failures(measured, tts_regex.line_times()) == []
+
+    @pytest.mark.perf
+    def test_catches_quadratic(self):
+        from bench import tts_regex
+        times, exponent = tts_regex.growth(self._unguarded, tts_regex.ADVERSARIAL['digits'], (500, 2000))
+        assert exponent > tts_regex.MAX_EXPONENT
+
+
+def test_get_wods_serves_stale_when_rate_limited(fake_urlopen):
+    wod = wods.get_wod(date(2017, 7, 3))
+    later = wods.time.time() + wods.CACHE_TTL_SECONDS + 1
+    with patch.object(wods, 'USER_BUCKET', wods.TokenBucket(1e-9, 0)), \
+            patch.object(wods.time, 'time', return_value=later):
+        got = wods.get_wods([date(2017, 7, 3), date(2017, 7, 4)])
+    assert got == {date(2017, 7, 3): wod, date(2017, 7, 4): None}
+
+
+def test_get_wods_keeps_wods_the_range_missed(fake_urlopen):
+    wod = wods.get_wod(date(2017, 7, 3))
+    with patch.object(wods, 'get_wods_by_range', return_value=[]):
+        got = wods.get_wods([date(2017, 7, 3), date(2017, 7, 4)])
+        assert got == {date(2017, 7, 3): wod, date(2017, 7, 4): None}
+        assert wods.get_wod(date(2017, 7, 3)) is wod  # fresh, not overwritten
+        calls = fake_urlopen.call_count
+        later = wods.time.time() + wods.CACHE_TTL_SECONDS + 1
+        with patch.object(wods.time, 'time', return_value=later):
+            got = wods.get_wods([date(2017, 7, 3), date(2017, 7, 4)])
+    assert got[date(2017, 7, 3)].strength_raw == wod.strength_raw  # fetched on its own
+    assert fake_urlopen.call_count == calls + 1
+
+
+def _published(day: date, publish: str) -> wods.WOD:
+    return wods.WOD({'date': day.strftime('%Y-%m-%d') + 'T00:00:00.000Z', 'publishDate': publish,
+                     'strength': 'Deadlift', 'conditioning': 'Row'})
+
+
+class TestPublishTimes(object):
+    @pytest.fixture
+    def times(self):
+        times = wods.PublishTimes(per_weekday=4)
+        # Thursdays go up around 9pm Wednesday (PDT), Saturdays Saturday morning
+        for day, publish in ((date(2017, 8, 10), '2017-08-10T04:05:00.000Z'),
+                             (date(2017, 8, 17), '2017-08-17T03:50:00.000Z'),
+                             (date(2017, 8, 24), '2017-08-24T04:20:00.000Z'),
+                             (date(2017, 8, 12), '2017-08-12T15:00:00.000Z')):
+            times.observe(_published(day, publish))
+        return times
+
+    def test_earliest_per_weekday(self, times):
+        thursday = date(2017, 8, 31)
+        assert times.earliest(thursday) == datetime(2017, 8, 31, 3, 40, tzinfo=env.UTC)
+        assert times.earliest(thursday, quantile=1.0) == datetime(2017, 8, 31, 4, 10, tzinfo=env.UTC)
+        # one Saturday isn't enough to go on: every weekday's offsets
+        assert times.earliest(date(2017, 9, 2)) == datetime(2017, 9, 2, 3, 40, tzinfo=env.UTC)
+
+    def test_follows_local_time_across_dst(self, times):
+        # 8:50pm the evening before in PST is an hour later in UTC
+        assert times.earliest(date(2017, 11, 30)) == datetime(2017, 11, 30, 4, 40, tzinfo=env.UTC)
+
+    def test_bounded(self, times):
+        for week in range(1, 6):
+            day = date(2017, 8, 24) + timedelta(weeks=week)
+            times.observe(_published(day, day.strftime('%Y-%m-%d') + 'T06:00:00.000Z'))
+        assert times.earliest(date(2017, 10, 5), quantile=0.0) == datetime(2017, 10, 5, 5, 50, tzinfo=env.UTC)
+        assert times.stats() == {'samples': 5}
+
+    def test_not_enough_seen(self):
+        times = wods.PublishTimes()
+        assert times.earliest(date(2017, 8, 31)) is None
+        times.observe(_published(date(2017, 8, 31), None))
+        assert times.seconds_until(date(2017, 8, 31)) == 0.0
+
+    def test_learned_from_fetched_wods(self, fake_urlopen):
+        wods.get_wod(date(2017, 7, 3))
+        assert wods.PUBLISH_TIMES.stats() == {'samples': 1}
+
+    def test_negative_cache_lasts_until_expected(self, times, fake_urlopen):
+        with patch.object(wods, 'PUBLISH_TIMES', times), \
+                patch.object(env, 'now', return_value=datetime(2018, 1, 11, 20, tzinfo=env.UTC)):
+            # Noon Thursday asking for Friday's, which isn't expected before ~8:40pm: 8h40m, capped
+            assert wods._negative_ttl(date(2018, 1, 12)) == wods.MAX_NEGATIVE_CACHE_TTL_SECONDS
+            env.now.return_value = datetime(2018, 1, 13, 3, tzinfo=env.UTC)
+            assert wods._negative_ttl(date(2018, 1, 13)) == wods.MAX_NEGATIVE_CACHE_TTL_SECONDS  # 100m
+            env.now.return_value = datetime(2018, 1, 13, 4, 20, tzinfo=env.UTC)
+            assert wods._negative_ttl(date(2018, 1, 13)) == pytest.approx(20 * 60)
+            assert wods.get_wod(date(2018, 1, 13)) is None
+            with patch.object(wods.time, 'time', return_value=wods.time.time() + 19 * 60):
+                assert wods.get_wod(date(2018, 1, 13)) is None
+            assert fake_urlopen.call_count == 1
+            env.now.return_value = datetime(2018, 1, 13, 6, tzinfo=env.UTC)
+            assert wods._negative_ttl(date(2018, 1, 13)) == wods.NEGATIVE_CACHE_TTL_SECONDS